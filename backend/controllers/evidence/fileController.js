@@ -82,6 +82,14 @@ const processFileContent = async (fileId) => {
         });
         formData.append('file_id', fileId.toString());
 
+        // Thuộc tính phân quyền để AI service giới hạn phạm vi truy xuất theo chương trình/đơn vị/năm học
+        const evidence = await Evidence.findById(file.evidenceId).select('academicYearId programId organizationId');
+        if (evidence) {
+            if (evidence.programId) formData.append('program_id', evidence.programId.toString());
+            if (evidence.organizationId) formData.append('organization_id', evidence.organizationId.toString());
+            if (evidence.academicYearId) formData.append('academic_year_id', evidence.academicYearId.toString());
+        }
+
         const response = await axios.post(
             `${process.env.AI_SERVICE_URL || 'http://localhost:8000'}/api/process-file`,
             formData,
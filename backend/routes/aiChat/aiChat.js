@@ -4,6 +4,9 @@ const router = express.Router();
 const formData = require('form-data');
 const { Readable } = require('stream');
 const multer = require('multer');
+const { auth } = require('../../middleware/auth');
+const Evidence = require('../../models/Evidence/Evidence');
+const File = require('../../models/Evidence/File');
 
 const AI_SERVICE_URL = process.env.AI_SERVICE_URL || 'http://localhost:8000/api/ai-chat';
 const AI_BASE_URL = AI_SERVICE_URL.replace('/api/ai-chat', '');
@@ -35,9 +38,55 @@ const proxyRequest = (path, method = 'get') => async (req, res) => {
     }
 };
 
-router.post('/ai-chat', async (req, res) => {
+// Hỏi đáp kiến thức hệ thống không cần đăng nhập; hỏi đáp trên file minh chứng thì cần
+const optionalAuth = (req, res, next) => {
+    if (!req.header('Authorization') && !req.query.token) {
+        return next();
+    }
+    return auth(req, res, next);
+};
+
+const UNRESTRICTED_ROLES = ['admin', 'manager'];
+
+// Phạm vi truy xuất file được tính từ quyền của người dùng, không dùng scope do client gửi lên
+const buildChatPayload = async (req) => {
+    const { scope, ...payload } = req.body || {};
+    if (payload.search_type !== 'files') {
+        return { payload };
+    }
+    if (!req.user) {
+        return { status: 401, message: 'Cần đăng nhập để hỏi đáp trên file minh chứng' };
+    }
+    if (UNRESTRICTED_ROLES.includes(req.user.role)) {
+        return { payload };
+    }
+
+    const { programAccess, organizationAccess, academicYearAccess } = req.user;
+    const query = {};
+    if (programAccess?.length) query.programId = { $in: programAccess };
+    if (organizationAccess?.length) query.organizationId = { $in: organizationAccess };
+    if (!query.programId && !query.organizationId) {
+        return { status: 403, message: 'Bạn chưa được phân quyền chương trình hoặc đơn vị nào' };
+    }
+    if (academicYearAccess?.length) query.academicYearId = { $in: academicYearAccess };
+
+    const evidenceIds = await Evidence.find(query).distinct('_id');
+    const fileIds = evidenceIds.length
+        ? await File.find({ evidenceId: { $in: evidenceIds }, type: 'file' }).distinct('_id')
+        : [];
+    if (fileIds.length === 0) {
+        return { status: 403, message: 'Không có file minh chứng nào trong phạm vi được phân quyền' };
+    }
+    return { payload: { ...payload, scope: { file_ids: fileIds.map(String) } } };
+};
+
+router.post('/ai-chat', optionalAuth, async (req, res) => {
     try {
-        const response = await axios.post(AI_SERVICE_URL, req.body);
+        const { payload, status, message } = await buildChatPayload(req);
+        if (!payload) {
+            return res.status(status).json({ success: false, message, reply: message });
+        }
+        const response = await axios.post(AI_SERVICE_URL, payload);
         res.json(response.data);
     } catch (error) {
         console.error('AI Chat Error:', error.message);
@@ -46,6 +95,27 @@ router.post('/ai-chat', async (req, res) => {
     }
 });
 
+router.post('/ai-chat/stream', optionalAuth, async (req, res) => {
+    try {
+        const { payload, status, message } = await buildChatPayload(req);
+        if (!payload) {
+            return res.status(status).json({ success: false, message, reply: message });
+        }
+        const response = await axios.post(`${AI_BASE_URL}/api/ai-chat/stream`, payload, {
+            responseType: 'stream'
+        });
+        res.setHeader('Content-Type', 'text/event-stream');
+        res.setHeader('Cache-Control', 'no-cache');
+        res.setHeader('X-Accel-Buffering', 'no');
+        res.flushHeaders();
+        response.data.pipe(res);
+        req.on('close', () => response.data.destroy());
+    } catch (error) {
+        console.error('AI Chat Stream Error:', error.message);
+        res.status(error.response?.status || 500).json({ reply: 'Lỗi kết nối tới AI service.' });
+    }
+});
+
 router.get('/file-vectors', proxyRequest('/api/file-vectors'));
 
 router.delete('/delete-vector/:vector_id', proxyRequest('/api/delete-vector/:param', 'delete'));
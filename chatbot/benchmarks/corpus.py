@@ -0,0 +1,150 @@
+import random
+from io import BytesIO
+from typing import Dict, List
+
+import docx
+import openpyxl
+import pptx
+
+SIZES = {
+    'small': 20,
+    'medium': 200,
+    'large': 1000,
+}
+
+WORDS = (
+    "minh chứng tiêu chuẩn tiêu chí chương trình đào tạo kiểm định chất lượng báo cáo tự đánh giá "
+    "học viện khoa bộ môn giảng viên sinh viên kế hoạch quyết định công văn hội đồng năm học "
+    "cơ sở vật chất thư viện nghiên cứu khoa học hợp tác quốc tế chuẩn đầu ra đề cương học phần"
+).split()
+
+ASCII_WORDS = (
+    "evidence standard criterion program training quality assurance report self assessment "
+    "faculty department lecturer student plan decision committee academic year facility library "
+    "research cooperation outcome syllabus course"
+).split()
+
+
+def make_paragraphs(count: int, seed: int = 42, ascii_only: bool = False) -> List[str]:
+    rng = random.Random(seed)
+    vocabulary = ASCII_WORDS if ascii_only else WORDS
+    paragraphs = []
+    for i in range(count):
+        sentences = []
+        for _ in range(rng.randint(2, 5)):
+            words = [rng.choice(vocabulary) for _ in range(rng.randint(8, 20))]
+            sentences.append(" ".join(words).capitalize() + ".")
+        paragraphs.append(f"H{i % 9 + 1}.{i % 12 + 1:02d}.{i % 7 + 1:02d} " + " ".join(sentences))
+    return paragraphs
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(paragraphs: List[str], lines_per_page: int = 40) -> bytes:
+    lines = []
+    for paragraph in paragraphs:
+        words = paragraph.split()
+        while words:
+            lines.append(" ".join(words[:12]))
+            words = words[12:]
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_refs = []
+    for page_lines in pages:
+        content = "BT /F1 10 Tf 40 800 Td 14 TL " + " ".join(f"({_pdf_escape(line)}) '" for line in page_lines) + " ET"
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream")
+        content_ref = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_ref} 0 R >>"
+        )
+        page_refs.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(page_refs)}] /Count {len(page_refs)} >>"
+
+    out = BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def make_docx(paragraphs: List[str]) -> bytes:
+    document = docx.Document()
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    table = document.add_table(rows=min(20, len(paragraphs)), cols=3)
+    for row_index, row in enumerate(table.rows):
+        for col_index, cell in enumerate(row.cells):
+            cell.text = paragraphs[row_index].split(".")[0] + f" [{col_index}]"
+    out = BytesIO()
+    document.save(out)
+    return out.getvalue()
+
+
+def make_xlsx(paragraphs: List[str]) -> bytes:
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "Minh chung"
+    sheet.append(["Mã", "Tên minh chứng", "Mô tả", "Năm"])
+    for i, paragraph in enumerate(paragraphs):
+        code, _, rest = paragraph.partition(" ")
+        sheet.append([code, rest[:60], rest, 2020 + i % 6])
+    out = BytesIO()
+    workbook.save(out)
+    return out.getvalue()
+
+
+def make_pptx(paragraphs: List[str], per_slide: int = 5) -> bytes:
+    presentation = pptx.Presentation()
+    layout = presentation.slide_layouts[1]
+    for i in range(0, len(paragraphs), per_slide):
+        slide = presentation.slides.add_slide(layout)
+        slide.shapes.title.text = f"Phần {i // per_slide + 1}"
+        slide.placeholders[1].text = "\n".join(paragraphs[i:i + per_slide])
+    out = BytesIO()
+    presentation.save(out)
+    return out.getvalue()
+
+
+CONTENT_TYPES = {
+    'pdf': 'application/pdf',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+}
+
+
+def build_corpus(sizes: List[str] = None, seed: int = 42) -> List[Dict]:
+    corpus = []
+    for size in sizes or list(SIZES):
+        count = SIZES[size]
+        paragraphs = make_paragraphs(count, seed=seed)
+        builders = {
+            # Font Type1 chuẩn của PDF không hỗ trợ tiếng Việt nên PDF dùng văn bản ASCII
+            'pdf': lambda: make_pdf(make_paragraphs(count, seed=seed, ascii_only=True)),
+            'docx': lambda: make_docx(paragraphs),
+            'xlsx': lambda: make_xlsx(paragraphs),
+            'pptx': lambda: make_pptx(paragraphs),
+        }
+        for ext, build in builders.items():
+            content = build()
+            corpus.append({
+                'name': f"{size}.{ext}",
+                'format': ext,
+                'size': size,
+                'paragraphs': count,
+                'bytes': len(content),
+                'content': content,
+                'content_type': CONTENT_TYPES[ext],
+            })
+    return corpus
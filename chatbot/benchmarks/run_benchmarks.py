@@ -0,0 +1,291 @@
+# Chạy từ thư mục chatbot: python -m benchmarks.run_benchmarks --output bench.json
+# Mặc định dùng AI_PROVIDER=local và kho Chroma tạm nên không cần mạng và không đụng dữ liệu thật.
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+from io import BytesIO
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from model.paths import DATA_PATHS
+
+QUERIES = [
+    "Làm thế nào để đăng nhập?",
+    "Tạo minh chứng mới như thế nào?",
+    "Import minh chứng từ Excel",
+    "Phân quyền người dùng",
+    "Xuất báo cáo minh chứng",
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark các đường xử lý chính của chatbot service")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--sizes", default="small,medium,large")
+    parser.add_argument("--only", default="", help="endpoints,extraction,chunking,chroma")
+    parser.add_argument("--embedding-latency-ms", type=float, default=0)
+    parser.add_argument("--generation-latency-ms", type=float, default=0)
+    parser.add_argument("--provider", default="local")
+    return parser.parse_args()
+
+
+def configure_environment(args):
+    workdir = tempfile.mkdtemp(prefix="chatbot-bench-")
+    os.environ["AI_PROVIDER"] = args.provider
+    os.environ["LOCAL_EMBEDDING_LATENCY_MS"] = str(args.embedding_latency_ms)
+    os.environ["LOCAL_GENERATION_LATENCY_MS"] = str(args.generation_latency_ms)
+    # Mọi kho dữ liệu (Chroma, sqlite) nằm trong workdir; ghi đè cả đường dẫn riêng đã đặt trong môi trường
+    for name in DATA_PATHS:
+        os.environ[name] = os.path.join(workdir, *DATA_PATHS[name])
+    # Tắt answer cache để đo đường xử lý đầy đủ thay vì tỉ lệ trúng cache
+    os.environ.setdefault("ANSWER_CACHE_THRESHOLD", "1.01")
+    # Upload lặp lại cùng một file sẽ trúng chỉ mục nội dung; tắt để đo đủ pipeline trích xuất/vector hóa
+    os.environ.setdefault("CONTENT_DEDUP", "0")
+    os.chdir(workdir)
+    return workdir
+
+
+def summarize(samples_ms, wall_seconds):
+    ordered = sorted(samples_ms)
+    count = len(ordered)
+
+    def percentile(p):
+        if not ordered:
+            return 0.0
+        index = min(count - 1, max(0, math.ceil(p / 100 * count) - 1))
+        return round(ordered[index], 3)
+
+    return {
+        'count': count,
+        'mean_ms': round(sum(ordered) / count, 3) if count else 0.0,
+        'min_ms': round(ordered[0], 3) if count else 0.0,
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+        'max_ms': round(ordered[-1], 3) if count else 0.0,
+        'throughput_rps': round(count / wall_seconds, 2) if wall_seconds else 0.0,
+    }
+
+
+def measure(fn, iterations, warmup=0, concurrency=1):
+    for i in range(warmup):
+        fn(-1 - i)
+
+    def timed(i):
+        started = time.perf_counter()
+        fn(i)
+        return (time.perf_counter() - started) * 1000
+
+    wall_started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            samples = list(executor.map(timed, range(iterations)))
+    else:
+        samples = [timed(i) for i in range(iterations)]
+    result = summarize(samples, time.perf_counter() - wall_started)
+    result['concurrency'] = concurrency
+    return result
+
+
+def check(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f"HTTP {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return response
+
+
+def bench_endpoints(main, corpus, args):
+    client = main.app.test_client()
+    results = {}
+    medium = [doc for doc in corpus if doc['size'] == 'medium'] or corpus
+
+    for search_type in ('knowledge', 'files'):
+        def chat(i, search_type=search_type):
+            message = f"{QUERIES[i % len(QUERIES)]} #{i}"
+            check(client.post('/api/ai-chat', json={'message': message, 'search_type': search_type}))
+
+        for concurrency in sorted({1, args.concurrency}):
+            key = f"ai_chat_{search_type}_c{concurrency}"
+            results[key] = measure(chat, args.iterations, args.warmup, concurrency)
+
+    for doc in medium:
+        def upload(i, doc=doc):
+            check(client.post('/api/process-file', data={
+                'file': (BytesIO(doc['content']), doc['name'], doc['content_type']),
+                'file_id': f"bench-{doc['name']}-{i}"
+            }, content_type='multipart/form-data'))
+
+        results[f"process_file_{doc['format']}"] = measure(upload, max(3, args.iterations // 5), 1)
+
+    text = " ".join(doc['name'] for doc in corpus) * 200
+
+    def summarize_text(i):
+        check(client.post('/api/summarize-text', json={'text': f"{text} {i}", 'max_length': 500}))
+
+    results['summarize_text'] = measure(summarize_text, args.iterations, args.warmup)
+
+    def file_vectors(i):
+        check(client.get('/api/file-vectors'))
+
+    results['file_vectors'] = measure(file_vectors, args.iterations, args.warmup)
+    return results
+
+
+def bench_extraction(file_processor, corpus, args):
+    results = {}
+    for doc in corpus:
+        def extract(i, doc=doc):
+            file_processor.extract_text(BytesIO(doc['content']), doc['name'], doc['content_type'])
+
+        result = measure(extract, max(3, args.iterations // 3), 1)
+        result['bytes'] = doc['bytes']
+        result['chars'] = len(file_processor.extract_text(BytesIO(doc['content']), doc['name'], doc['content_type']))
+        results[f"extract_{doc['name']}"] = result
+    return results
+
+
+def chunk_stats(chunks):
+    from model.chunking import estimate_tokens
+    tokens = [estimate_tokens(chunk) for chunk in chunks]
+    return {
+        'chunks': len(chunks),
+        'mean_tokens': round(sum(tokens) / len(tokens), 1) if tokens else 0.0,
+        'max_tokens': max(tokens) if tokens else 0,
+        'indexed_chars': sum(len(chunk) for chunk in chunks),
+    }
+
+
+def bench_chunking(file_processor, corpus, args):
+    from model.chunking import make_chunker
+
+    def run_chunker(kind, text):
+        chunker = make_chunker(kind)
+        return [chunk for chunk, _, _ in chunker.feed(text) + chunker.finish()]
+
+    texts = {}
+    for doc in corpus:
+        if doc['format'] == 'docx':
+            texts[doc['size']] = file_processor.extract_text(BytesIO(doc['content']), doc['name'], doc['content_type'])
+    # Văn bản gần như không có dấu câu (bảng, danh sách xuất từ Excel) là trường hợp xấu của cách cắt theo ký tự
+    if texts:
+        sample = max(texts.values(), key=len)
+        texts['few_delimiters'] = "\n".join(
+            " | ".join(line.replace(".", "").split()) for line in sample.split("\n")
+        ).replace("\n", " ")
+
+    results = {}
+    for name, text in texts.items():
+        for kind in ('chars', 'token'):
+            def chunk(i, text=text, kind=kind):
+                run_chunker(kind, text)
+
+            result = measure(chunk, args.iterations, args.warmup)
+            result['chars'] = len(text)
+            result.update(chunk_stats(run_chunker(kind, text)))
+            results[f"chunk_{kind}_{name}"] = result
+    return results
+
+
+def bench_chroma(main, args):
+    from model.providers import get_provider
+    from model.vector_store import get_vector_store, FILES_CHROMA_PATH, FILES_COLLECTION
+
+    store = get_vector_store(FILES_CHROMA_PATH)
+    provider = get_provider()
+    embeddings = provider.embed('bench', [f"{q} {i}" for i, q in enumerate(QUERIES * 4)])
+    results = {'collection_size': store.count(FILES_COLLECTION)}
+
+    for n_results in (3, 5, 10):
+        def query(i, n_results=n_results):
+            store.query(FILES_COLLECTION, [embeddings[i % len(embeddings)]], n_results=n_results)
+
+        results[f"query_top{n_results}"] = measure(query, args.iterations * 3, args.warmup)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def main():
+    args = parse_args()
+    output = os.path.abspath(args.output)
+    workdir = configure_environment(args)
+
+    import logging
+    logging.disable(logging.INFO)
+
+    from benchmarks.corpus import build_corpus
+    from index_data import create_vector_store
+    import main as app_main
+
+    if not app_main.bot or not app_main.file_processor:
+        print("Không khởi tạo được ChatBot/FileProcessor")
+        sys.exit(1)
+
+    create_vector_store()
+    app_main.bot.answer_cache.set_version(None)
+
+    sizes = [s for s in args.sizes.split(",") if s]
+    only = set(s for s in args.only.split(",") if s)
+    corpus = build_corpus(sizes)
+
+    results = {}
+    if not only or 'extraction' in only:
+        results['extraction'] = bench_extraction(app_main.file_processor, corpus, args)
+    if not only or 'chunking' in only:
+        results['chunking'] = bench_chunking(app_main.file_processor, corpus, args)
+    if not only or 'endpoints' in only:
+        results['endpoints'] = bench_endpoints(app_main, corpus, args)
+    if not only or 'chroma' in only:
+        results['chroma'] = bench_chroma(app_main, args)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'provider': os.environ["AI_PROVIDER"],
+            'embedding_latency_ms': args.embedding_latency_ms,
+            'generation_latency_ms': args.generation_latency_ms,
+            'iterations': args.iterations,
+            'concurrency': args.concurrency,
+            'sizes': sizes,
+            'corpus': [{k: v for k, v in doc.items() if k != 'content'} for doc in corpus],
+            'workdir': workdir,
+        },
+        'results': results,
+    }
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for group, entries in results.items():
+        print(f"\n[{group}]")
+        for name, stats in entries.items():
+            if isinstance(stats, dict):
+                print(f"  {name:<32} p50={stats['p50_ms']:>9.2f}ms  p95={stats['p95_ms']:>9.2f}ms  "
+                      f"p99={stats['p99_ms']:>9.2f}ms  {stats['throughput_rps']:>8.1f} rps")
+    print(f"\nĐã ghi kết quả vào {output}")
+
+
+if __name__ == "__main__":
+    main()
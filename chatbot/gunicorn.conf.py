@@ -0,0 +1,85 @@
+# Chạy từ thư mục chatbot: gunicorn -c gunicorn.conf.py main:app
+#
+# preload_app: ChatBot, FileProcessor, provider và cache được tạo một lần ở process cha rồi fork ra
+# các worker dùng chung bộ nhớ (copy-on-write). Những thứ không an toàn qua fork (kết nối sqlite,
+# client HTTP của Gemini, thread pool) được mở lại trong từng worker bằng os.register_at_fork trong
+# các module model/*. Chroma không chịu được việc process cha đã đọc collection trước khi fork, nên
+# với CHATBOT_PREFORK=1 các collection chỉ được mở (warm_up) trong từng worker ở post_fork.
+#
+# Mỗi worker tự khởi động EXTRACT_WORKERS process trích xuất file khi có upload đầu tiên, nên tổng số
+# process là workers * (1 + EXTRACT_WORKERS).
+#
+# Trạng thái job vector hóa, gợi ý câu hỏi và tóm tắt file nằm trong state store (sqlite) nên request thăm dò
+# rơi vào worker nào cũng được. Chroma PersistentClient thì không thấy chunk do process khác vừa ghi, vì vậy khi
+# chạy nhiều worker mà không có CHROMA_HOST, master khởi động một Chroma server cục bộ cho mỗi thư mục dữ liệu
+# (model/chroma_server.py, cổng từ CHROMA_LOCAL_PORT) và mọi worker dùng chung qua HTTP. Chỉ khi
+# CHATBOT_WORKERS=1 thì worker mới mở thẳng thư mục Chroma.
+#
+# /api/metrics cộng dồn counter/histogram của mọi worker qua các file snapshot trong CHATBOT_METRICS_DIR
+# (ghi mỗi CHATBOT_METRICS_FLUSH_INTERVAL giây, nên số liệu của worker khác có thể trễ tối đa chừng đó).
+#
+# Reload nhẹ nhàng:
+#   kill -HUP <master_pid>   fork lại toàn bộ worker từ trạng thái đã nạp, worker cũ xử lý xong request rồi mới thoát
+#   kill -USR2 <master_pid>  khởi động master mới với code mới; sau đó kill -QUIT <master_pid cũ>
+#                            (cần CHROMA_HOST: master mới không mở lại được cổng của Chroma server cục bộ)
+import os
+import logging
+import multiprocessing
+
+os.environ["CHATBOT_PREFORK"] = "1"
+
+bind = os.getenv("CHATBOT_BIND", "0.0.0.0:8000")
+CHROMA_HOST = os.getenv("CHROMA_HOST", "")
+workers = int(os.getenv("CHATBOT_WORKERS", str(multiprocessing.cpu_count())))
+# gthread để các request stream SSE và chờ Gemini không chiếm trọn một worker
+worker_class = "gthread"
+threads = int(os.getenv("CHATBOT_THREADS", "8"))
+preload_app = True
+timeout = int(os.getenv("CHATBOT_TIMEOUT", "180"))
+graceful_timeout = int(os.getenv("CHATBOT_GRACEFUL_TIMEOUT", "60"))
+keepalive = 5
+# Tái tạo worker định kỳ để giới hạn phân mảnh bộ nhớ sau nhiều lần xử lý file lớn; 0 là tắt
+max_requests = int(os.getenv("CHATBOT_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+accesslog = os.getenv("CHATBOT_ACCESS_LOG", "-")
+
+
+_chroma_servers = []
+
+
+def on_starting(server):
+    # Chạy một lần ở master (không chạy lại khi HUP), sau khi app đã được nạp nhưng trước khi fork worker;
+    # client Chroma được tạo ở lần dùng đầu tiên trong worker nên vẫn kịp đọc địa chỉ server
+    from model.metrics import clear_snapshots
+    clear_snapshots()
+    if workers > 1 and not CHROMA_HOST:
+        from model.paths import data_path
+        from model.chroma_server import start_local_servers
+        _chroma_servers.extend(start_local_servers([
+            data_path("KNOWLEDGE_CHROMA_PATH"),
+            data_path("FILES_CHROMA_PATH"),
+        ]))
+
+
+def on_exit(server):
+    from model.chroma_server import stop_local_servers
+    stop_local_servers(_chroma_servers)
+
+
+def post_fork(server, worker):
+    from model.metrics import REGISTRY, METRICS_DIR
+    REGISTRY.share(METRICS_DIR)
+    import main
+    if main.bot:
+        main.bot.warm_up()
+    if main.file_processor:
+        main.file_processor.warm_up()
+    logging.info(f"Worker {worker.pid} forked with warm state")
+
+
+def worker_exit(server, worker):
+    # Ghi nốt lịch sử chat còn trong buffer trước khi worker thoát
+    import main
+    from model.metrics import REGISTRY
+    main.session_store.flush()
+    REGISTRY.write_snapshot()
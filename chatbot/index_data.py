@@ -1,38 +1,72 @@
 import json
 import os
-import chromadb
-from google import genai
+import sys
+import hashlib
 from google.genai.errors import APIError
 from dotenv import load_dotenv
+from model.embedding_cache import get_embedding_cache
+from model.providers import get_provider
+from model.vector_store import get_vector_store, KNOWLEDGE_CHROMA_PATH, KNOWLEDGE_COLLECTION
 
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 dotenv_path = os.path.join(parent_dir, 'backend', '.env')
 load_dotenv(dotenv_path=dotenv_path)
 
-API_KEY = os.getenv("GEMINI_API_KEY")
 EMBEDDING_MODEL = 'text-embedding-004'
-CHROMA_PATH = "chroma_db"
+CHROMA_PATH = KNOWLEDGE_CHROMA_PATH
 DATA_FILE = os.path.join(os.path.dirname(__file__), 'model', 'data_chunks.json')
+KB_VERSION_FILE = os.path.join(CHROMA_PATH, 'kb_version')
 
-def get_embeddings(texts):
-    if not API_KEY:
-        print("Lỗi: GEMINI_API_KEY chưa được thiết lập.")
+def compute_knowledge_version(data):
+    payload = json.dumps(data, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+def read_knowledge_version():
+    try:
+        with open(KB_VERSION_FILE, 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
         return None
 
+def write_knowledge_version(version):
+    os.makedirs(os.path.dirname(KB_VERSION_FILE), exist_ok=True)
+    with open(KB_VERSION_FILE, 'w', encoding='utf-8') as f:
+        f.write(version)
+
+def load_provider():
     try:
-        # Khởi tạo Client bên trong hàm để đảm bảo có thể retry
-        client = genai.Client(api_key=API_KEY)
-        response = client.models.embed_content(
-            model=EMBEDDING_MODEL,
-            contents=texts
-        )
-
-        if hasattr(response, 'embedding') and response.embedding:
-            return response.embedding
-        if hasattr(response, 'values') and response.values:
-            return response.values
+        return get_provider()
+    except ValueError as e:
+        print(f"Lỗi: {e}")
+        return None
 
+def get_embeddings(texts):
+    provider = load_provider()
+    if not provider:
         return None
+
+    # Chỉ gọi API cho các văn bản chưa có trong cache
+    cache = get_embedding_cache()
+    cache_key = provider.embedding_key(EMBEDDING_MODEL)
+    embeddings = [cache.get(cache_key, text) for text in texts]
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if not missing:
+        return embeddings
+
+    fresh = _embed_uncached(provider, [texts[i] for i in missing])
+    if not fresh or len(fresh) != len(missing):
+        return None
+
+    for i, embedding in zip(missing, fresh):
+        cache.put(cache_key, texts[i], embedding)
+        embeddings[i] = embedding
+    print(f"✓ Cache embeddings: {len(texts) - len(missing)} trúng, {len(missing)} gọi API")
+    return embeddings
+
+def _embed_uncached(provider, texts):
+    try:
+        embeddings = provider.embed(EMBEDDING_MODEL, texts)
+        return embeddings if embeddings else None
     except APIError as e:
         print(f"Lỗi API khi vector hóa batch (NGHIÊM TRỌNG): {e}")
         # THỬ LẠI TỪNG VĂN BẢN ĐỂ IN LỖI CỤ THỂ HƠN
@@ -40,13 +74,7 @@ def get_embeddings(texts):
         embeddings = []
         for i, text in enumerate(texts):
             try:
-                client = genai.Client(api_key=API_KEY)
-                response = client.models.embed_content(
-                    model=EMBEDDING_MODEL,
-                    contents=[text]
-                )
-                embedding = response.embedding if hasattr(response, 'embedding') and response.embedding else response.values[0]
-                embeddings.append(embedding)
+                embeddings.append(provider.embed(EMBEDDING_MODEL, [text])[0])
             except APIError as e_single:
                 print(f"Lỗi API khi vector hóa văn bản #{i+1}: {e_single}")
                 # Nếu API lỗi, ta KHÔNG nên dùng vector 0 mà nên dừng
@@ -62,13 +90,7 @@ def get_embeddings(texts):
         print(f"Lỗi chung khi vector hóa batch: {e}")
         return None
 
-def create_vector_store():
-    if not API_KEY:
-        print("Lỗi: GEMINI_API_KEY chưa được thiết lập. Vui lòng kiểm tra file .env")
-        return
-
-    print("✓ Cấu hình Gemini API thành công (sử dụng Client)")
-
+def load_knowledge_data():
     try:
         with open(DATA_FILE, 'r', encoding="utf-8") as f:
             data = json.load(f)
@@ -97,72 +119,139 @@ def create_vector_store():
         data = sample_data
         print(f"✓ Đã tạo file mẫu với {len(data)} chunks")
 
-    texts = [item['text'] for item in data]
-    ids = [str(item.get('id', f'chunk_{i}')) for i, item in enumerate(data)]
-    metadatas = [{'source': item['source']} for item in data]
+    return data
 
-    print("\n=== Bắt đầu tạo embeddings ===")
-    embeddings = get_embeddings(texts)
+def chunk_content_hash(text, source):
+    payload = json.dumps({'text': text, 'source': source}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
 
-    if not embeddings or len(embeddings) != len(texts):
-        print("Lỗi: Không thể tạo embeddings cho tất cả các văn bản.")
-        print("NGUYÊN NHÂN: Vui lòng kiểm tra lại GEMINI_API_KEY và đảm bảo nó có quyền gọi API.")
-        return
+def plan_reindex(store, data):
+    desired = {}
+    for i, item in enumerate(data):
+        chunk_id = str(item.get('id', f'chunk_{i}'))
+        desired[chunk_id] = {
+            'text': item['text'],
+            'source': item['source'],
+            'content_hash': chunk_content_hash(item['text'], item['source'])
+        }
 
-    print(f"✓ Đã tạo {len(embeddings)} embeddings")
+    existing = store.get(KNOWLEDGE_COLLECTION, include=['metadatas'])
+    indexed = {
+        chunk_id: (metadata or {}).get('content_hash')
+        for chunk_id, metadata in zip(existing['ids'], existing['metadatas'])
+    }
 
-    print("\n=== Lưu vào ChromaDB ===")
-    chroma_client = chromadb.PersistentClient(path=CHROMA_PATH)
+    added = [chunk_id for chunk_id in desired if chunk_id not in indexed]
+    changed = [
+        chunk_id for chunk_id, item in desired.items()
+        if chunk_id in indexed and indexed[chunk_id] != item['content_hash']
+    ]
+    removed = [chunk_id for chunk_id in indexed if chunk_id not in desired]
 
-    try:
-        chroma_client.delete_collection(name="chatbot_knowledge")
-        print("✓ Đã xóa collection cũ")
-    except Exception:
-        print("✓ Không có collection cũ")
-
-    collection = chroma_client.get_or_create_collection(
-        name="chatbot_knowledge",
-        metadata={"hnsw:space": "cosine"}
+    return {
+        'desired': desired,
+        'added': added,
+        'changed': changed,
+        'removed': removed,
+        'unchanged': len(desired) - len(added) - len(changed)
+    }
+
+def reindex_report(plan, dry_run, version=None):
+    return {
+        'dry_run': dry_run,
+        'added': plan['added'],
+        'changed': plan['changed'],
+        'removed': plan['removed'],
+        'unchanged': plan['unchanged'],
+        'version': version
+    }
+
+def create_vector_store(dry_run=False):
+    data = load_knowledge_data()
+
+    store = get_vector_store(CHROMA_PATH)
+    plan = plan_reindex(store, data)
+    print(
+        f"✓ Thay đổi: {len(plan['added'])} thêm mới, {len(plan['changed'])} sửa, "
+        f"{len(plan['removed'])} xóa, {plan['unchanged']} giữ nguyên"
     )
-    print("✓ Đã tạo collection mới")
 
-    try:
-        collection.add(
-            embeddings=embeddings,
-            documents=texts,
-            metadatas=metadatas,
-            ids=ids
-        )
-        print(f"✓ Đã lưu {collection.count()} documents vào ChromaDB")
-    except Exception as e:
-        print(f"Lỗi khi lưu vào ChromaDB: {e}")
-        return
+    if dry_run:
+        return reindex_report(plan, dry_run=True)
+
+    upsert_ids = plan['added'] + plan['changed']
+    if upsert_ids:
+        if not load_provider():
+            print("Vui lòng kiểm tra cấu hình AI_PROVIDER và file .env")
+            return None
+
+        texts = [plan['desired'][chunk_id]['text'] for chunk_id in upsert_ids]
+        metadatas = [
+            {
+                'source': plan['desired'][chunk_id]['source'],
+                'content_hash': plan['desired'][chunk_id]['content_hash']
+            }
+            for chunk_id in upsert_ids
+        ]
 
-    print(f"\n✅ HOÀN THÀNH! Đã vector hóa và lưu trữ {collection.count()} documents")
+        print("\n=== Bắt đầu tạo embeddings ===")
+        embeddings = get_embeddings(texts)
+
+        if not embeddings or len(embeddings) != len(texts):
+            print("Lỗi: Không thể tạo embeddings cho tất cả các văn bản.")
+            print("NGUYÊN NHÂN: Vui lòng kiểm tra lại GEMINI_API_KEY và đảm bảo nó có quyền gọi API.")
+            return None
+
+        print(f"✓ Đã tạo {len(embeddings)} embeddings")
+
+        try:
+            store.upsert(
+                KNOWLEDGE_COLLECTION,
+                ids=upsert_ids,
+                embeddings=embeddings,
+                documents=texts,
+                metadatas=metadatas
+            )
+            print(f"✓ Đã cập nhật {len(upsert_ids)} documents vào ChromaDB")
+        except Exception as e:
+            print(f"Lỗi khi lưu vào ChromaDB: {e}")
+            return None
+
+    if plan['removed']:
+        try:
+            store.delete(KNOWLEDGE_COLLECTION, ids=plan['removed'])
+            print(f"✓ Đã xóa {len(plan['removed'])} documents không còn trong dữ liệu")
+        except Exception as e:
+            print(f"Lỗi khi xóa khỏi ChromaDB: {e}")
+            return None
+
+    version = compute_knowledge_version(data)
+    write_knowledge_version(version)
+    print(f"✓ Phiên bản kho kiến thức: {version}")
+
+    print(f"\n✅ HOÀN THÀNH! Kho kiến thức có {store.count(KNOWLEDGE_COLLECTION)} documents")
     print(f"📁 Dữ liệu được lưu tại: {os.path.abspath(CHROMA_PATH)}")
 
+    return reindex_report(plan, dry_run=False, version=version)
+
+def test_vector_store():
     print("\n=== Kiểm tra kết quả ===")
     test_query = "upload minh chứng"
     try:
-        client = genai.Client(api_key=API_KEY)
-        response = client.models.embed_content(
-            model=EMBEDDING_MODEL,
-            contents=[test_query]
-        )
-        query_vec = response.embedding
-
-        results = collection.query(
-            query_embeddings=[query_vec],
-            n_results=2
-        )
+        query_vec = get_embeddings([test_query])[0]
+
+        hits = get_vector_store(CHROMA_PATH).query(KNOWLEDGE_COLLECTION, [query_vec], n_results=2)[0]
 
         print(f"Test query: '{test_query}'")
         print("Kết quả tìm kiếm:")
-        for i, doc in enumerate(results['documents'][0]):
-            print(f"  {i+1}. {doc[:100]}...")
+        for i, hit in enumerate(hits):
+            print(f"  {i+1}. {hit.document[:100]}...")
 
     except Exception as e:
         print(f"Lỗi khi test: {e}")
 
 if __name__ == "__main__":
-    create_vector_store()
\ No newline at end of file
+    dry_run = "--dry-run" in sys.argv
+    report = create_vector_store(dry_run=dry_run)
+    if report and not dry_run:
+        test_vector_store()
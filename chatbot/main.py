@@ -1,15 +1,26 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 from model.chatbot import ChatBot
-from model.file_processor import FileProcessor
+from model.file_processor import FileProcessor, FILE_SUMMARY_MODE
+from model.ingestion_jobs import IngestionJobQueue
+from model.followups import FollowupQueue, FOLLOWUP_MODE, FOLLOWUP_MODES, new_message_id
+from model.session_store import create_session_store
+from model.metrics import (REGISTRY, HTTP_REQUEST_SECONDS, ERRORS, COLLECTION_DOCUMENTS, ACTIVE_SESSIONS,
+                           UPLOAD_INFLIGHT_BYTES, UPLOAD_REJECTIONS)
+from model.uploads import (InFlightLimiter, UploadTooLarge, spool_upload, stream_size,
+                           UPLOAD_MAX_BYTES, UPLOAD_FORM_OVERHEAD_BYTES, MB)
+from model.vector_store import KNOWLEDGE_COLLECTION, FILES_COLLECTION
+from model.retrieval_scope import RetrievalScope, SCOPE_FIELDS, scope_fields
 import logging
 from datetime import datetime
 from dotenv import load_dotenv
 import os
-import io
-from index_data import create_vector_store
+from index_data import create_vector_store, read_knowledge_version
 import json
+import time
 import threading
+from typing import Optional
 
 dotenv_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'backend', '.env')
 load_dotenv(dotenv_path=dotenv_path)
@@ -35,7 +46,86 @@ except Exception as e:
     bot = None
     file_processor = None
 
-chat_history = {}
+if bot:
+    bot.answer_cache.set_version(read_knowledge_version())
+
+job_queue = IngestionJobQueue(file_processor) if file_processor else None
+followup_queue = FollowupQueue(bot) if bot else None
+
+session_store = create_session_store()
+upload_limiter = InFlightLimiter()
+
+# Khi chạy nhiều worker, re-index ở một worker phải làm mất hiệu lực answer cache ở các worker còn lại
+KB_VERSION_CHECK_INTERVAL = float(os.getenv("KB_VERSION_CHECK_INTERVAL", "2"))
+FILE_VECTORS_PAGE_SIZE = int(os.getenv("FILE_VECTORS_PAGE_SIZE", "100"))
+FILE_VECTORS_MAX_PAGE_SIZE = 1000
+DELETE_VECTORS_MAX_IDS = int(os.getenv("DELETE_VECTORS_MAX_IDS", "10000"))
+BATCH_CHAT_MAX_QUESTIONS = int(os.getenv("BATCH_CHAT_MAX_QUESTIONS", "200"))
+kb_version_checked_at = 0.0
+
+def sync_knowledge_version():
+    global kb_version_checked_at
+    now = time.monotonic()
+    if not bot or now - kb_version_checked_at < KB_VERSION_CHECK_INTERVAL:
+        return
+    kb_version_checked_at = now
+    bot.answer_cache.set_version(read_knowledge_version())
+
+def collection_sizes() -> dict:
+    sizes = {}
+    if bot and bot.knowledge_store:
+        sizes[(KNOWLEDGE_COLLECTION,)] = bot.knowledge_store.count(KNOWLEDGE_COLLECTION)
+    if bot and bot.files_store:
+        sizes[(FILES_COLLECTION,)] = bot.files_store.count(FILES_COLLECTION)
+    return sizes
+
+COLLECTION_DOCUMENTS.set_function(collection_sizes)
+ACTIVE_SESSIONS.set_function(lambda: {(): session_store.count()})
+UPLOAD_INFLIGHT_BYTES.set_function(lambda: {(): upload_limiter.in_flight})
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    sync_knowledge_version()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        # Dùng rule thay vì path để nhãn không phình theo session_id/file_id
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            endpoint=endpoint,
+            method=request.method,
+            status=response.status_code
+        )
+        if response.status_code >= 500:
+            ERRORS.inc(component='http')
+    return response
+
+def is_truthy(value) -> bool:
+    return str(value).lower() in ('1', 'true', 'yes')
+
+def resolve_followup_mode(data: dict) -> str:
+    mode = data.get("followups", FOLLOWUP_MODE)
+    if mode is False or str(mode).lower() in ('false', '0', 'no'):
+        return 'none'
+    if mode is True or str(mode).lower() in ('true', '1', 'yes'):
+        return 'sync'
+    return mode if mode in FOLLOWUP_MODES else FOLLOWUP_MODE
+
+def append_history(session_id: str, message: str, reply: str, search_type: str, message_id: str):
+    session_store.append(session_id, {
+        "message_id": message_id,
+        "timestamp": datetime.now().isoformat(),
+        "user_message": message,
+        "bot_reply": reply,
+        "search_type": search_type
+    })
+
+def sse_event(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
 
 @app.route("/api/ai-chat", methods=["POST"])
 def ai_chat():
@@ -58,31 +148,42 @@ def ai_chat():
         if not message:
             return jsonify({"error": "Message is required"}), 400
 
-        if search_type == "files":
-            reply = bot.get_reply_from_files(message)
-        else:
-            reply = bot.get_reply(message)
+        try:
+            scope = RetrievalScope.from_request(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        followups = bot.get_contextual_followup(reply)
+        followup_mode = resolve_followup_mode(data)
 
-        if session_id not in chat_history:
-            chat_history[session_id] = []
+        if is_truthy(data.get("stream", False)):
+            return stream_chat_response(message, session_id, search_type, followup_mode, scope)
 
-        chat_history[session_id].append({
-            "timestamp": datetime.now().isoformat(),
-            "user_message": message,
-            "bot_reply": reply,
-            "search_type": search_type
-        })
+        info = {}
+        if search_type == "files":
+            reply = bot.get_reply_from_files(message, scope, info)
+        else:
+            reply = bot.get_reply(message, info)
 
-        if len(chat_history[session_id]) > 50:
-            chat_history[session_id] = chat_history[session_id][-50:]
+        message_id = new_message_id()
+        followups = []
+        followups_status = 'skipped'
+        if followup_mode == 'sync':
+            followups = bot.get_contextual_followup(reply)
+            followups_status = 'completed'
+        elif followup_mode == 'async':
+            followup_queue.submit(message_id, reply)
+            followups_status = 'pending'
+
+        append_history(session_id, message, reply, search_type, message_id)
 
         logging.info(f"Chat - Session: {session_id}, Message: {message[:50]}")
 
         return jsonify({
             "reply": reply,
+            "message_id": message_id,
             "followup_questions": followups,
+            "followups_status": followups_status,
+            "context_tokens": info.get('context_tokens', 0),
             "timestamp": datetime.now().isoformat()
         })
 
@@ -100,6 +201,138 @@ def ai_chat():
             "reply": "Xin lỗi, tôi gặp sự cố nội bộ. Vui lòng thử lại sau."
         }), 500
 
+@app.route("/api/ai-chat/batch", methods=["POST"])
+def ai_chat_batch():
+    if not bot:
+        return jsonify({"error": "Dịch vụ AI chưa sẵn sàng"}), 503
+
+    data = request.get_json(silent=True) or {}
+    questions = data.get("questions")
+    if not isinstance(questions, list) or not questions:
+        return jsonify({"error": "questions phải là danh sách câu hỏi"}), 400
+    if len(questions) > BATCH_CHAT_MAX_QUESTIONS:
+        return jsonify({"error": f"Tối đa {BATCH_CHAT_MAX_QUESTIONS} câu hỏi mỗi yêu cầu"}), 400
+    search_type = data.get("search_type", "knowledge")
+
+    try:
+        scope = RetrievalScope.from_request(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    started = time.perf_counter()
+    messages = [question.strip() if isinstance(question, str) else "" for question in questions]
+    valid = [i for i, message in enumerate(messages) if message]
+    try:
+        replies = bot.get_replies([messages[i] for i in valid], search_type, scope)
+    except Exception as e:
+        logging.error(f"Internal server error in ai_chat_batch: {str(e)}")
+        return jsonify({"error": "Đã xảy ra lỗi khi xử lý yêu cầu"}), 500
+
+    results = [{"index": i, "error": "Message is required"} for i in range(len(messages))]
+    for i, reply in zip(valid, replies):
+        results[i] = {"index": i, "question": messages[i], **reply}
+
+    logging.info(f"Chat batch - {len(messages)} questions, search_type: {search_type}")
+    return jsonify({
+        "results": results,
+        "count": len(results),
+        "failed": sum(1 for result in results if "error" in result),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        "timestamp": datetime.now().isoformat()
+    })
+
+def stream_chat_response(message: str, session_id: str, search_type: str, followup_mode: str,
+                         scope: Optional[RetrievalScope] = None) -> Response:
+    message_id = new_message_id()
+
+    def generate():
+        reply = None
+        try:
+            for event in bot.stream_reply(message, search_type, scope):
+                if event['type'] == 'done':
+                    reply = event['reply']
+                    event['message_id'] = message_id
+                    event['timestamp'] = datetime.now().isoformat()
+                yield sse_event(event)
+
+            if reply is None:
+                return
+
+            append_history(session_id, message, reply, search_type, message_id)
+            logging.info(f"Chat stream - Session: {session_id}, Message: {message[:50]}")
+
+            # Câu trả lời đã gửi xong nên sinh gợi ý tại đây không làm chậm người dùng
+            if followup_mode != 'none':
+                followups = bot.get_contextual_followup(reply)
+                yield sse_event({'type': 'followups', 'followup_questions': followups})
+
+        except Exception as e:
+            logging.error(f"Internal server error in ai_chat stream: {str(e)}")
+            yield sse_event({
+                'type': 'error',
+                'error': "Xin lỗi, tôi gặp sự cố nội bộ. Vui lòng thử lại sau."
+            })
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+@app.route("/api/ai-chat/stream", methods=["POST"])
+def ai_chat_stream():
+    if not bot:
+        return jsonify({
+            "error": "Dịch vụ AI chưa sẵn sàng",
+            "reply": "Xin lỗi, tôi gặp sự cố cấu hình kỹ thuật. Vui lòng kiểm tra API Key."
+        }), 503
+
+    data = request.get_json()
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+
+    message = data.get("message", "").strip()
+    if not message:
+        return jsonify({"error": "Message is required"}), 400
+
+    try:
+        scope = RetrievalScope.from_request(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return stream_chat_response(
+        message,
+        data.get("session_id", "default"),
+        data.get("search_type", "knowledge"),
+        resolve_followup_mode(data),
+        scope
+    )
+
+@app.route("/api/ai-chat/followups/<message_id>", methods=["GET"])
+def get_followups(message_id):
+    if not followup_queue:
+        return jsonify({"error": "Dịch vụ AI chưa sẵn sàng"}), 503
+
+    entry = followup_queue.get(message_id)
+    if not entry:
+        return jsonify({"error": "Không tìm thấy message_id"}), 404
+
+    return jsonify({
+        "message_id": message_id,
+        "status": entry['status'],
+        "followup_questions": entry['followup_questions']
+    })
+
+def upload_too_large():
+    UPLOAD_REJECTIONS.inc(reason='too_large')
+    return jsonify({
+        "success": False,
+        "error": f"File vượt quá giới hạn {UPLOAD_MAX_BYTES // MB}MB"
+    }), 413
+
 @app.route("/api/process-file", methods=["POST"])
 def process_file():
     if not file_processor:
@@ -108,6 +341,28 @@ def process_file():
             "error": "FileProcessor chưa được khởi tạo"
         }), 503
 
+    # Từ chối sớm dựa trên Content-Length, trước khi werkzeug đọc body
+    declared = request.content_length
+    if declared and declared > UPLOAD_MAX_BYTES:
+        return upload_too_large()
+
+    # Chỉ route này nhận body lớn: chặn ngay ở werkzeug cả với upload không có Content-Length (chunked),
+    # chừa thêm chỗ cho các trường multipart
+    request.max_content_length = UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD_BYTES
+
+    # Không có Content-Length (chunked) thì giữ chỗ bằng mức tối đa cho phép
+    reservation = upload_limiter.try_acquire(min(declared or UPLOAD_MAX_BYTES, UPLOAD_MAX_BYTES))
+    if not reservation:
+        UPLOAD_REJECTIONS.inc(reason='busy')
+        response = jsonify({
+            "success": False,
+            "error": "Hệ thống đang xử lý quá nhiều file, vui lòng thử lại sau"
+        })
+        response.headers['Retry-After'] = '5'
+        return response, 429
+
+    # Job chạy nền sẽ tự trả lại dung lượng đã giữ khi xử lý xong
+    handed_off = False
     try:
         if 'file' not in request.files:
             return jsonify({
@@ -124,15 +379,47 @@ def process_file():
                 "error": "Thiếu file_id"
             }), 400
 
-        file_content = io.BytesIO(file.read())
         filename = file.filename
         content_type = file.content_type
+        summary_mode = request.form.get('summary_mode', FILE_SUMMARY_MODE)
+        if summary_mode not in ('parallel', 'lazy', 'none'):
+            return jsonify({
+                "success": False,
+                "error": "summary_mode không hợp lệ"
+            }), 400
+
+        scope = scope_fields(request.form)
+
+        if is_truthy(request.form.get('async', request.args.get('async', ''))):
+            # File của werkzeug bị đóng khi request kết thúc nên phải chép sang file tạm riêng cho job
+            spooled = spool_upload(file.stream)
+            job_id = job_queue.submit(
+                spooled, filename, content_type, file_id, summary_mode,
+                on_finish=lambda: upload_limiter.release(reservation),
+                scope=scope
+            )
+            handed_off = True
+            logging.info(f"Queued ingestion job {job_id} for file {filename}")
+            return jsonify({
+                "success": True,
+                "job_id": job_id,
+                "status": "queued",
+                "status_url": f"/api/process-file/jobs/{job_id}"
+            }), 202
+
+        # werkzeug đã ghi file lớn ra đĩa khi parse multipart, đọc thẳng từ đó thay vì nạp vào RAM
+        file_content = file.stream
+        if stream_size(file_content) > UPLOAD_MAX_BYTES:
+            return upload_too_large()
+        file_content.seek(0)
 
         result = file_processor.process_file(
             file_content,
             filename,
             content_type,
-            file_id
+            file_id,
+            summary_mode=summary_mode,
+            scope=scope
         )
 
         if result['success']:
@@ -140,20 +427,117 @@ def process_file():
                 "success": True,
                 "content": result['content'],
                 "summary": result['summary'],
-                "vector_id": result['vector_id']
+                "summary_status": result['summary_status'],
+                "vector_id": result['vector_id'],
+                "chunks_count": result['chunks_count'],
+                "failed_chunks": result['failed_chunks'],
+                "timings_ms": result['timings_ms'],
+                "deduplicated": result.get('deduplicated', False)
             })
         else:
             return jsonify({
                 "success": False,
-                "error": result.get('error', 'Lỗi xử lý file')
+                "error": result.get('error', 'Lỗi xử lý file'),
+                "failed_chunks": result.get('failed_chunks', [])
             }), 500
 
+    except (UploadTooLarge, RequestEntityTooLarge):
+        return upload_too_large()
     except Exception as e:
         logging.error(f"Error processing file: {str(e)}")
         return jsonify({
             "success": False,
             "error": str(e)
         }), 500
+    finally:
+        if not handed_off:
+            upload_limiter.release(reservation)
+
+@app.route("/api/process-file/jobs/<job_id>", methods=["GET"])
+def get_process_file_job(job_id):
+    if not job_queue:
+        return jsonify({
+            "success": False,
+            "error": "FileProcessor chưa được khởi tạo"
+        }), 503
+
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({
+            "success": False,
+            "error": "Không tìm thấy job"
+        }), 404
+
+    return jsonify({"success": True, "job": job})
+
+@app.route("/api/process-file/jobs/<job_id>/result", methods=["GET"])
+def get_process_file_job_result(job_id):
+    if not job_queue:
+        return jsonify({
+            "success": False,
+            "error": "FileProcessor chưa được khởi tạo"
+        }), 503
+
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({
+            "success": False,
+            "error": "Không tìm thấy job"
+        }), 404
+
+    if job['status'] in ('queued', 'running'):
+        return jsonify({
+            "success": False,
+            "status": job['status'],
+            "stage": job['stage'],
+            "progress": job['progress']
+        }), 202
+
+    result = job['result']
+    if job['status'] == 'failed':
+        return jsonify({
+            "success": False,
+            "status": job['status'],
+            "error": job['error'],
+            "failed_chunks": result.get('failed_chunks', [])
+        }), 500
+
+    return jsonify({
+        "success": True,
+        "status": job['status'],
+        "content": result['content'],
+        "summary": result['summary'],
+        "summary_status": result['summary_status'],
+        "vector_id": result['vector_id'],
+        "chunks_count": result['chunks_count'],
+        "failed_chunks": result['failed_chunks'],
+        "timings_ms": result['timings_ms'],
+        "deduplicated": result.get('deduplicated', False)
+    })
+
+@app.route("/api/file-summary/<file_id>", methods=["GET"])
+def get_file_summary(file_id):
+    if not file_processor:
+        return jsonify({
+            "success": False,
+            "error": "FileProcessor chưa được khởi tạo"
+        }), 503
+
+    try:
+        wait = min(float(request.args.get('wait', 0)), 30)
+        summary = file_processor.get_file_summary(file_id, wait=wait)
+        if summary['status'] == 'not_found':
+            return jsonify({
+                "success": False,
+                "error": "Không tìm thấy tóm tắt cho file"
+            }), 404
+        return jsonify({"success": True, **summary})
+    except Exception as e:
+        logging.error(f"Error getting file summary: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
 
 @app.route("/api/delete-vector/<vector_id>", methods=["DELETE"])
 def delete_vector(vector_id):
@@ -173,6 +557,45 @@ def delete_vector(vector_id):
             "error": str(e)
         }), 500
 
+@app.route("/api/delete-vectors", methods=["POST"])
+def delete_vectors():
+    if not file_processor:
+        return jsonify({
+            "success": False,
+            "error": "FileProcessor chưa được khởi tạo"
+        }), 503
+
+    data = request.get_json(silent=True) or {}
+    id_lists = {}
+    for name in ('file_ids', 'vector_ids'):
+        values = data.get(name)
+        if values is None:
+            continue
+        if not isinstance(values, list):
+            return jsonify({"success": False, "error": f"{name} phải là danh sách"}), 400
+        if len(values) > DELETE_VECTORS_MAX_IDS:
+            return jsonify({"success": False, "error": f"{name} tối đa {DELETE_VECTORS_MAX_IDS} phần tử"}), 400
+        id_lists[name] = list(dict.fromkeys(str(value) for value in values))
+    filters = scope_fields(data)
+    if data.get('content_hash'):
+        filters['content_hash'] = str(data['content_hash'])
+    # Không cho phép xóa toàn bộ kho khi thiếu điều kiện
+    if not filters and not any(id_lists.values()):
+        return jsonify({
+            "success": False,
+            "error": f"Cần file_ids, vector_ids hoặc một trong {', '.join(SCOPE_FIELDS)}, content_hash"
+        }), 400
+
+    try:
+        report = file_processor.delete_vectors(filters=filters, **id_lists)
+        return jsonify({"success": True, **report})
+    except Exception as e:
+        logging.error(f"Error bulk deleting vectors: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
 @app.route("/api/summarize-text", methods=["POST"])
 def summarize_text():
     if not bot:
@@ -204,7 +627,7 @@ def summarize_text():
 @app.route("/api/ai-chat/history/<session_id>", methods=["GET"])
 def get_chat_history(session_id):
     try:
-        history = chat_history.get(session_id, [])
+        history = session_store.get(session_id)
         return jsonify({
             "session_id": session_id,
             "history": history,
@@ -217,8 +640,7 @@ def get_chat_history(session_id):
 @app.route("/api/ai-chat/history/<session_id>", methods=["DELETE"])
 def clear_history(session_id):
     try:
-        if session_id in chat_history:
-            del chat_history[session_id]
+        session_store.delete(session_id)
         return jsonify({"message": "History cleared successfully"})
     except Exception as e:
         logging.error(f"Error clearing history: {str(e)}")
@@ -233,10 +655,29 @@ def get_file_vectors():
         }), 503
 
     try:
-        vectors_info = file_processor.get_all_vectors_info()
+        limit = int(request.args.get('limit', FILE_VECTORS_PAGE_SIZE))
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        return jsonify({"success": False, "error": "limit/offset phải là số nguyên"}), 400
+    if not 1 <= limit <= FILE_VECTORS_MAX_PAGE_SIZE or offset < 0:
+        return jsonify({
+            "success": False,
+            "error": f"limit phải từ 1 đến {FILE_VECTORS_MAX_PAGE_SIZE} và offset không âm"
+        }), 400
+
+    try:
+        filters = scope_fields(request.args)
+        if request.args.get('content_hash'):
+            filters['content_hash'] = request.args['content_hash']
+        vectors_info, total = file_processor.list_file_vectors(
+            filters, request.args.get('q', '').strip(), limit, offset
+        )
         return jsonify({
             "success": True,
-            "vectors": vectors_info
+            "vectors": vectors_info,
+            "total": total,
+            "limit": limit,
+            "offset": offset
         })
     except Exception as e:
         logging.error(f"Error getting vectors: {str(e)}")
@@ -325,10 +766,41 @@ def health_check():
     return jsonify({
         "status": "healthy" if bot else "unhealthy",
         "file_processor": "ready" if file_processor else "not ready",
+        "ingestion_jobs": job_queue.stats() if job_queue else {},
+        "extraction_pool": file_processor.extraction_pool.stats()
+        if file_processor and file_processor.extraction_pool else None,
+        "content_index": file_processor.content_index.stats()
+        if file_processor and file_processor.content_index else None,
+        "lexical_index": bot.lexical_index.stats() if bot and bot.lexical_index else None,
+        "file_manifest": file_processor.file_manifest.stats()
+        if file_processor and file_processor.file_manifest else None,
         "timestamp": datetime.now().isoformat(),
-        "active_sessions": len(chat_history)
+        "active_sessions": session_store.count(),
+        "uploads": {
+            "in_flight_bytes": upload_limiter.in_flight,
+            "max_in_flight_bytes": upload_limiter.max_bytes,
+            "max_file_bytes": UPLOAD_MAX_BYTES
+        },
+        "answer_cache": bot.answer_cache.stats() if bot else {}
     })
 
+@app.route("/api/metrics", methods=["GET"])
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route("/api/answer-cache", methods=["GET"])
+def get_answer_cache_stats():
+    if not bot:
+        return jsonify({"error": "Dịch vụ AI chưa sẵn sàng"}), 503
+    return jsonify({"success": True, "stats": bot.answer_cache.stats()})
+
+@app.route("/api/answer-cache", methods=["DELETE"])
+def clear_answer_cache():
+    if not bot:
+        return jsonify({"error": "Dịch vụ AI chưa sẵn sàng"}), 503
+    bot.answer_cache.clear()
+    return jsonify({"success": True, "message": "Answer cache cleared"})
+
 @app.route("/api/quick-actions", methods=["GET"])
 def get_quick_actions():
     actions = [
@@ -396,11 +868,27 @@ def update_system_knowledge():
 
 @app.route("/api/reindex-knowledge", methods=["POST"])
 def reindex_knowledge():
+    if is_truthy(request.args.get('dry_run', '')):
+        try:
+            report = create_vector_store(dry_run=True)
+            return jsonify({"success": True, "report": report})
+        except Exception as e:
+            logging.error(f"Error during re-index dry run: {e}")
+            return jsonify({"success": False, "error": str(e)}), 500
+
     def run_indexing():
         try:
             logging.info("Starting background re-indexing...")
-            create_vector_store()
-            logging.info("Background re-indexing finished.")
+            report = create_vector_store()
+            if bot and report and report['version']:
+                bot.answer_cache.set_version(report['version'])
+            if report:
+                logging.info(
+                    f"Background re-indexing finished: {len(report['added'])} added, "
+                    f"{len(report['changed'])} changed, {len(report['removed'])} removed"
+                )
+            else:
+                logging.error("Background re-indexing failed.")
         except Exception as e:
             logging.error(f"Error during background re-indexing: {e}")
 
@@ -416,6 +904,12 @@ def reindex_knowledge():
 def not_found(error):
     return jsonify({"error": "Endpoint not found"}), 404
 
+@app.errorhandler(413)
+def request_too_large(error):
+    if request.endpoint == 'process_file':
+        return upload_too_large()
+    return jsonify({"error": "Request entity too large"}), 413
+
 @app.errorhandler(500)
 def internal_error(error):
     return jsonify({"error": "Internal server error"}), 500
@@ -0,0 +1,125 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from model.metrics import CACHE_REQUESTS
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "86400"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+
+
+class SemanticAnswerCache:
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, ttl: int = ANSWER_CACHE_TTL,
+                 max_entries: int = ANSWER_CACHE_MAX_ENTRIES, version: Optional[str] = None):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._matrix = None
+        self._matrix_ids = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _rebuild_matrix(self):
+        self._matrix_ids = list(self._entries.keys())
+        if self._matrix_ids:
+            self._matrix = np.stack([self._entries[i]['vector'] for i in self._matrix_ids])
+        else:
+            self._matrix = None
+
+    def _drop_expired(self):
+        cutoff = time.time() - self.ttl
+        expired = [
+            entry_id for entry_id, entry in self._entries.items()
+            if entry['created_at'] < cutoff or entry['version'] != self.version
+        ]
+        for entry_id in expired:
+            del self._entries[entry_id]
+        if expired:
+            self._matrix = None
+
+    def lookup(self, embedding: List[float]) -> Optional[Dict[str, Any]]:
+        query = self._normalize(embedding)
+        with self._lock:
+            self._drop_expired()
+            if self._entries and self._matrix is None:
+                self._rebuild_matrix()
+
+            if self._matrix is None or self._matrix.shape[1] != query.shape[0]:
+                self.misses += 1
+                CACHE_REQUESTS.inc(cache='answer', result='miss')
+                return None
+
+            scores = self._matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                CACHE_REQUESTS.inc(cache='answer', result='miss')
+                return None
+
+            entry_id = self._matrix_ids[best]
+            entry = self._entries[entry_id]
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            CACHE_REQUESTS.inc(cache='answer', result='hit')
+            return {
+                'question': entry['question'],
+                'reply': entry['reply'],
+                'sources': entry['sources'],
+                'similarity': float(scores[best])
+            }
+
+    def store(self, embedding: List[float], question: str, reply: str, sources: Optional[list] = None):
+        with self._lock:
+            self._entries[self._next_id] = {
+                'vector': self._normalize(embedding),
+                'question': question,
+                'reply': reply,
+                'sources': sources or [],
+                'version': self.version,
+                'created_at': time.time()
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def set_version(self, version: Optional[str]):
+        with self._lock:
+            if version != self.version:
+                logging.info(f"Knowledge version changed to {version}, invalidating answer cache")
+                self.version = version
+                self._entries.clear()
+                self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+                'entries': len(self._entries),
+                'version': self.version,
+                'threshold': self.threshold
+            }
@@ -1,11 +1,26 @@
 import json
 import os
+import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
 from dotenv import load_dotenv
-from google import genai
-from google.genai import types
 from google.genai.errors import APIError
-import chromadb
+from model.vector_store import (
+    get_vector_store, KNOWLEDGE_CHROMA_PATH, FILES_CHROMA_PATH, KNOWLEDGE_COLLECTION, FILES_COLLECTION,
+    CHATBOT_PREFORK, SearchHit
+)
+from model.embedding_cache import get_embedding_cache
+from model.embedding_batcher import BatchEmbedder
+from model.content_index import get_content_index
+from model.retrieval_scope import RetrievalScope, ResolvedScope
+from model.providers import get_provider
+from model.answer_cache import SemanticAnswerCache
+from model.lexical_index import (
+    get_lexical_index, reciprocal_rank_fusion, LEXICAL_SKIP_EMBEDDING, HYBRID_CANDIDATES
+)
+from model.context_builder import build_context, KNOWLEDGE_CONTEXT_TOKENS, FILES_CONTEXT_TOKENS
+from model.metrics import STAGE_SECONDS, ERRORS, RETRIEVALS, CONTEXT_TOKENS
 
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 dotenv_path = os.path.join(parent_dir, 'backend', '.env')
@@ -13,58 +28,171 @@ load_dotenv(dotenv_path=dotenv_path)
 
 logging.basicConfig(level=logging.INFO)
 
+# Số câu trả lời được sinh đồng thời trong một yêu cầu hỏi đáp hàng loạt
+BATCH_CHAT_CONCURRENCY = int(os.getenv("BATCH_CHAT_CONCURRENCY", "4"))
+
 class ChatBot:
     def __init__(self, data_file="UNUSED"):
         try:
-            api_key = os.getenv("GEMINI_API_KEY")
-            if not api_key:
-                raise ValueError("GEMINI_API_KEY environment variable not set.")
-
-            self.client = genai.Client(api_key=api_key)
+            self.provider = get_provider()
             self.model = "gemini-1.5-flash"
             self.embedding_model = 'text-embedding-004'
-            self.safety_settings = [
-                types.SafetySetting(
-                    category=types.HarmCategory.HARM_CATEGORY_HARASSMENT,
-                    threshold=types.HarmBlockThreshold.BLOCK_NONE,
-                ),
-                types.SafetySetting(
-                    category=types.HarmCategory.HARM_CATEGORY_HATE_SPEECH,
-                    threshold=types.HarmBlockThreshold.BLOCK_NONE,
-                ),
-            ]
+            self.embedding_cache = get_embedding_cache()
+            self.embedding_cache_key = self.provider.embedding_key(self.embedding_model)
+            self.batch_embedder = BatchEmbedder(self._embed_texts)
+            self.answer_cache = SemanticAnswerCache()
+            self.lexical_index = get_lexical_index()
+            self.content_index = get_content_index()
 
         except Exception as e:
-            logging.error(f"Failed to initialize Gemini Client: {e}")
+            logging.error(f"Failed to initialize AI provider: {e}")
             raise
 
+        self.knowledge_store = None
+        self.files_store = None
+        if not CHATBOT_PREFORK:
+            self.warm_up()
+
+    def warm_up(self):
         try:
-            CHROMA_PATH = "chroma_db"
-            self.chroma_client = chromadb.PersistentClient(path=CHROMA_PATH)
-            self.collection = self.chroma_client.get_collection(name="chatbot_knowledge")
-            logging.info(f"Loaded Knowledge Vector Store with {self.collection.count()} documents.")
-            if self.collection.count() == 0:
-                logging.warning("Knowledge Vector Store rỗng. Vui lòng chạy python index_data.py để tạo lại dữ liệu.")
+            self.knowledge_store = get_vector_store(KNOWLEDGE_CHROMA_PATH)
+            if self.knowledge_store.has_collection(KNOWLEDGE_COLLECTION):
+                count = self.knowledge_store.count(KNOWLEDGE_COLLECTION)
+                logging.info(f"Loaded Knowledge Vector Store with {count} documents.")
+                if count == 0:
+                    logging.warning("Knowledge Vector Store rỗng. Vui lòng chạy python index_data.py để tạo lại dữ liệu.")
+            else:
+                logging.error("ChromaDB knowledge collection not found. Đảm bảo đã chạy index_data.py.")
+            self._sync_lexical(self.knowledge_store, KNOWLEDGE_COLLECTION)
 
         except Exception as e:
-            logging.error(f"Failed to load ChromaDB knowledge collection: {e}. Đảm bảo đã chạy index_data.py.")
-            self.collection = None
+            logging.error(f"Failed to load ChromaDB knowledge store: {e}. Đảm bảo đã chạy index_data.py.")
+            self.knowledge_store = None
 
         try:
-            FILES_CHROMA_PATH = "chroma_db_files"
-            self.files_chroma_client = chromadb.PersistentClient(path=FILES_CHROMA_PATH)
-            try:
-                self.files_collection = self.files_chroma_client.get_collection(name="uploaded_files")
-                logging.info(f"Loaded Files Vector Store with documents.")
-            except:
-                self.files_collection = self.files_chroma_client.create_collection(
-                    name="uploaded_files",
-                    metadata={"hnsw:space": "cosine"}
-                )
-                logging.info("Created new Files Vector Store.")
+            self.files_store = get_vector_store(FILES_CHROMA_PATH)
+            self.files_store.collection(FILES_COLLECTION)
+            logging.info(f"Loaded Files Vector Store with {self.files_store.count(FILES_COLLECTION)} documents.")
+            self._sync_lexical(self.files_store, FILES_COLLECTION)
         except Exception as e:
             logging.error(f"Failed to initialize files collection: {e}")
-            self.files_collection = None
+            self.files_store = None
+
+    def _sync_lexical(self, store, collection: str):
+        if not self.lexical_index or not store.has_collection(collection):
+            return
+        try:
+            self.lexical_index.sync(store, collection)
+        except Exception as e:
+            ERRORS.inc(component='lexical_index')
+            logging.error(f"Failed to sync lexical index for {collection}: {e}")
+
+    def _exact_hits(self, store, collection: str, message: str, n_results: int,
+                    scope: Optional[ResolvedScope] = None) -> list[SearchHit]:
+        # Mã trong câu hỏi chỉ nằm trong vài chunk: dùng luôn kết quả BM25, không cần embedding câu hỏi
+        if not self.lexical_index or not LEXICAL_SKIP_EMBEDDING:
+            return []
+        # Phạm vi không giới hạn trước được trên chỉ mục thì độ chọn lọc của mã không còn ý nghĩa
+        if scope and scope.prefixes is None:
+            return []
+        try:
+            with STAGE_SECONDS.time(stage='lexical_search'):
+                matches = self.lexical_index.exact_matches(
+                    collection, message, n_results, scope.prefixes if scope else None
+                )
+            if not matches:
+                return []
+            hits = self._load_hits(
+                store, collection, reciprocal_rank_fusion([[doc_id for doc_id, _ in matches]]),
+                where=scope.where if scope else None
+            )
+        except Exception as e:
+            ERRORS.inc(component='lexical_index')
+            logging.error(f"Lexical search on {collection} failed: {e}")
+            return []
+        if hits:
+            RETRIEVALS.inc(collection=collection, mode='lexical')
+        return hits
+
+    def _hybrid_hits(self, store, collection: str, message: str, query_embedding: list[float],
+                     n_results: int, scope: Optional[ResolvedScope] = None) -> list[SearchHit]:
+        return self._hybrid_hits_many(store, collection, [message], [query_embedding], n_results, scope)[0]
+
+    def _hybrid_hits_many(self, store, collection: str, messages: list[str], query_embeddings: list[list[float]],
+                          n_results: int, scope: Optional[ResolvedScope] = None) -> list[list[SearchHit]]:
+        # Một lệnh query Chroma cho mọi câu hỏi; BM25 chạy cục bộ theo từng câu
+        where = scope.where if scope else None
+        if not self.lexical_index:
+            RETRIEVALS.inc(len(messages), collection=collection, mode='vector')
+            return store.query(collection, query_embeddings, n_results=n_results, where=where)
+
+        candidates = max(n_results, HYBRID_CANDIDATES)
+        results = []
+        for message, vector_hits in zip(
+                messages, store.query(collection, query_embeddings, n_results=candidates, where=where)
+        ):
+            try:
+                with STAGE_SECONDS.time(stage='lexical_search'):
+                    lexical = self.lexical_index.search(
+                        collection, message, candidates, scope.prefixes if scope else None
+                    )
+            except Exception as e:
+                ERRORS.inc(component='lexical_index')
+                logging.error(f"Lexical search on {collection} failed: {e}")
+                RETRIEVALS.inc(collection=collection, mode='vector')
+                results.append(vector_hits[:n_results])
+                continue
+
+            RETRIEVALS.inc(collection=collection, mode='hybrid')
+            fused = reciprocal_rank_fusion([[hit.id for hit in vector_hits], [doc_id for doc_id, _ in lexical]])
+            # Có phạm vi thì giữ toàn bộ ứng viên vì chunk chỉ khớp từ khóa có thể bị loại khi lọc lại
+            ranked = fused if where else fused[:n_results]
+            results.append(self._load_hits(store, collection, ranked, vector_hits, where)[:n_results])
+        return results
+
+    def _load_hits(self, store, collection: str, ranked: list[tuple[str, float]],
+                   known: list[SearchHit] = (), where: Optional[dict] = None) -> list[SearchHit]:
+        # Điểm hiển thị là điểm RRF đã chuẩn hóa (distance = 1 - score) để giữ nguyên cách dùng hit.similarity
+        documents = {hit.id: (hit.document, hit.metadata) for hit in known}
+        missing = [doc_id for doc_id, _ in ranked if doc_id not in documents]
+        if missing:
+            # Chunk lấy từ chỉ mục từ khóa được kiểm tra lại với phạm vi truy xuất của người hỏi
+            results = store.get(collection, ids=missing, where=where, include=['documents', 'metadatas'])
+            for doc_id, document, metadata in zip(results['ids'], results['documents'], results['metadatas']):
+                documents[doc_id] = (document, metadata or {})
+
+        hits = []
+        for doc_id, score in ranked:
+            # Chunk vừa bị xóa khỏi Chroma nhưng chỉ mục từ khóa chưa kịp cập nhật
+            if doc_id not in documents:
+                continue
+            document, metadata = documents[doc_id]
+            hits.append(SearchHit(id=doc_id, document=document, distance=1 - score, metadata=metadata))
+        return hits
+
+    def _embed_texts(self, texts: list[str]) -> list[list[float]]:
+        return self.provider.embed(self.embedding_model, texts)
+
+    def _embed_query(self, message: str) -> list[float]:
+        with STAGE_SECONDS.time(stage='query_embedding'):
+            return self.embedding_cache.get_or_embed(self.embedding_cache_key, [message], self._embed_texts)[0]
+
+    def _embed_queries(self, messages: list[str]) -> list[list[float]]:
+        # Các câu chưa có trong cache được embedding chung (chia lô theo EMBEDDING_BATCH_SIZE)
+        if len(messages) == 1:
+            return [self._embed_query(messages[0])]
+        with STAGE_SECONDS.time(stage='query_embedding'):
+            return self.embedding_cache.get_or_embed(self.embedding_cache_key, messages, self._embed_batched)
+
+    def _embed_batched(self, texts: list[str]) -> list[list[float]]:
+        vectors, errors = self.batch_embedder.embed(texts)
+        if errors:
+            raise RuntimeError(f"Embedding failed for {len(errors)} questions: {next(iter(errors.values()))}")
+        return vectors
+
+    def _generate(self, prompt: str, stage: str = 'generation', **kwargs) -> str:
+        with STAGE_SECONDS.time(stage=stage):
+            return self.provider.generate(self.model, prompt, **kwargs)
 
     def _build_system_instruction(self, context_type="knowledge") -> str:
         if context_type == "files":
@@ -82,38 +210,67 @@ class ChatBot:
                 "Nếu câu hỏi nằm ngoài phạm vi, hãy trả lời chính xác và duy nhất bằng câu: 'Xin lỗi, tôi chỉ có thể hỗ trợ các vấn đề liên quan đến hệ thống quản lý minh chứng.'\n"
             )
 
-    def get_reply(self, message: str) -> str:
-        if not self.collection:
-            return "Dịch vụ AI hoặc Kho Vector chưa được khởi tạo. Vui lòng kiểm tra API Key và đảm bảo đã chạy index_data.py."
+    def _prepare_knowledge(self, message: str) -> dict:
+        return self._prepare_knowledge_many([message])[0]
 
-        try:
-            embedding_response = self.client.models.embed_content(
-                model=self.embedding_model,
-                contents=[message]
-            )
-            query_embedding = embedding_response.embedding
+    def _prepare_knowledge_many(self, messages: list[str]) -> list[dict]:
+        if not self.knowledge_store or not self.knowledge_store.has_collection(KNOWLEDGE_COLLECTION):
+            return [{'reply': "Dịch vụ AI hoặc Kho Vector chưa được khởi tạo. Vui lòng kiểm tra API Key và đảm bảo đã chạy index_data.py.", 'failed': True}
+                    for _ in messages]
 
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=3,
-                include=['documents', 'distances', 'metadatas']
-            )
-
-            retrieved_documents = results['documents'][0]
-            distances = results['distances'][0]
+        prepared = [None] * len(messages)
+        try:
+            hits = [self._exact_hits(self.knowledge_store, KNOWLEDGE_COLLECTION, message, 3) for message in messages]
+            # Câu trả lời được bằng mã thì không gọi API embedding, nhưng nếu vector câu hỏi đã có trong cache
+            # thì vẫn dùng cache câu trả lời
+            embeddings = [
+                self.embedding_cache.get(self.embedding_cache_key, message) if found else None
+                for message, found in zip(messages, hits)
+            ]
+            pending = [i for i, found in enumerate(hits) if not found]
+            if pending:
+                for i, query_embedding in zip(pending, self._embed_queries([messages[i] for i in pending])):
+                    embeddings[i] = query_embedding
+
+            for i, query_embedding in enumerate(embeddings):
+                if query_embedding is None:
+                    continue
+                cached = self.answer_cache.lookup(query_embedding)
+                if cached:
+                    logging.info(f"Answer cache hit ({cached['similarity']:.3f}) for: {messages[i][:50]}")
+                    prepared[i] = {'reply': cached['reply'], 'sources': cached['sources'], 'cached': True}
+
+            search = [i for i in pending if prepared[i] is None]
+            if search:
+                for i, found in zip(search, self._hybrid_hits_many(
+                        self.knowledge_store, KNOWLEDGE_COLLECTION, [messages[i] for i in search],
+                        [embeddings[i] for i in search], 3
+                )):
+                    hits[i] = found
 
         except Exception as e:
+            ERRORS.inc(component='knowledge_retrieval')
             logging.error(f"Error during Knowledge Vector Retrieval: {e}")
-            return "Xin lỗi, tôi gặp lỗi khi tìm kiếm trong kho kiến thức. Vui lòng thử lại."
-
-        context_chunks = []
-        for doc, dist in zip(retrieved_documents, distances):
-            similarity_score = 1 - dist
-            context_chunks.append(f"[Score: {similarity_score:.3f}] - {doc}")
-
-        context = "\n".join(context_chunks)
+            return [{'reply': "Xin lỗi, tôi gặp lỗi khi tìm kiếm trong kho kiến thức. Vui lòng thử lại.", 'failed': True}
+                    for _ in messages]
+
+        return [
+            entry or self._knowledge_prompt(message, found, query_embedding)
+            for entry, message, found, query_embedding in zip(prepared, messages, hits, embeddings)
+        ]
+
+    def _knowledge_prompt(self, message: str, hits: list[SearchHit], query_embedding: Optional[list[float]]) -> dict:
+        prompt_started = time.perf_counter()
+        built = build_context(
+            hits, KNOWLEDGE_CONTEXT_TOKENS, lambda block: f"[Score: {block.score:.3f}] - {block.text}"
+        )
+        CONTEXT_TOKENS.observe(built.tokens, collection=KNOWLEDGE_COLLECTION)
+        sources = [
+            {'source': block.metadata.get('source', 'Unknown'), 'score': round(block.score, 3)}
+            for block in built.blocks
+        ]
 
-        system_prompt = self._build_system_instruction("knowledge")
+        context = "\n".join(built.parts)
 
         final_prompt = (
             f"**NGỮ CẢNH (CONTEXT) - Chỉ trả lời dựa trên thông tin này:**\n"
@@ -121,77 +278,76 @@ class ChatBot:
             f"**CÂU HỎI NGƯỜI DÙNG (USER QUESTION):** {message}\n"
             "**TRẢ LỜI:**"
         )
+        STAGE_SECONDS.observe(time.perf_counter() - prompt_started, stage='prompt_build')
+
+        return {
+            'prompt': final_prompt,
+            'system_prompt': self._build_system_instruction("knowledge"),
+            'max_output_tokens': 250,
+            'sources': sources,
+            'context_tokens': built.tokens,
+            'query_embedding': query_embedding
+        }
+
+    def _finalize_knowledge_reply(self, reply: str) -> str:
+        unrelated_phrase = "xin lỗi, tôi chỉ có thể hỗ trợ các vấn đề liên quan đến hệ thống quản lý minh chứng"
+        if unrelated_phrase in reply.lower():
+            return "Xin lỗi, tôi chưa hiểu câu hỏi này vì nó không liên quan đến Hệ thống Quản lý Minh chứng. Vui lòng đưa ra câu hỏi đúng hoặc chọn từ các gợi ý."
+        return reply
+
+    def _prepare_files(self, message: str, scope: Optional[RetrievalScope] = None) -> dict:
+        return self._prepare_files_many([message], scope)[0]
+
+    def _prepare_files_many(self, messages: list[str], scope: Optional[RetrievalScope] = None) -> list[dict]:
+        if not self.files_store:
+            return [{'reply': "Dịch vụ AI hoặc Kho Files chưa được khởi tạo. Vui lòng kiểm tra cấu hình.", 'failed': True}
+                    for _ in messages]
 
         try:
-            model = self.client.models.generate_content(
-                model=self.model,
-                contents=final_prompt,
-                config=types.GenerateContentConfig(
-                    system_instruction=system_prompt,
-                    temperature=0.3,
-                    max_output_tokens=250,
-                    safety_settings=self.safety_settings
-                )
-            )
-
-            reply = model.text.strip()
-
-            unrelated_phrase = "xin lỗi, tôi chỉ có thể hỗ trợ các vấn đề liên quan đến hệ thống quản lý minh chứng"
-            if unrelated_phrase in reply.lower():
-                return "Xin lỗi, tôi chưa hiểu câu hỏi này vì nó không liên quan đến Hệ thống Quản lý Minh chứng. Vui lòng đưa ra câu hỏi đúng hoặc chọn từ các gợi ý."
-
-            return reply
-
-        except APIError as e:
-            logging.error(f"Error calling Gemini API: {e}")
-            raise RuntimeError("Gemini API call failed.")
-        except Exception as e:
-            logging.error(f"Error in get_reply: {e}")
-            raise RuntimeError("Gemini API call failed due to an unknown error.")
-
-    def get_reply_from_files(self, message: str) -> str:
-        if not self.files_collection:
-            return "Dịch vụ AI hoặc Kho Files chưa được khởi tạo. Vui lòng kiểm tra cấu hình."
-
-        try:
-            embedding_response = self.client.models.embed_content(
-                model=self.embedding_model,
-                contents=[message]
-            )
-            query_embedding = embedding_response.embedding
-
-            results = self.files_collection.query(
-                query_embeddings=[query_embedding],
-                n_results=5,
-                include=['documents', 'distances', 'metadatas']
-            )
-
-            if not results['documents'][0]:
-                return "Không tìm thấy thông tin liên quan trong các file đã upload. Vui lòng upload file chứa thông tin bạn cần hỏi."
-
-            retrieved_documents = results['documents'][0]
-            distances = results['distances'][0]
-            metadatas = results['metadatas'][0]
+            resolved = scope.resolve(self.content_index) if scope else None
+            hits = [self._exact_hits(self.files_store, FILES_COLLECTION, message, 5, resolved) for message in messages]
+            pending = [i for i, found in enumerate(hits) if not found]
+            if pending:
+                texts = [messages[i] for i in pending]
+                for i, found in zip(pending, self._hybrid_hits_many(
+                        self.files_store, FILES_COLLECTION, texts, self._embed_queries(texts), 5, resolved
+                )):
+                    hits[i] = found
+            if resolved:
+                for found in hits:
+                    for hit in found:
+                        hit.metadata = resolved.present(hit.metadata)
 
         except Exception as e:
+            ERRORS.inc(component='files_retrieval')
             logging.error(f"Error during Files Vector Retrieval: {e}")
-            return "Xin lỗi, tôi gặp lỗi khi tìm kiếm trong các file đã upload."
-
-        context_chunks = []
-        files_referenced = set()
-
-        for doc, dist, metadata in zip(retrieved_documents, distances, metadatas):
-            similarity_score = 1 - dist
-            filename = metadata.get('filename', 'Unknown')
-            files_referenced.add(filename)
-            context_chunks.append(
-                f"[File: {filename} | Score: {similarity_score:.3f}]\n{doc}"
-            )
-
-        context = "\n\n".join(context_chunks)
-        files_list = ", ".join(files_referenced)
-
-        system_prompt = self._build_system_instruction("files")
+            return [{'reply': "Xin lỗi, tôi gặp lỗi khi tìm kiếm trong các file đã upload.", 'failed': True}
+                    for _ in messages]
+
+        return [
+            self._files_prompt(message, found) if found else
+            {'reply': "Không tìm thấy thông tin liên quan trong các file đã upload. Vui lòng upload file chứa thông tin bạn cần hỏi."}
+            for message, found in zip(messages, hits)
+        ]
+
+    def _files_prompt(self, message: str, hits: list[SearchHit]) -> dict:
+        prompt_started = time.perf_counter()
+        built = build_context(
+            hits, FILES_CONTEXT_TOKENS,
+            lambda block: f"[File: {block.metadata.get('filename', 'Unknown')} | Score: {block.score:.3f}]\n{block.text}"
+        )
+        CONTEXT_TOKENS.observe(built.tokens, collection=FILES_COLLECTION)
+        sources = [
+            {
+                'filename': block.metadata.get('filename', 'Unknown'),
+                'file_id': block.metadata.get('file_id', ''),
+                'score': round(block.score, 3)
+            }
+            for block in built.blocks
+        ]
+
+        context = "\n\n".join(built.parts)
+        files_list = ", ".join(dict.fromkeys(source['filename'] for source in sources))
 
         final_prompt = (
             f"**NGỮ CẢNH TỪ CÁC FILE ĐÃ UPLOAD:**\n"
@@ -200,33 +356,158 @@ class ChatBot:
             f"**CÂU HỎI NGƯỜI DÙNG:** {message}\n"
             f"**TRẢ LỜI (nhớ trích dẫn nguồn file khi cần thiết):**"
         )
+        STAGE_SECONDS.observe(time.perf_counter() - prompt_started, stage='prompt_build')
+
+        return {
+            'prompt': final_prompt,
+            'system_prompt': self._build_system_instruction("files"),
+            'max_output_tokens': 400,
+            'sources': sources,
+            'context_tokens': built.tokens,
+            'files_list': files_list
+        }
+
+    def _finalize_files_reply(self, reply: str, prepared: dict) -> str:
+        if prepared['files_list']:
+            reply += f"\n\n📎 *Nguồn tham khảo: {prepared['files_list']}*"
+        return reply
+
+    def _generation_kwargs(self, prepared: dict) -> dict:
+        return {
+            'system_instruction': prepared['system_prompt'],
+            'temperature': 0.3,
+            'max_output_tokens': prepared['max_output_tokens']
+        }
+
+    def _answer(self, message: str, prepared: dict, search_type: str = "knowledge") -> str:
+        text = self._generate(prepared['prompt'], **self._generation_kwargs(prepared))
+        if search_type == "files":
+            return self._finalize_files_reply(text.strip(), prepared)
+
+        reply = self._finalize_knowledge_reply(text.strip())
+        if prepared['query_embedding'] is not None:
+            self.answer_cache.store(prepared['query_embedding'], message, reply, prepared['sources'])
+        return reply
+
+    def get_reply(self, message: str, info: Optional[dict] = None) -> str:
+        # info (nếu có) nhận thêm số token ngữ cảnh đã đưa vào prompt
+        prepared = self._prepare_knowledge(message)
+        if info is not None:
+            info['context_tokens'] = prepared.get('context_tokens', 0)
+        if 'reply' in prepared:
+            return prepared['reply']
 
         try:
-            model = self.client.models.generate_content(
-                model=self.model,
-                contents=final_prompt,
-                config=types.GenerateContentConfig(
-                    system_instruction=system_prompt,
-                    temperature=0.3,
-                    max_output_tokens=400,
-                    safety_settings=self.safety_settings
-                )
-            )
+            return self._answer(message, prepared)
 
-            reply = model.text.strip()
+        except APIError as e:
+            ERRORS.inc(component='generation')
+            logging.error(f"Error calling Gemini API: {e}")
+            raise RuntimeError("Gemini API call failed.")
+        except Exception as e:
+            ERRORS.inc(component='generation')
+            logging.error(f"Error in get_reply: {e}")
+            raise RuntimeError("Gemini API call failed due to an unknown error.")
 
-            if files_referenced:
-                reply += f"\n\n📎 *Nguồn tham khảo: {files_list}*"
+    def get_reply_from_files(self, message: str, scope: Optional[RetrievalScope] = None,
+                             info: Optional[dict] = None) -> str:
+        prepared = self._prepare_files(message, scope)
+        if info is not None:
+            info['context_tokens'] = prepared.get('context_tokens', 0)
+        if 'reply' in prepared:
+            return prepared['reply']
 
-            return reply
+        try:
+            return self._answer(message, prepared, "files")
 
         except APIError as e:
+            ERRORS.inc(component='generation')
             logging.error(f"Error calling Gemini API for files: {e}")
             return "Xin lỗi, tôi gặp lỗi khi xử lý câu hỏi của bạn."
         except Exception as e:
+            ERRORS.inc(component='generation')
             logging.error(f"Error in get_reply_from_files: {e}")
             return "Xin lỗi, đã xảy ra lỗi không mong muốn."
 
+    def get_replies(self, messages: list[str], search_type: str = "knowledge",
+                    scope: Optional[RetrievalScope] = None) -> list[dict]:
+        # Hỏi đáp hàng loạt: embedding chung, một lệnh query Chroma, sinh câu trả lời song song có giới hạn.
+        # Kết quả giữ đúng thứ tự câu hỏi, lỗi được báo riêng cho từng câu.
+        if search_type == "files":
+            prepared = self._prepare_files_many(messages, scope)
+        else:
+            prepared = self._prepare_knowledge_many(messages)
+
+        def answer(i: int) -> dict:
+            entry = prepared[i]
+            if entry.get('failed'):
+                return {'error': entry['reply']}
+            result = {
+                'sources': entry.get('sources', []),
+                'cached': entry.get('cached', False),
+                'context_tokens': entry.get('context_tokens', 0)
+            }
+            if 'reply' in entry:
+                return dict(result, reply=entry['reply'])
+            try:
+                return dict(result, reply=self._answer(messages[i], entry, search_type))
+            except Exception as e:
+                ERRORS.inc(component='generation')
+                logging.error(f"Error in get_replies: {e}")
+                return {'error': "Xin lỗi, tôi gặp sự cố kỹ thuật. Vui lòng thử lại sau."}
+
+        if not messages:
+            return []
+        with ThreadPoolExecutor(max_workers=max(1, min(BATCH_CHAT_CONCURRENCY, len(messages)))) as executor:
+            return list(executor.map(answer, range(len(messages))))
+
+    def stream_reply(self, message: str, search_type: str = "knowledge",
+                     scope: Optional[RetrievalScope] = None) -> Iterator[dict]:
+        if search_type == "files":
+            prepared = self._prepare_files(message, scope)
+        else:
+            prepared = self._prepare_knowledge(message)
+
+        yield {
+            'type': 'meta',
+            'search_type': search_type,
+            'sources': prepared.get('sources', []),
+            'cached': prepared.get('cached', False),
+            'context_tokens': prepared.get('context_tokens', 0)
+        }
+
+        if 'reply' in prepared:
+            yield {'type': 'done', 'reply': prepared['reply']}
+            return
+
+        parts = []
+        started = time.perf_counter()
+        try:
+            for text in self.provider.generate_stream(
+                self.model, prepared['prompt'], **self._generation_kwargs(prepared)
+            ):
+                parts.append(text)
+                yield {'type': 'token', 'text': text}
+
+        except Exception as e:
+            ERRORS.inc(component='generation')
+            logging.error(f"Error in stream_reply: {e}")
+            yield {'type': 'error', 'error': "Xin lỗi, tôi gặp sự cố kỹ thuật. Vui lòng thử lại sau."}
+            return
+        finally:
+            # Bao gồm cả thời gian client đọc token, giống như người dùng cảm nhận
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage='generation_stream')
+
+        reply = "".join(parts).strip()
+        if search_type == "files":
+            reply = self._finalize_files_reply(reply, prepared)
+        else:
+            reply = self._finalize_knowledge_reply(reply)
+            if prepared['query_embedding'] is not None:
+                self.answer_cache.store(prepared['query_embedding'], message, reply, prepared['sources'])
+
+        yield {'type': 'done', 'reply': reply}
+
     def summarize_text(self, text: str, max_length: int = 500) -> str:
         try:
             if len(text) > 10000:
@@ -240,17 +521,14 @@ class ChatBot:
             
             Tóm tắt:"""
 
-            response = self.client.models.generate_content(
-                model=self.model,
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    temperature=0.3,
-                    max_output_tokens=max_length // 4,
-                    safety_settings=self.safety_settings
-                )
+            text = self._generate(
+                prompt,
+                stage='summarization',
+                temperature=0.3,
+                max_output_tokens=max_length // 4
             )
 
-            return response.text.strip()
+            return text.strip()
 
         except Exception as e:
             logging.error(f"Error in summarize_text: {e}")
@@ -267,23 +545,21 @@ class ChatBot:
         )
 
         try:
-            response = self.client.models.generate_content(
-                model=self.model,
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    temperature=0.5,
-                    max_output_tokens=100,
-                )
-            )
-
-            suggestions_text = response.text.strip()
+            suggestions_text = self._generate(
+                prompt,
+                stage='followup_generation',
+                temperature=0.5,
+                max_output_tokens=100
+            ).strip()
             suggestions = [s.strip() for s in suggestions_text.split('\n') if s.strip()]
 
             return suggestions[:3]
 
         except APIError as e:
+            ERRORS.inc(component='followup_generation')
             logging.error(f"Error generating follow-up suggestions: {e}")
             return []
         except Exception as e:
+            ERRORS.inc(component='followup_generation')
             logging.error(f"Error in get_contextual_followup: {e}")
             return []
\ No newline at end of file
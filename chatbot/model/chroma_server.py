@@ -0,0 +1,80 @@
+import os
+import json
+import time
+import logging
+import subprocess
+from typing import Dict, List
+
+import chromadb
+
+# Chroma PersistentClient giữ HNSW trong bộ nhớ từng process nên không thấy chunk do process khác ghi.
+# Khi chạy nhiều worker mà không có CHROMA_HOST, gunicorn.conf.py khởi động một Chroma server cục bộ cho mỗi
+# thư mục dữ liệu và các worker kết nối qua HTTP; dữ liệu cũ trong thư mục được dùng nguyên.
+CHROMA_CLI = os.getenv("CHROMA_CLI", "chroma")
+CHROMA_LOCAL_PORT = int(os.getenv("CHROMA_LOCAL_PORT", "8101"))
+CHROMA_LOCAL_STARTUP_TIMEOUT = float(os.getenv("CHROMA_LOCAL_STARTUP_TIMEOUT", "60"))
+# path -> port, do process cha đặt trước khi nạp app để các worker kế thừa
+CHROMA_LOCAL_SERVERS_ENV = "CHROMA_LOCAL_SERVERS"
+LOCAL_HOST = "127.0.0.1"
+
+
+def local_servers() -> Dict[str, int]:
+    try:
+        return json.loads(os.getenv(CHROMA_LOCAL_SERVERS_ENV, "") or "{}")
+    except ValueError:
+        logging.error(f"Invalid {CHROMA_LOCAL_SERVERS_ENV}, using embedded Chroma")
+        return {}
+
+
+def local_server_port(path: str) -> int:
+    return local_servers().get(os.path.abspath(path), 0)
+
+
+def start_local_servers(paths: List[str]) -> List[subprocess.Popen]:
+    servers = {}
+    processes = []
+    try:
+        for offset, path in enumerate(paths):
+            path = os.path.abspath(path)
+            port = CHROMA_LOCAL_PORT + offset
+            os.makedirs(path, exist_ok=True)
+            processes.append(subprocess.Popen(
+                [CHROMA_CLI, "run", "--path", path, "--host", LOCAL_HOST, "--port", str(port)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            ))
+            servers[path] = port
+        for process, port in zip(processes, servers.values()):
+            _wait_ready(process, port)
+    except Exception:
+        stop_local_servers(processes)
+        raise
+
+    os.environ[CHROMA_LOCAL_SERVERS_ENV] = json.dumps(servers)
+    logging.info(f"Started local Chroma servers: {servers}")
+    return processes
+
+
+def _wait_ready(process: subprocess.Popen, port: int):
+    deadline = time.monotonic() + CHROMA_LOCAL_STARTUP_TIMEOUT
+    while True:
+        if process.poll() is not None:
+            raise RuntimeError(f"Chroma server on port {port} exited with code {process.returncode}")
+        try:
+            chromadb.HttpClient(host=LOCAL_HOST, port=port).heartbeat()
+            return
+        except Exception:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Chroma server on port {port} did not start in {CHROMA_LOCAL_STARTUP_TIMEOUT}s")
+            time.sleep(0.2)
+
+
+def stop_local_servers(processes: List[subprocess.Popen]):
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
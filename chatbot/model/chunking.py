@@ -0,0 +1,302 @@
+import os
+import re
+from bisect import bisect_right
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+# (nội dung chunk, trang bắt đầu, trang kết thúc); trang là None với định dạng không phân trang
+Chunk = Tuple[str, Optional[int], Optional[int]]
+
+DELIMITERS = ['\n\n', '\n', '. ', '! ', '? ']
+
+# token: cắt theo số token ước lượng và ranh giới câu; chars: cắt theo số ký tự như trước
+CHUNKER = os.getenv("CHUNKER", "token")
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "512"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "64"))
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+LONG_WORD_PATTERN = re.compile(r"(?<=\w)\w{4}")
+# Kết thúc câu (kể cả dấu ba chấm, ngoặc/nháy đóng), đoạn trống, hoặc xuống dòng trước gạch đầu dòng/đánh số
+SENTENCE_BOUNDARY = re.compile(
+    r"[.!?…]+[\"”’»)\]]*\s+"
+    r"|\n[ \t]*\n\s*"
+    r"|\n(?=[ \t]*(?:[-•*+–]|\d+[.)]|[a-zA-Z][.)])\s)"
+)
+# Các cấp cắt câu quá dài: theo dòng, theo từ (cấp cuối là cắt theo số ký tự)
+SPLIT_LEVELS = (re.compile(r"[^\n]*\n+|[^\n]+"), re.compile(r"\S+\s*|\s+"))
+# Viết tắt thường gặp trong văn bản hành chính, học thuật tiếng Việt: không coi dấu chấm sau chúng là hết câu
+ABBREVIATIONS = {
+    'tp', 'q', 'p', 'tx', 'tt', 'ths', 'ts', 'pgs', 'gs', 'bs', 'ks', 'cn', 'nxb', 'tr', 'stt', 'sđt', 'đt',
+    'v.v', 'vv', 'ctv', 'ubnd', 'hđnd', 'mr', 'mrs', 'dr', 'no', 'e.g', 'i.e', 'etc'
+}
+
+
+def estimate_tokens(text: str) -> int:
+    # Ước lượng gần với tokenizer của mô hình embedding: mỗi âm tiết/dấu câu là một token, từ dài thêm một
+    # token cho mỗi 4 ký tự sau ký tự đầu. Thiên về ước lượng dư để chunk không vượt giới hạn thật.
+    return len(TOKEN_PATTERN.findall(text)) + len(LONG_WORD_PATTERN.findall(text))
+
+
+class StreamingChunker:
+    def __init__(self, chunk_size: int = 1000, overlap: int = 200):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self._buffer = ""
+        self._start = 0
+        # Vị trí bắt đầu của từng trang trong buffer, dùng để gán số trang cho chunk
+        self._page_offsets = []
+        self._pages = []
+
+    def _page_at(self, offset: int) -> Optional[int]:
+        index = bisect_right(self._page_offsets, offset) - 1
+        return self._pages[index] if index >= 0 else None
+
+    def _emit(self, end: int) -> Optional[Chunk]:
+        chunk = self._buffer[self._start:end].strip()
+        if not chunk:
+            return None
+        return chunk, self._page_at(self._start), self._page_at(max(self._start, end - 1))
+
+    def _compact(self):
+        if self._start == 0:
+            return
+        keep = max(0, bisect_right(self._page_offsets, self._start) - 1)
+        self._page_offsets = [max(0, offset - self._start) for offset in self._page_offsets[keep:]]
+        self._pages = self._pages[keep:]
+        self._buffer = self._buffer[self._start:]
+        self._start = 0
+
+    def feed(self, text: str, page: Optional[int] = None) -> List[Chunk]:
+        if self._buffer:
+            self._buffer += "\n"
+        self._page_offsets.append(len(self._buffer))
+        self._pages.append(page)
+        self._buffer += text
+
+        chunks = []
+        # Chỉ cắt khi chắc chắn còn nội dung phía sau, để kết quả giống hệt khi cắt cả văn bản một lần
+        while len(self._buffer) - self._start > self.chunk_size:
+            end = self._start + self.chunk_size
+            for delimiter in DELIMITERS:
+                delimiter_pos = self._buffer.rfind(delimiter, self._start + self.overlap, end)
+                if delimiter_pos != -1:
+                    end = delimiter_pos + len(delimiter)
+                    break
+
+            chunk = self._emit(end)
+            if chunk:
+                chunks.append(chunk)
+            self._start = end - self.overlap
+
+        self._compact()
+        return chunks
+
+    def finish(self) -> List[Chunk]:
+        chunk = self._emit(len(self._buffer))
+        self._buffer = ""
+        self._start = 0
+        self._page_offsets = []
+        self._pages = []
+        return [chunk] if chunk else []
+
+
+class TokenChunker:
+    # Một lượt duyệt: tách câu bằng regex trên phần văn bản mới, gom câu vào chunk tới khi chạm ngân sách
+    # token, phần chồng lấp là các câu cuối của chunk trước. Mỗi ký tự chỉ được quét và đếm token một lần.
+    def __init__(self, max_tokens: int = CHUNK_MAX_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                 count_tokens: Callable[[str], int] = estimate_tokens):
+        self.max_tokens = max(1, max_tokens)
+        self.overlap_tokens = max(0, min(overlap_tokens, self.max_tokens // 2))
+        self.count_tokens = count_tokens
+        # Câu dài bất thường (không có dấu câu) bị cắt cưỡng bức khi phần chờ vượt ngưỡng ký tự này
+        self._force_chars = self.max_tokens * 8
+        self._char_step = self.max_tokens * 4
+        self._split_depth = 0
+        self._pending = ""
+        self._scanned = 0
+        self._page_offsets = []
+        self._pages = []
+        # Các câu của chunk đang gom: (nội dung, số token, trang đầu, trang cuối)
+        self._units = []
+        self._unit_tokens = 0
+        self._fresh = False
+
+    def _page_at(self, offset: int) -> Optional[int]:
+        index = bisect_right(self._page_offsets, offset) - 1
+        return self._pages[index] if index >= 0 else None
+
+    def _is_boundary(self, match: re.Match) -> bool:
+        text = self._pending
+        if text[match.start()] != '.' or '\n' in match.group():
+            return True
+        following = text[match.end():match.end() + 1]
+        if following and following.islower():
+            return False
+        word_start = match.start()
+        while word_start > 0 and not text[word_start - 1].isspace():
+            word_start -= 1
+        word = text[word_start:match.start()].lower()
+        # Chữ cái đầu của tên viết tắt (N. V. A) và số thứ tự mục (Điều 1. ...)
+        if len(word) == 1 or word.isdigit():
+            return False
+        return word not in ABBREVIATIONS
+
+    def _emit(self) -> Optional[Chunk]:
+        text = "".join(unit[0] for unit in self._units).strip()
+        if not text or not self._fresh:
+            return None
+        return text, self._units[0][2], self._units[-1][3]
+
+    def _overlap(self) -> List[Tuple[str, int, Optional[int], Optional[int]]]:
+        carried = []
+        budget = self.overlap_tokens
+        for unit in reversed(self._units):
+            if unit[1] > budget:
+                break
+            carried.append(unit)
+            budget -= unit[1]
+        if not carried and budget and self._units:
+            # Câu cuối dài hơn phần chồng lấp: lấy các từ cuối của nó
+            text, _, page_start, page_end = self._units[-1]
+            words = []
+            for word in reversed(text.split()):
+                cost = self.count_tokens(word)
+                if cost > budget:
+                    break
+                words.append(word)
+                budget -= cost
+            if words:
+                tail = " ".join(reversed(words)) + " "
+                carried.append((tail, self.overlap_tokens - budget, page_end, page_end))
+        carried.reverse()
+        return carried
+
+    def _add(self, text: str, tokens: int, page_start: Optional[int], page_end: Optional[int],
+             chunks: List[Chunk]):
+        if self._units and self._unit_tokens + tokens > self.max_tokens:
+            chunk = self._emit()
+            if chunk:
+                chunks.append(chunk)
+            self._units = self._overlap()
+            self._unit_tokens = sum(unit[1] for unit in self._units)
+            self._fresh = False
+            if self._unit_tokens + tokens > self.max_tokens:
+                self._units = []
+                self._unit_tokens = 0
+        self._units.append((text, tokens, page_start, page_end))
+        self._unit_tokens += tokens
+        if text.strip():
+            self._fresh = True
+
+    def _add_long(self, text: str, page_start: Optional[int], page_end: Optional[int], level: int,
+                  final: bool, open_depth: int, chunks: List[Chunk]) -> Tuple[int, int]:
+        # Câu vượt ngân sách được cắt lần lượt theo dòng, theo từ, rồi theo ký tự. Khi chưa có đủ câu (đang
+        # stream), chỉ nhận các phần đã trọn vẹn và trả về (số ký tự đã nhận, số cấp đang cắt dở) để lần
+        # sau cắt tiếp đúng như khi có cả câu một lúc.
+        if level == len(SPLIT_LEVELS):
+            for start in range(0, len(text), self._char_step):
+                piece = text[start:start + self._char_step]
+                if len(piece) < self._char_step and not final:
+                    return start, level + 1
+                self._add(piece, self.count_tokens(piece), page_start, page_end, chunks)
+            return len(text), 0
+
+        for index, match in enumerate(SPLIT_LEVELS[level].finditer(text)):
+            piece = match.group()
+            complete = final or match.end() < len(text) or piece[-1].isspace()
+            tokens = self.count_tokens(piece)
+            if tokens > self.max_tokens or (index == 0 and level + 1 < open_depth):
+                used, depth = self._add_long(piece, page_start, page_end, level + 1, complete,
+                                             open_depth if index == 0 else 0, chunks)
+                if depth:
+                    return match.start() + used, depth
+                continue
+            if not complete:
+                return match.start(), level + 1
+            self._add(piece, tokens, page_start, page_end, chunks)
+        return len(text), 0
+
+    def _add_sentence(self, text: str, page_start: Optional[int], page_end: Optional[int],
+                      chunks: List[Chunk]):
+        if self._split_depth:
+            self._add_long(text, page_start, page_end, 0, True, self._split_depth, chunks)
+            self._split_depth = 0
+            return
+        tokens = self.count_tokens(text)
+        if tokens <= self.max_tokens:
+            self._add(text, tokens, page_start, page_end, chunks)
+        else:
+            self._add_long(text, page_start, page_end, 0, True, 0, chunks)
+
+    def _consume(self, final: bool) -> List[Chunk]:
+        chunks = []
+        position = 0
+        text = self._pending
+        resume = len(text)
+        for match in SENTENCE_BOUNDARY.finditer(text, self._scanned):
+            # Ranh giới chạm cuối phần chờ có thể còn kéo dài ở lần feed sau
+            if match.end() >= len(text) and not final:
+                resume = match.start()
+                break
+            if match.start() < position or not self._is_boundary(match):
+                continue
+            self._add_sentence(text[position:match.end()], self._page_at(position),
+                               self._page_at(match.end() - 1), chunks)
+            position = match.end()
+
+        if final:
+            if text[position:].strip():
+                self._add_sentence(text[position:], self._page_at(position), self._page_at(len(text) - 1), chunks)
+            position = len(text)
+        elif len(text) - position > self._force_chars:
+            rest = text[position:]
+            if self._split_depth or self.count_tokens(rest) > self.max_tokens:
+                used, self._split_depth = self._add_long(rest, self._page_at(position), self._page_at(len(text) - 1),
+                                                         0, False, self._split_depth, chunks)
+                self._split_depth = self._split_depth or 1
+                position += used
+
+        # Bỏ phần đã xử lý; lần quét sau chỉ lùi vài ký tự để bắt được dấu câu nằm vắt qua hai lần feed
+        keep = max(0, bisect_right(self._page_offsets, position) - 1)
+        self._page_offsets = [max(0, offset - position) for offset in self._page_offsets[keep:]]
+        self._pages = self._pages[keep:]
+        self._pending = text[position:]
+        self._scanned = max(0, min(resume - position, len(self._pending) - 8))
+        return chunks
+
+    def feed(self, text: str, page: Optional[int] = None) -> List[Chunk]:
+        if self._pending or self._units:
+            self._pending += "\n"
+        self._page_offsets.append(len(self._pending))
+        self._pages.append(page)
+        self._pending += text
+        return self._consume(final=False)
+
+    def finish(self) -> List[Chunk]:
+        chunks = self._consume(final=True)
+        chunk = self._emit()
+        if chunk:
+            chunks.append(chunk)
+        self._pending = ""
+        self._scanned = 0
+        self._page_offsets = []
+        self._pages = []
+        self._units = []
+        self._unit_tokens = 0
+        self._fresh = False
+        self._split_depth = 0
+        return chunks
+
+
+def make_chunker(kind: str = CHUNKER):
+    if kind == 'chars':
+        return StreamingChunker()
+    if kind == 'token':
+        return TokenChunker()
+    raise ValueError(f"Unknown CHUNKER: {kind}")
+
+
+def iter_chunks(segments: Iterable[Tuple[Optional[int], str]], chunker=None) -> Iterator[Chunk]:
+    chunker = chunker or make_chunker()
+    for page, text in segments:
+        yield from chunker.feed(text, page)
+    yield from chunker.finish()
@@ -0,0 +1,179 @@
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from model.retrieval_scope import SCOPE_FIELDS
+from model.paths import data_path
+from model.sqlite_util import SqliteStore
+
+CONTENT_DEDUP = os.getenv("CONTENT_DEDUP", "1").lower() in ("1", "true", "yes", "on")
+CONTENT_INDEX_PATH = data_path("CONTENT_INDEX_PATH")
+
+CONTENT_COLUMNS = ('content_hash', 'text_hash', 'vector_id', 'chunks_count', 'summary', 'preview', 'created_at')
+OWNER_COLUMNS = ('file_id', 'content_hash', 'filename', 'vector_id') + SCOPE_FIELDS
+# Giới hạn số tham số trong một câu lệnh SQLite
+QUERY_BATCH = 500
+
+
+class ContentIndex(SqliteStore):
+    # Chỉ mục nội dung file đã vector hóa: contents giữ một bản ghi cho mỗi nội dung (theo hash bytes),
+    # owners gắn từng file_id với nội dung đó. Chunk trong Chroma chỉ bị xóa khi owner cuối cùng bị xóa.
+    def __init__(self, db_path: str = CONTENT_INDEX_PATH):
+        super().__init__(db_path)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS contents ("
+                "content_hash TEXT PRIMARY KEY, text_hash TEXT, vector_id TEXT, chunks_count INTEGER, "
+                "summary TEXT, preview TEXT, created_at REAL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS owners ("
+                "file_id TEXT PRIMARY KEY, content_hash TEXT, filename TEXT, vector_id TEXT, created_at REAL)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(owners)")}
+            for name in SCOPE_FIELDS:
+                if name not in columns:
+                    self._conn.execute(f"ALTER TABLE owners ADD COLUMN {name} TEXT")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_contents_text_hash ON contents(text_hash)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_owners_content ON owners(content_hash)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_owners_program ON owners(program_id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_owners_organization ON owners(organization_id)")
+
+    def _content(self, column: str, value: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute(
+            f"SELECT {', '.join(CONTENT_COLUMNS)} FROM contents WHERE {column} = ?", (value,)
+        ).fetchone()
+        return dict(zip(CONTENT_COLUMNS, row)) if row else None
+
+    def get(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._content('content_hash', content_hash)
+
+    def find_text(self, text_hash: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._content('text_hash', text_hash)
+
+    def register(self, content_hash: str, text_hash: str, vector_id: str, chunks_count: int,
+                 summary: Optional[str], preview: str) -> Dict[str, Any]:
+        # Hai worker cùng xử lý một nội dung thì bản ghi đầu tiên thắng; bên gọi so vector_id trả về với
+        # vector_id của mình để biết có phải dọn các chunk vừa lưu hay không
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO contents (content_hash, text_hash, vector_id, chunks_count, summary, "
+                "preview, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (content_hash, text_hash, vector_id, chunks_count, summary, preview, time.time())
+            )
+            return self._content('content_hash', content_hash)
+
+    def set_summary(self, content_hash: str, summary: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE contents SET summary = ? WHERE content_hash = ? AND summary IS NULL", (summary, content_hash)
+            )
+
+    def attach(self, file_id: str, content_hash: str, filename: str, vector_id: str,
+               scope: Optional[Dict[str, str]] = None) -> Optional[str]:
+        # Trả về content_hash cũ nếu file_id trước đó trỏ tới nội dung khác (file được upload lại)
+        scope = scope or {}
+        with self._lock:
+            row = self._conn.execute("SELECT content_hash FROM owners WHERE file_id = ?", (file_id,)).fetchone()
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO owners (file_id, content_hash, filename, vector_id, created_at, "
+                f"{', '.join(SCOPE_FIELDS)}) VALUES (?, ?, ?, ?, ?{', ?' * len(SCOPE_FIELDS)})",
+                (file_id, content_hash, filename, vector_id, time.time()) +
+                tuple(scope.get(name) for name in SCOPE_FIELDS)
+            )
+        if row and row[0] != content_hash:
+            return row[0]
+        return None
+
+    def owner(self, file_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(OWNER_COLUMNS)} FROM owners WHERE file_id = ?", (file_id,)
+            ).fetchone()
+        return dict(zip(OWNER_COLUMNS, row)) if row else None
+
+    def owners(self, content_hash: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(OWNER_COLUMNS)} FROM owners WHERE content_hash = ? ORDER BY created_at",
+                (content_hash,)
+            ).fetchall()
+        return [dict(zip(OWNER_COLUMNS, row)) for row in rows]
+
+    def find_owners(self, file_ids: Optional[List[str]] = None,
+                    scope: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        # Các owner thuộc phạm vi (lọc theo file_id và/hoặc thuộc tính phân quyền), kèm tiền tố id chunk
+        conditions = [f"owners.{name} = ?" for name in (scope or {})]
+        params = list((scope or {}).values())
+        batches = [None] if file_ids is None else [
+            file_ids[i:i + QUERY_BATCH] for i in range(0, len(file_ids), QUERY_BATCH)
+        ]
+        columns = ('file_id', 'filename', 'content_hash', 'chunk_prefix')
+        rows = []
+        with self._lock:
+            for batch in batches:
+                where = list(conditions)
+                if batch is not None:
+                    where.append(f"owners.file_id IN ({', '.join('?' * len(batch))})")
+                rows.extend(self._conn.execute(
+                    "SELECT owners.file_id, owners.filename, owners.content_hash, contents.vector_id FROM owners "
+                    "JOIN contents ON contents.content_hash = owners.content_hash "
+                    f"WHERE {' AND '.join(where) or '1'} ORDER BY owners.created_at",
+                    params + (batch or [])
+                ).fetchall())
+        return [dict(zip(columns, row)) for row in rows]
+
+    def release(self, file_id: str) -> Optional[Dict[str, Any]]:
+        released = self.release_many([file_id])
+        for content_hash, info in released.items():
+            return {'content_hash': content_hash, 'remaining': info['remaining']}
+        return None
+
+    def release_many(self, file_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        # Gỡ các file_id khỏi nội dung trong một transaction; nội dung không còn owner nào bị xóa luôn.
+        # Trả về content_hash -> {'remaining': số owner còn lại, 'file_ids': các file vừa gỡ}
+        released: Dict[str, Dict[str, Any]] = {}
+        with self._transaction() as conn:
+            for i in range(0, len(file_ids), QUERY_BATCH):
+                batch = file_ids[i:i + QUERY_BATCH]
+                placeholders = ', '.join('?' * len(batch))
+                for file_id, content_hash in conn.execute(
+                        f"SELECT file_id, content_hash FROM owners WHERE file_id IN ({placeholders})", batch
+                ).fetchall():
+                    released.setdefault(content_hash, {'remaining': 0, 'file_ids': []})['file_ids'].append(file_id)
+                conn.execute(f"DELETE FROM owners WHERE file_id IN ({placeholders})", batch)
+            for content_hash, info in released.items():
+                info['remaining'] = conn.execute(
+                    "SELECT COUNT(*) FROM owners WHERE content_hash = ?", (content_hash,)
+                ).fetchone()[0]
+                if not info['remaining']:
+                    conn.execute("DELETE FROM contents WHERE content_hash = ?", (content_hash,))
+        return released
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            contents = self._conn.execute("SELECT COUNT(*) FROM contents").fetchone()[0]
+            owners = self._conn.execute("SELECT COUNT(*) FROM owners").fetchone()[0]
+        return {'contents': contents, 'owners': owners}
+
+
+_content_index = None
+_content_index_lock = threading.Lock()
+
+
+def get_content_index() -> Optional[ContentIndex]:
+    global _content_index
+    if not CONTENT_DEDUP:
+        return None
+    with _content_index_lock:
+        if _content_index is None:
+            try:
+                _content_index = ContentIndex()
+            except Exception as e:
+                logging.error(f"Failed to open content index at {CONTENT_INDEX_PATH}: {e}")
+                return None
+        return _content_index
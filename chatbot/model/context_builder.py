@@ -0,0 +1,118 @@
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Tuple
+
+from model.chunking import estimate_tokens
+from model.vector_store import SearchHit
+
+# Ngân sách token (ước lượng) cho phần ngữ cảnh của prompt
+KNOWLEDGE_CONTEXT_TOKENS = int(os.getenv("KNOWLEDGE_CONTEXT_TOKENS", "1500"))
+FILES_CONTEXT_TOKENS = int(os.getenv("FILES_CONTEXT_TOKENS", "3000"))
+# Đoạn trùng ngắn hơn mức này giữa hai chunk liền nhau được coi là trùng hợp, không cắt
+OVERLAP_MIN_CHARS = 20
+
+WORD_PATTERN = re.compile(r"\S+\s*")
+
+
+@dataclass
+class ContextBlock:
+    text: str
+    score: float
+    metadata: Dict[str, Any]
+    chunk_ids: List[str] = field(default_factory=list)
+
+
+@dataclass
+class BuiltContext:
+    blocks: List[ContextBlock]
+    parts: List[str]
+    tokens: int
+    # Số chunk đã truy xuất nhưng không đưa vào prompt vì vượt ngân sách
+    dropped: int = 0
+
+
+def overlap_length(left: str, right: str, min_chars: int = OVERLAP_MIN_CHARS) -> int:
+    # Độ dài phần cuối của left trùng với phần đầu của right (chunker lặp lại vài câu cuối ở chunk sau)
+    probe = right[:min_chars]
+    if len(probe) < min_chars:
+        return 0
+    start = left.find(probe, max(0, len(left) - len(right)))
+    while start != -1:
+        if right.startswith(left[start:]):
+            return len(left) - start
+        start = left.find(probe, start + 1)
+    return 0
+
+
+def merge_adjacent(hits: List[SearchHit]) -> List[ContextBlock]:
+    # Chunk liên tiếp (cùng tiền tố id, chunk_index kề nhau) được ghép thành một đoạn, bỏ phần chồng lấp
+    blocks = []
+    tails: Dict[str, Tuple[int, ContextBlock]] = {}
+    indexed = [hit for hit in hits if isinstance(hit.metadata.get('chunk_index'), int)]
+    for hit in sorted(indexed, key=lambda hit: (hit.id.rpartition('_')[0], hit.metadata['chunk_index'])):
+        prefix = hit.id.rpartition('_')[0]
+        index = hit.metadata['chunk_index']
+        tail = tails.get(prefix)
+        if tail and tail[0] == index - 1:
+            block = tail[1]
+            cut = overlap_length(block.text, hit.document)
+            if cut < len(hit.document):
+                block.text += hit.document[cut:] if cut else "\n" + hit.document
+            block.score = max(block.score, hit.similarity)
+            block.chunk_ids.append(hit.id)
+        else:
+            block = ContextBlock(hit.document, hit.similarity, hit.metadata, [hit.id])
+            blocks.append(block)
+        tails[prefix] = (index, block)
+
+    merged = {hit.id for hit in indexed}
+    blocks.extend(
+        ContextBlock(hit.document, hit.similarity, hit.metadata, [hit.id]) for hit in hits if hit.id not in merged
+    )
+    return blocks
+
+
+def truncate_tokens(text: str, budget: int) -> str:
+    parts = []
+    for match in WORD_PATTERN.finditer(text):
+        cost = estimate_tokens(match.group())
+        if cost > budget:
+            break
+        parts.append(match.group())
+        budget -= cost
+    return "".join(parts).rstrip()
+
+
+def build_context(hits: List[SearchHit], budget: int, render: Callable[[ContextBlock], str]) -> BuiltContext:
+    # Xếp đoạn theo điểm giảm dần và lấy đến khi hết ngân sách; render tạo nội dung đưa vào prompt (kèm nhãn
+    # nguồn/điểm) nên nhãn cũng được tính vào ngân sách
+    packed = []
+    parts = []
+    seen = set()
+    tokens = 0
+    dropped = 0
+    for block in sorted(merge_adjacent(hits), key=lambda block: -block.score):
+        # Cùng một nội dung ở nhiều file (tắt dedup) hoặc nhiều mục kiến thức chỉ đưa vào một lần
+        key = " ".join(block.text.split())
+        if key in seen:
+            continue
+        seen.add(key)
+
+        part = render(block)
+        cost = estimate_tokens(part)
+        if tokens + cost > budget:
+            if packed:
+                dropped += len(block.chunk_ids)
+                continue
+            # Đoạn liên quan nhất đã dài hơn cả ngân sách: cắt bớt thay vì để trống ngữ cảnh
+            block.text = truncate_tokens(block.text, budget - (cost - estimate_tokens(block.text)))
+            if not block.text:
+                dropped += len(block.chunk_ids)
+                continue
+            part = render(block)
+            cost = estimate_tokens(part)
+        packed.append(block)
+        parts.append(part)
+        tokens += cost
+    return BuiltContext(packed, parts, tokens, dropped)
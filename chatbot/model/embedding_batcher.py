@@ -0,0 +1,84 @@
+import os
+import time
+import random
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "50"))
+EMBEDDING_MAX_IN_FLIGHT = int(os.getenv("EMBEDDING_MAX_IN_FLIGHT", "4"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "3"))
+EMBEDDING_RETRY_BACKOFF = float(os.getenv("EMBEDDING_RETRY_BACKOFF", "1.0"))
+
+
+class BatchEmbedder:
+    def __init__(self, embed_fn: Callable[[List[str]], List[List[float]]],
+                 batch_size: int = EMBEDDING_BATCH_SIZE,
+                 max_in_flight: int = EMBEDDING_MAX_IN_FLIGHT,
+                 max_retries: int = EMBEDDING_MAX_RETRIES,
+                 backoff: float = EMBEDDING_RETRY_BACKOFF):
+        self.embed_fn = embed_fn
+        self.batch_size = max(1, batch_size)
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_retries = max(0, max_retries)
+        self.backoff = backoff
+
+    def _call(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.embed_fn(texts)
+        if len(vectors) != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings, got {len(vectors)}")
+        return vectors
+
+    def _call_with_retry(self, texts: List[str]) -> List[List[float]]:
+        attempt = 0
+        while True:
+            try:
+                return self._call(texts)
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+                logging.warning(
+                    f"Embedding batch of {len(texts)} failed (attempt {attempt + 1}): {e}. Retrying in {delay:.1f}s"
+                )
+                time.sleep(delay)
+                attempt += 1
+
+    def _run_batch(self, texts: List[str]) -> Tuple[List[Optional[List[float]]], Dict[int, str]]:
+        try:
+            return self._call_with_retry(texts), {}
+        except Exception as e:
+            if len(texts) == 1:
+                return [None], {0: str(e)}
+            logging.error(f"Embedding batch of {len(texts)} failed after retries: {e}. Falling back to single chunks")
+
+        # Tách lô lỗi thành từng chunk để chỉ báo lỗi đúng chunk hỏng
+        vectors, errors = [], {}
+        for i, text in enumerate(texts):
+            try:
+                vectors.append(self._call([text])[0])
+            except Exception as e:
+                vectors.append(None)
+                errors[i] = str(e)
+        return vectors, errors
+
+    def embed(self, texts: List[str]) -> Tuple[List[Optional[List[float]]], Dict[int, str]]:
+        if not texts:
+            return [], {}
+
+        starts = list(range(0, len(texts), self.batch_size))
+        batches = [texts[start:start + self.batch_size] for start in starts]
+
+        if len(batches) == 1:
+            results = [self._run_batch(batches[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(batches))) as executor:
+                results = list(executor.map(self._run_batch, batches))
+
+        vectors, errors = [], {}
+        for start, (batch_vectors, batch_errors) in zip(starts, results):
+            vectors.extend(batch_vectors)
+            for i, error in batch_errors.items():
+                errors[start + i] = error
+
+        return vectors, errors
@@ -0,0 +1,168 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+from model.metrics import CACHE_REQUESTS
+from model.paths import data_path
+from model.sqlite_util import SqliteStore, connect
+
+EMBEDDING_CACHE_PATH = data_path("EMBEDDING_CACHE_PATH")
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "4096"))
+EMBEDDING_CACHE_DISK_MB = int(os.getenv("EMBEDDING_CACHE_DISK_MB", "256"))
+
+
+class EmbeddingCache(SqliteStore):
+    def __init__(self, db_path: Optional[str] = EMBEDDING_CACHE_PATH,
+                 memory_items: int = EMBEDDING_CACHE_MEMORY_ITEMS,
+                 disk_max_bytes: int = EMBEDDING_CACHE_DISK_MB * 1024 * 1024):
+        self.memory_items = memory_items
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()
+        self._disk_bytes = 0
+        super().__init__(db_path)
+
+    def _open(self):
+        # Tier đĩa là tùy chọn: không có đường dẫn hoặc mở lỗi thì chỉ dùng tier bộ nhớ. Sau fork tier bộ nhớ
+        # được giữ lại (copy-on-write), chỉ kết nối sqlite được mở lại.
+        self._lock = threading.Lock()
+        self._conn = None
+        if self.db_path:
+            try:
+                os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+                self._conn = connect(self.db_path)
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "key TEXT PRIMARY KEY, model TEXT, vector BLOB, size INTEGER, last_access REAL)"
+                )
+                self._conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)"
+                )
+                row = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()
+                self._disk_bytes = row[0]
+            except Exception as e:
+                logging.error(f"Failed to open embedding cache at {self.db_path}: {e}")
+                self._conn = None
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    @classmethod
+    def make_key(cls, model: str, text: str) -> str:
+        digest = hashlib.sha256(cls.normalize(text).encode("utf-8")).hexdigest()
+        return f"{model}:{digest}"
+
+    def _memory_put(self, key: str, vector: List[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key: str) -> Optional[List[float]]:
+        if not self._conn:
+            return None
+        row = self._conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return None
+        self._conn.execute("UPDATE embeddings SET last_access = ? WHERE key = ?", (time.time(), key))
+        return array('f', row[0]).tolist()
+
+    def _disk_put(self, key: str, model: str, vector: List[float]):
+        if not self._conn:
+            return
+        blob = array('f', vector).tobytes()
+        old = self._conn.execute("SELECT size FROM embeddings WHERE key = ?", (key,)).fetchone()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO embeddings (key, model, vector, size, last_access) VALUES (?, ?, ?, ?, ?)",
+            (key, model, blob, len(blob), time.time())
+        )
+        self._disk_bytes += len(blob) - (old[0] if old else 0)
+        if self._disk_bytes > self.disk_max_bytes:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        target = int(self.disk_max_bytes * 0.9)
+        rows = self._conn.execute("SELECT key, size FROM embeddings ORDER BY last_access").fetchall()
+        victims = []
+        for key, size in rows:
+            if self._disk_bytes <= target:
+                break
+            victims.append((key,))
+            self._disk_bytes -= size
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+        logging.info(f"Embedding cache evicted {len(victims)} entries from disk")
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        key = self.make_key(model, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                CACHE_REQUESTS.inc(cache='embedding', result='hit')
+                return vector
+            try:
+                vector = self._disk_get(key)
+            except Exception as e:
+                logging.error(f"Embedding cache read error: {e}")
+                vector = None
+            if vector is not None:
+                self._memory_put(key, vector)
+            CACHE_REQUESTS.inc(cache='embedding', result='hit' if vector is not None else 'miss')
+            return vector
+
+    def put(self, model: str, text: str, vector: List[float]):
+        if not vector:
+            return
+        key = self.make_key(model, text)
+        with self._lock:
+            self._memory_put(key, list(vector))
+            try:
+                self._disk_put(key, model, vector)
+            except Exception as e:
+                logging.error(f"Embedding cache write error: {e}")
+
+    def get_or_embed(self, model: str, texts: List[str],
+                     embed_fn: Callable[[List[str]], List[List[float]]]) -> List[List[float]]:
+        results = [self.get(model, text) for text in texts]
+
+        missing = {}
+        for i, vector in enumerate(results):
+            if vector is None:
+                missing.setdefault(self.normalize(texts[i]), []).append(i)
+
+        if missing:
+            pending = [texts[indexes[0]] for indexes in missing.values()]
+            vectors = embed_fn(pending)
+            if len(vectors) != len(pending):
+                raise ValueError(f"Expected {len(pending)} embeddings, got {len(vectors)}")
+            for text, vector, indexes in zip(pending, vectors, missing.values()):
+                self.put(model, text, vector)
+                for i in indexes:
+                    results[i] = vector
+
+        return results
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._conn:
+                self._conn.execute("DELETE FROM embeddings")
+                self._disk_bytes = 0
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = EmbeddingCache()
+        return _shared_cache
@@ -0,0 +1,175 @@
+import os
+import time
+import codecs
+import hashlib
+import logging
+import unicodedata
+from typing import BinaryIO, Iterator, Optional, Tuple
+import PyPDF2
+import docx
+import openpyxl
+import pptx
+from model.chunking import make_chunker
+
+# Module này chỉ phụ thuộc vào thư viện đọc file để process con trong worker_pool khởi động nhanh
+TXT_READ_BYTES = 64 * 1024
+
+
+def iter_pdf_pages(file_content: BinaryIO) -> Iterator[Tuple[int, str]]:
+    pdf_reader = PyPDF2.PdfReader(file_content)
+    for page_num, page in enumerate(pdf_reader.pages, 1):
+        yield page_num, page.extract_text() or ""
+
+
+def extract_text_from_docx(file_content: BinaryIO) -> str:
+    doc = docx.Document(file_content)
+    text = []
+    for paragraph in doc.paragraphs:
+        if paragraph.text.strip():
+            text.append(paragraph.text)
+
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                if cell.text.strip():
+                    text.append(cell.text)
+
+    return "\n".join(text)
+
+
+def extract_text_from_xlsx(file_content: BinaryIO) -> str:
+    workbook = openpyxl.load_workbook(file_content, read_only=True)
+    text = []
+
+    for sheet_name in workbook.sheetnames:
+        sheet = workbook[sheet_name]
+        text.append(f"Sheet: {sheet_name}")
+
+        for row in sheet.iter_rows(values_only=True):
+            row_text = " | ".join(str(cell) for cell in row if cell is not None)
+            if row_text.strip():
+                text.append(row_text)
+
+    return "\n".join(text)
+
+
+def iter_pptx_slides(file_content: BinaryIO) -> Iterator[Tuple[int, str]]:
+    presentation = pptx.Presentation(file_content)
+    for slide_num, slide in enumerate(presentation.slides, 1):
+        text = [f"Slide {slide_num}:"]
+        for shape in slide.shapes:
+            if hasattr(shape, 'text'):
+                if shape.text.strip():
+                    text.append(shape.text)
+        yield slide_num, "\n".join(text)
+
+
+def iter_txt_blocks(file_content: BinaryIO) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    while True:
+        block = file_content.read(TXT_READ_BYTES)
+        if not block:
+            break
+        if isinstance(block, str):
+            yield block
+            continue
+        yield decoder.decode(block)
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def file_kind(filename: str, content_type: str) -> Optional[str]:
+    ext = os.path.splitext(filename)[1].lower()
+    content_type = content_type or ''
+
+    if ext == '.pdf' or content_type == 'application/pdf':
+        return 'pdf'
+    elif ext in ['.docx', '.doc'] or 'word' in content_type:
+        return 'docx'
+    elif ext in ['.xlsx', '.xls'] or 'excel' in content_type or 'spreadsheet' in content_type:
+        return 'xlsx'
+    elif ext in ['.pptx', '.ppt'] or 'powerpoint' in content_type or 'presentation' in content_type:
+        return 'pptx'
+    elif ext == '.txt' or 'text/plain' in content_type:
+        return 'txt'
+    return None
+
+
+def iter_text_segments(file_content: BinaryIO, filename: str,
+                       content_type: str) -> Iterator[Tuple[Optional[int], str]]:
+    # Trả về (số trang, nội dung) theo từng trang/slide để chunk và vector hóa trước khi đọc hết file.
+    # Lỗi được ném ra để pipeline không lưu nội dung bị cắt cụt.
+    file_content.seek(0)
+
+    kind = file_kind(filename, content_type)
+    if kind == 'pdf':
+        yield from iter_pdf_pages(file_content)
+    elif kind == 'pptx':
+        yield from iter_pptx_slides(file_content)
+    elif kind == 'txt':
+        # Ghép các khối đã giải mã thành một trang liên tục: chunker tự nối bằng "\n" giữa các lần feed
+        pending = ""
+        for block in iter_txt_blocks(file_content):
+            pending += block
+            cut = pending.rfind("\n")
+            if cut != -1:
+                yield None, pending[:cut]
+                pending = pending[cut + 1:]
+        if pending:
+            yield None, pending
+    elif kind == 'docx':
+        text = extract_text_from_docx(file_content)
+        if text:
+            yield None, text
+    elif kind == 'xlsx':
+        text = extract_text_from_xlsx(file_content)
+        if text:
+            yield None, text
+    else:
+        logging.warning(f"Unsupported file type: {filename}")
+
+
+def update_text_hash(hasher, text: str):
+    # Băm văn bản đã chuẩn hóa khoảng trắng/Unicode để cùng một nội dung lưu ở hai file khác nhau vẫn khớp
+    hasher.update(" ".join(unicodedata.normalize("NFC", text).split()).encode("utf-8"))
+    hasher.update(b" ")
+
+
+def extract_chunks(path: str, filename: str, content_type: str, preview_chars: int):
+    # Chạy trong process con: gửi về từng trang đã chunk kèm phần đầu văn bản cho tóm tắt/xem trước
+    timings = {'extracting': 0.0, 'chunking': 0.0}
+    remaining = preview_chars + 1
+    chunker = make_chunker()
+    text_hash = hashlib.sha256()
+
+    with open(path, 'rb') as file_content:
+        segments = iter_text_segments(file_content, filename, content_type)
+        while True:
+            started = time.perf_counter()
+            segment = next(segments, None)
+            timings['extracting'] += time.perf_counter() - started
+            if segment is None:
+                break
+            page, text = segment
+            update_text_hash(text_hash, text)
+
+            started = time.perf_counter()
+            chunks = chunker.feed(text, page)
+            timings['chunking'] += time.perf_counter() - started
+
+            preview = text[:remaining] if remaining > 0 else ""
+            remaining -= len(preview)
+            yield 'segment', preview, chunks
+
+    started = time.perf_counter()
+    chunks = chunker.finish()
+    timings['chunking'] += time.perf_counter() - started
+    yield 'segment', "", chunks
+    yield 'text_hash', text_hash.hexdigest()
+    yield 'timings', timings
+
+
+TASKS = {
+    'extract_chunks': extract_chunks,
+}
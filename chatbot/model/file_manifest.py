@@ -0,0 +1,359 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from model.retrieval_scope import SCOPE_FIELDS
+from model.paths import DATA_DIR, data_path
+from model.sqlite_util import SqliteStore, immediate
+
+FILE_MANIFEST_PATH = data_path("FILE_MANIFEST_PATH")
+# Manifest ở file riêng của các phiên bản trước, được chép sang FILE_MANIFEST_PATH một lần
+LEGACY_FILE_MANIFEST_PATH = os.path.join(DATA_DIR, "cache", "file_manifest.sqlite3")
+BACKFILL_PAGE_SIZE = 1000
+# Việc dọn chunk đã nhận quá thời gian này mà chưa xong (worker chết giữa chừng) được process khác nhận lại
+CLEANUP_CLAIM_TTL = float(os.getenv("CHUNK_CLEANUP_CLAIM_TTL", "600"))
+CLEANUP_BATCH = 100
+# Giới hạn số tham số trong một câu lệnh SQLite
+QUERY_BATCH = 500
+
+# chunk_span: số id chunk đã cấp ({chunk_prefix}_0 .. _{span-1}), lớn hơn chunks_count nếu có chunk lỗi embedding
+MANIFEST_COLUMNS = (
+    'file_id', 'filename', 'vector_id', 'content_hash', 'chunk_prefix', 'chunks_count', 'chunk_span',
+    'byte_size', 'embedding_model', 'ingested_at'
+) + SCOPE_FIELDS
+FILTER_COLUMNS = ('content_hash',) + SCOPE_FIELDS
+# action: 'delete' (xóa chunk theo chunk_prefix/chunk_span, content_hash hoặc file_id) hoặc 'reassign' (chuyển chunk
+# dùng chung của content_hash từ file_id sang owner còn lại)
+CLEANUP_COLUMNS = ('id', 'action', 'file_id', 'content_hash', 'chunk_prefix', 'chunk_span')
+
+
+def vector_id_for(file_id: str, filename: str) -> str:
+    return f"file_{file_id}_{hashlib.md5(filename.encode()).hexdigest()[:8]}"
+
+
+class FileManifest(SqliteStore):
+    # Một dòng cho mỗi file đã vector hóa, để liệt kê/xóa file không phải quét toàn bộ chunk trong Chroma
+    def __init__(self, db_path: str = FILE_MANIFEST_PATH):
+        super().__init__(db_path)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "file_id TEXT PRIMARY KEY, filename TEXT, vector_id TEXT, content_hash TEXT, chunk_prefix TEXT, "
+                "chunks_count INTEGER, chunk_span INTEGER, byte_size INTEGER, embedding_model TEXT, "
+                f"ingested_at REAL, {', '.join(f'{name} TEXT' for name in SCOPE_FIELDS)})"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_files_ingested ON files(ingested_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_files_vector_id ON files(vector_id)")
+            for name in FILTER_COLUMNS:
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_files_{name} ON files({name})")
+            # Việc cần làm trên Chroma được ghi cùng giao dịch với thay đổi manifest/content index rồi mới thực hiện,
+            # nên lỗi Chroma hay worker chết giữa chừng không để lại chunk mồ côi
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunk_cleanup ("
+                "id INTEGER PRIMARY KEY, action TEXT, file_id TEXT, content_hash TEXT, chunk_prefix TEXT, "
+                "chunk_span INTEGER, created_at REAL, claimed_at REAL)"
+            )
+        self._migrate_legacy()
+
+    def _migrate_legacy(self):
+        legacy = os.path.abspath(LEGACY_FILE_MANIFEST_PATH)
+        if legacy == os.path.abspath(self.db_path) or not os.path.exists(legacy):
+            return
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_migrated'").fetchone():
+                return
+            # ATTACH không được chạy trong giao dịch
+            self._conn.execute("ATTACH DATABASE ? AS legacy", (legacy,))
+            try:
+                with immediate(self._conn) as conn:
+                    if conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_migrated'").fetchone():
+                        return
+                    columns = [row[1] for row in conn.execute("PRAGMA legacy.table_info(files)")
+                               if row[1] in MANIFEST_COLUMNS]
+                    if columns:
+                        conn.execute(
+                            f"INSERT OR IGNORE INTO main.files ({', '.join(columns)}) "
+                            f"SELECT {', '.join(columns)} FROM legacy.files"
+                        )
+                    if conn.execute("PRAGMA legacy.table_info(meta)").fetchone():
+                        conn.execute("INSERT OR IGNORE INTO main.meta (key, value) SELECT key, value FROM legacy.meta")
+                    conn.execute(
+                        "INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_migrated', ?)", (str(time.time()),)
+                    )
+            finally:
+                self._conn.execute("DETACH DATABASE legacy")
+        logging.info(f"Migrated file manifest from {legacy}")
+
+    def _insert(self, entry: Dict[str, Any]):
+        self._conn.execute(
+            f"INSERT OR REPLACE INTO files ({', '.join(MANIFEST_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(MANIFEST_COLUMNS))})",
+            tuple(entry.get(name) for name in MANIFEST_COLUMNS)
+        )
+
+    def record(self, entry: Dict[str, Any]):
+        entry = dict(entry)
+        entry.setdefault('ingested_at', time.time())
+        with self._lock:
+            self._insert(entry)
+
+    def queue_cleanup(self, action: str, file_id: Optional[str] = None, content_hash: Optional[str] = None,
+                      chunk_prefix: Optional[str] = None, chunk_span: Optional[int] = None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO chunk_cleanup (action, file_id, content_hash, chunk_prefix, chunk_span, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (action, file_id, content_hash, chunk_prefix, chunk_span, time.time())
+            )
+
+    def claim_cleanup(self, limit: int = CLEANUP_BATCH) -> List[Dict[str, Any]]:
+        now = time.time()
+        with self._transaction() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(CLEANUP_COLUMNS)} FROM chunk_cleanup "
+                f"WHERE claimed_at IS NULL OR claimed_at < ? ORDER BY id LIMIT ?",
+                (now - CLEANUP_CLAIM_TTL, limit)
+            ).fetchall()
+            conn.executemany("UPDATE chunk_cleanup SET claimed_at = ? WHERE id = ?", [(now, row[0]) for row in rows])
+        return [dict(zip(CLEANUP_COLUMNS, row)) for row in rows]
+
+    def finish_cleanup(self, task_ids: List[int]):
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunk_cleanup WHERE id = ?", [(task_id,) for task_id in task_ids])
+
+    def unclaim_cleanup(self, task_ids: List[int]):
+        with self._lock:
+            self._conn.executemany("UPDATE chunk_cleanup SET claimed_at = NULL WHERE id = ?",
+                                   [(task_id,) for task_id in task_ids])
+
+    def pending_cleanup(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunk_cleanup").fetchone()[0]
+
+    def get(self, file_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(MANIFEST_COLUMNS)} FROM files WHERE file_id = ?", (file_id,)
+            ).fetchone()
+        return dict(zip(MANIFEST_COLUMNS, row)) if row else None
+
+    def find(self, file_ids: Optional[List[str]] = None, vector_ids: Optional[List[str]] = None,
+             filters: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        # Các file khớp danh sách file_id/vector_id (nếu có) và mọi bộ lọc; không phân trang
+        conditions = [f"{name} = ?" for name in (filters or {}) if name in FILTER_COLUMNS]
+        params = [value for name, value in (filters or {}).items() if name in FILTER_COLUMNS]
+        lookups = [('file_id', file_ids), ('vector_id', vector_ids)]
+        if file_ids is None and vector_ids is None:
+            lookups = [(None, None)]
+
+        rows = {}
+        with self._lock:
+            for column, values in lookups:
+                if column and not values:
+                    continue
+                batches = [None] if column is None else [
+                    values[i:i + QUERY_BATCH] for i in range(0, len(values), QUERY_BATCH)
+                ]
+                for batch in batches:
+                    where = list(conditions)
+                    if batch is not None:
+                        where.append(f"{column} IN ({', '.join('?' * len(batch))})")
+                    for row in self._conn.execute(
+                            f"SELECT {', '.join(MANIFEST_COLUMNS)} FROM files WHERE {' AND '.join(where) or '1'}",
+                            params + (batch or [])
+                    ).fetchall():
+                        entry = dict(zip(MANIFEST_COLUMNS, row))
+                        rows[entry['file_id']] = entry
+        return list(rows.values())
+
+    def remove_many(self, file_ids: List[str]) -> int:
+        removed = 0
+        with self._transaction() as conn:
+            for i in range(0, len(file_ids), QUERY_BATCH):
+                batch = file_ids[i:i + QUERY_BATCH]
+                removed += conn.execute(
+                    f"DELETE FROM files WHERE file_id IN ({', '.join('?' * len(batch))})", batch
+                ).rowcount
+        return removed
+
+    def content_layout(self, content_hash: str) -> Optional[Tuple[str, Optional[int]]]:
+        # (chunk_prefix, chunk_span) của một nội dung đã có, lấy từ file bất kỳ dùng nội dung đó
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT chunk_prefix, chunk_span FROM files WHERE content_hash = ? AND chunk_prefix IS NOT NULL "
+                "LIMIT 1", (content_hash,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def list(self, filters: Optional[Dict[str, str]] = None, query: str = "", limit: int = 100,
+             offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        conditions = []
+        params = []
+        for name, value in (filters or {}).items():
+            if name in FILTER_COLUMNS:
+                conditions.append(f"{name} = ?")
+                params.append(value)
+        if query:
+            conditions.append("filename LIKE ? ESCAPE '\\'")
+            escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params.append(f"%{escaped}%")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM files {where}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT {', '.join(MANIFEST_COLUMNS)} FROM files {where} "
+                f"ORDER BY ingested_at DESC, file_id LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+        return [dict(zip(MANIFEST_COLUMNS, row)) for row in rows], total
+
+    def backfill(self, store, collection: str, content_index=None) -> int:
+        # Dựng manifest một lần từ metadata chunk cho các file được vector hóa trước khi có manifest
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'backfilled'").fetchone():
+                return 0
+            files = self._scan(store, collection, content_index)
+            for entry in files.values():
+                if not conn.execute("SELECT 1 FROM files WHERE file_id = ?", (entry['file_id'],)).fetchone():
+                    self._insert(entry)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('backfilled', ?)", (str(time.time()),))
+        if files:
+            logging.info(f"Backfilled file manifest with {len(files)} files from {collection}")
+        return len(files)
+
+    @staticmethod
+    def _scan(store, collection: str, content_index) -> Dict[str, Dict[str, Any]]:
+        files = {}
+        offset = 0
+        while True:
+            page = store.get(collection, include=['metadatas'], limit=BACKFILL_PAGE_SIZE, offset=offset)
+            if not page['ids']:
+                break
+            offset += len(page['ids'])
+            for chunk_id, metadata in zip(page['ids'], page['metadatas']):
+                metadata = metadata or {}
+                file_id = metadata.get('file_id', '')
+                prefix, _, index = chunk_id.rpartition('_')
+                entry = files.get(file_id)
+                if entry is None:
+                    filename = metadata.get('filename', 'Unknown')
+                    entry = files[file_id] = {
+                        'file_id': file_id,
+                        'filename': filename,
+                        'vector_id': vector_id_for(file_id, filename),
+                        'content_hash': metadata.get('content_hash'),
+                        'chunk_prefix': prefix,
+                        'chunks_count': 0,
+                        'chunk_span': 0,
+                        'ingested_at': 0.0
+                    }
+                    entry.update({name: metadata[name] for name in SCOPE_FIELDS if name in metadata})
+                entry['chunks_count'] += 1
+                if index.isdigit():
+                    entry['chunk_span'] = max(entry['chunk_span'], int(index) + 1)
+
+        # Chunk dùng chung chỉ mang file_id của owner đầu tiên; các owner khác lấy từ content index
+        if content_index:
+            for entry in list(files.values()):
+                if not entry['content_hash']:
+                    continue
+                for owner in content_index.owners(entry['content_hash']):
+                    if owner['file_id'] not in files:
+                        files[owner['file_id']] = dict(
+                            entry, file_id=owner['file_id'], filename=owner['filename'],
+                            vector_id=owner['vector_id'], **{name: owner[name] for name in SCOPE_FIELDS}
+                        )
+                    else:
+                        files[owner['file_id']]['vector_id'] = owner['vector_id']
+        return files
+
+    def reconcile(self, content_index) -> Dict[str, int]:
+        # Sửa lệch giữa manifest và content index do các phiên bản trước ghi hai kho ở hai giao dịch riêng. Content
+        # index quyết định file nào còn giữ nội dung nào; chunk của nội dung không còn owner được xếp lịch xóa.
+        if not self.shares_file(content_index):
+            logging.warning("File manifest and content index use different sqlite files, skipping reconcile")
+            return {}
+        owned = "SELECT 1 FROM owners WHERE owners.file_id = files.file_id AND owners.content_hash = files.content_hash"
+        with self._transaction() as conn:
+            dangling = conn.execute(
+                "DELETE FROM owners WHERE content_hash NOT IN (SELECT content_hash FROM contents)"
+            ).rowcount
+            orphans = [row[0] for row in conn.execute(
+                "SELECT content_hash FROM contents WHERE content_hash NOT IN (SELECT content_hash FROM owners)"
+            )]
+            conn.execute("DELETE FROM contents WHERE content_hash NOT IN (SELECT content_hash FROM owners)")
+            stale = conn.execute(
+                f"SELECT DISTINCT content_hash FROM files WHERE content_hash IS NOT NULL AND NOT EXISTS ({owned}) "
+                f"AND content_hash NOT IN (SELECT content_hash FROM contents)"
+            ).fetchall()
+            orphans += [content_hash for (content_hash,) in stale if content_hash not in orphans]
+            # File đã bị gỡ khỏi nội dung vẫn còn owner khác: chunk dùng chung có thể còn mang file_id của nó
+            for file_id, content_hash in conn.execute(
+                    f"SELECT file_id, content_hash FROM files WHERE content_hash IS NOT NULL AND NOT EXISTS ({owned}) "
+                    f"AND content_hash IN (SELECT content_hash FROM contents)"
+            ).fetchall():
+                self.queue_cleanup('reassign', file_id=file_id, content_hash=content_hash)
+            for content_hash in orphans:
+                layout = self.content_layout(content_hash) or (None, None)
+                self.queue_cleanup('delete', content_hash=content_hash, chunk_prefix=layout[0],
+                                   chunk_span=layout[1])
+            removed = conn.execute(
+                f"DELETE FROM files WHERE content_hash IS NOT NULL AND NOT EXISTS ({owned})"
+            ).rowcount
+
+            missing = conn.execute(
+                f"SELECT owners.file_id, owners.filename, owners.vector_id, owners.content_hash, owners.created_at, "
+                f"contents.vector_id, contents.chunks_count, {', '.join(f'owners.{name}' for name in SCOPE_FIELDS)} "
+                f"FROM owners JOIN contents ON contents.content_hash = owners.content_hash "
+                f"WHERE NOT EXISTS (SELECT 1 FROM files WHERE files.file_id = owners.file_id)"
+            ).fetchall()
+            for file_id, filename, vector_id, content_hash, created_at, chunk_prefix, chunks_count, *scope in missing:
+                layout = self.content_layout(content_hash)
+                self._insert(dict(
+                    zip(SCOPE_FIELDS, scope),
+                    file_id=file_id,
+                    filename=filename,
+                    vector_id=vector_id,
+                    content_hash=content_hash,
+                    chunk_prefix=layout[0] if layout else chunk_prefix,
+                    chunk_span=layout[1] if layout else None,
+                    chunks_count=chunks_count,
+                    ingested_at=created_at
+                ))
+        report = {
+            'dangling_owners': dangling,
+            'orphan_contents': len(orphans),
+            'stale_files': removed,
+            'missing_files': len(missing)
+        }
+        if any(report.values()):
+            logging.warning(f"Reconciled file manifest with content index: {report}")
+        return report
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            files, chunks = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(chunks_count), 0) FROM files"
+            ).fetchone()
+        return {'files': files, 'chunks': chunks}
+
+
+_file_manifest = None
+_file_manifest_lock = threading.Lock()
+
+
+def get_file_manifest() -> Optional[FileManifest]:
+    global _file_manifest
+    with _file_manifest_lock:
+        if _file_manifest is None:
+            try:
+                _file_manifest = FileManifest()
+            except Exception as e:
+                logging.error(f"Failed to open file manifest at {FILE_MANIFEST_PATH}: {e}")
+                return None
+        return _file_manifest
@@ -1,16 +1,30 @@
 import os
+import time
+import shutil
 import logging
-from typing import Dict, Any, Optional, List
-import chromadb
-from google import genai
-from google.genai import types
-import PyPDF2
-import docx
-import openpyxl
-import pptx
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, Any, Optional, List, Tuple, Callable, Iterator
 from io import BytesIO
 import hashlib
+from datetime import datetime
 from dotenv import load_dotenv
+from model.embedding_cache import get_embedding_cache
+from model.providers import get_provider
+from model.embedding_batcher import BatchEmbedder
+from model.chunking import make_chunker
+from model import extraction
+from model.worker_pool import WorkerPool
+from model.uploads import UPLOAD_TMP_DIR, stream_size
+from model.content_index import get_content_index
+from model.file_manifest import get_file_manifest, vector_id_for
+from model.state_store import get_state_store
+from model.retrieval_scope import SCOPE_FIELDS
+from model.vector_store import get_vector_store, FILES_CHROMA_PATH, FILES_COLLECTION, CHATBOT_PREFORK
+from model.metrics import STAGE_SECONDS, ERRORS
 
 parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 dotenv_path = os.path.join(parent_dir, 'backend', '.env')
@@ -18,27 +32,100 @@ load_dotenv(dotenv_path=dotenv_path)
 
 logging.basicConfig(level=logging.INFO)
 
+# parallel: chờ tóm tắt chạy song song với vector hóa; lazy: trả kết quả trước, lấy tóm tắt sau; none: bỏ qua
+FILE_SUMMARY_MODE = os.getenv("FILE_SUMMARY_MODE", "parallel")
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "4"))
+MAX_PENDING_SUMMARIES = int(os.getenv("MAX_PENDING_SUMMARIES", "1000"))
+SUMMARY_TTL = int(os.getenv("SUMMARY_TTL", "86400"))
+# Chu kỳ thăm dò state store khi chờ tóm tắt do worker khác tạo
+SUMMARY_POLL_INTERVAL = 0.2
+# Số chunk gom lại trước khi gửi đi vector hóa và lưu, và số lô được xử lý đồng thời với việc trích xuất
+INGEST_BATCH_CHUNKS = int(os.getenv("INGEST_BATCH_CHUNKS", "100"))
+INGEST_MAX_IN_FLIGHT = int(os.getenv("INGEST_MAX_IN_FLIGHT", "2"))
+SUMMARY_INPUT_CHARS = 10000
+# Trích xuất và chunk chạy trong process riêng để không giữ GIL của process web; 0 là chạy ngay trong luồng request
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "2"))
+EXTRACT_TIMEOUT = float(os.getenv("EXTRACT_TIMEOUT", "120"))
+EXTRACT_MAX_TASKS = int(os.getenv("EXTRACT_MAX_TASKS", "50"))
+# Số id chunk trong một lệnh xóa gửi tới Chroma
+DELETE_BATCH_IDS = int(os.getenv("DELETE_BATCH_IDS", "5000"))
+
+
+class _StageTimer:
+    # Các giai đoạn trích xuất/chunk/vector hóa/lưu chạy xen kẽ theo lô nên thời gian được cộng dồn
+    def __init__(self, timings: Dict[str, float], progress_callback: Optional[Callable[[str, str], None]]):
+        self.timings = timings
+        self.progress_callback = progress_callback
+        self._elapsed = {}
+        self._lock = threading.Lock()
+
+    def run(self, name: str, fn, *args, **kwargs):
+        with self._lock:
+            first = name not in self.timings
+            if first:
+                self.timings[name] = 0.0
+        if first and self.progress_callback:
+            self.progress_callback(name, 'running')
+
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            ERRORS.inc(component=name)
+            if self.progress_callback:
+                self.progress_callback(name, 'failed')
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            STAGE_SECONDS.observe(elapsed, stage=name)
+            with self._lock:
+                self._elapsed[name] = self._elapsed.get(name, 0.0) + elapsed
+                self.timings[name] = round(self._elapsed[name] * 1000, 1)
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            first = name not in self.timings
+            self._elapsed[name] = self._elapsed.get(name, 0.0) + seconds
+            self.timings[name] = round(self._elapsed[name] * 1000, 1)
+        if first and self.progress_callback:
+            self.progress_callback(name, 'running')
+        if seconds:
+            STAGE_SECONDS.observe(seconds, stage=name)
+
+    def done(self, *names: str):
+        for name in names:
+            if name in self.timings and self.progress_callback:
+                self.progress_callback(name, 'done')
+
+    def run_once(self, name: str, fn, *args, **kwargs):
+        # Giai đoạn chỉ chạy một lần (tóm tắt): báo xong ngay khi kết thúc
+        result = self.run(name, fn, *args, **kwargs)
+        self.done(name)
+        return result
+
 class FileProcessor:
     def __init__(self):
         try:
-            api_key = os.getenv("GEMINI_API_KEY")
-            if not api_key:
-                raise ValueError("GEMINI_API_KEY not set")
-
-            self.client = genai.Client(api_key=api_key)
+            self.provider = get_provider()
             self.model = "gemini-2.0-flash-exp"
             self.embedding_model = 'text-embedding-004'
-
-            self.chroma_path = "chroma_db_files"
-            self.chroma_client = chromadb.PersistentClient(path=self.chroma_path)
-
-            try:
-                self.file_collection = self.chroma_client.get_collection(name="uploaded_files")
-            except:
-                self.file_collection = self.chroma_client.create_collection(
-                    name="uploaded_files",
-                    metadata={"hnsw:space": "cosine"}
-                )
+            self.embedding_cache = get_embedding_cache()
+            self.embedding_cache_key = self.provider.embedding_key(self.embedding_model)
+            self.batch_embedder = BatchEmbedder(self._embed_texts)
+            self.content_index = get_content_index()
+            self.file_manifest = get_file_manifest()
+            self.state_store = get_state_store()
+            self.extraction_pool = None
+            if EXTRACT_WORKERS > 0:
+                self.extraction_pool = WorkerPool('model.extraction', EXTRACT_WORKERS, EXTRACT_MAX_TASKS,
+                                                  EXTRACT_TIMEOUT)
+            self._summaries = OrderedDict()
+            self._start_executor()
+            os.register_at_fork(after_in_child=self._start_executor)
+
+            self.files_store = None
+            if not CHATBOT_PREFORK:
+                self.warm_up()
 
             logging.info("FileProcessor initialized successfully")
 
@@ -46,86 +133,69 @@ class FileProcessor:
             logging.error(f"Failed to initialize FileProcessor: {e}")
             raise
 
-    def _get_embedding_value(self, response):
-        if hasattr(response, 'embedding'):
-            return response.embedding
-        if hasattr(response, 'values') and len(response.values) > 0:
-            return response.values[0]
-        return [0.0] * 768
+    def warm_up(self):
+        self.files_store = get_vector_store(FILES_CHROMA_PATH)
+        self.files_store.collection(FILES_COLLECTION)
+        if self.file_manifest:
+            try:
+                self.file_manifest.backfill(self.files_store, FILES_COLLECTION, self.content_index)
+                if self.content_index:
+                    self.file_manifest.reconcile(self.content_index)
+            except Exception as e:
+                ERRORS.inc(component='file_manifest')
+                logging.error(f"Failed to backfill file manifest: {e}")
+        # Chạy nốt việc dọn chunk còn dở từ lần chạy trước
+        self._run_cleanup()
+
+    def _start_executor(self):
+        # Luồng của executor không sống qua fork nên mỗi worker cần executor riêng
+        self._pipeline_executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="pipeline")
+        self._summaries_lock = threading.Lock()
+        self._summaries.clear()
+
+    def _embed_texts(self, texts: List[str]) -> List[List[float]]:
+        return self.provider.embed(self.embedding_model, texts)
+
+    def iter_pdf_pages(self, file_content: BytesIO) -> Iterator[Tuple[int, str]]:
+        return extraction.iter_pdf_pages(file_content)
 
     def extract_text_from_pdf(self, file_content: BytesIO) -> str:
         try:
-            pdf_reader = PyPDF2.PdfReader(file_content)
-            text = ""
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                text += page.extract_text() + "\n"
-            return text.strip()
+            return "\n".join(text for _, text in extraction.iter_pdf_pages(file_content)).strip()
         except Exception as e:
             logging.error(f"Error extracting PDF text: {e}")
             return ""
 
     def extract_text_from_docx(self, file_content: BytesIO) -> str:
         try:
-            doc = docx.Document(file_content)
-            text = []
-            for paragraph in doc.paragraphs:
-                if paragraph.text.strip():
-                    text.append(paragraph.text)
-
-            for table in doc.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        if cell.text.strip():
-                            text.append(cell.text)
-
-            return "\n".join(text)
+            return extraction.extract_text_from_docx(file_content)
         except Exception as e:
             logging.error(f"Error extracting DOCX text: {e}")
             return ""
 
     def extract_text_from_xlsx(self, file_content: BytesIO) -> str:
         try:
-            workbook = openpyxl.load_workbook(file_content, read_only=True)
-            text = []
-
-            for sheet_name in workbook.sheetnames:
-                sheet = workbook[sheet_name]
-                text.append(f"Sheet: {sheet_name}")
-
-                for row in sheet.iter_rows(values_only=True):
-                    row_text = " | ".join(str(cell) for cell in row if cell is not None)
-                    if row_text.strip():
-                        text.append(row_text)
-
-            return "\n".join(text)
+            return extraction.extract_text_from_xlsx(file_content)
         except Exception as e:
             logging.error(f"Error extracting XLSX text: {e}")
             return ""
 
+    def iter_pptx_slides(self, file_content: BytesIO) -> Iterator[Tuple[int, str]]:
+        return extraction.iter_pptx_slides(file_content)
+
     def extract_text_from_pptx(self, file_content: BytesIO) -> str:
         try:
-            presentation = pptx.Presentation(file_content)
-            text = []
-
-            for slide_num, slide in enumerate(presentation.slides, 1):
-                text.append(f"Slide {slide_num}:")
-                for shape in slide.shapes:
-                    if hasattr(shape, 'text'):
-                        if shape.text.strip():
-                            text.append(shape.text)
-
-            return "\n".join(text)
+            return "\n".join(text for _, text in extraction.iter_pptx_slides(file_content))
         except Exception as e:
             logging.error(f"Error extracting PPTX text: {e}")
             return ""
 
+    def iter_txt_blocks(self, file_content: BytesIO) -> Iterator[str]:
+        return extraction.iter_txt_blocks(file_content)
+
     def extract_text_from_txt(self, file_content: BytesIO) -> str:
         try:
-            text = file_content.read()
-            if isinstance(text, bytes):
-                text = text.decode('utf-8', errors='ignore')
-            return text
+            return "".join(extraction.iter_txt_blocks(file_content))
         except Exception as e:
             logging.error(f"Error extracting TXT text: {e}")
             return ""
@@ -133,47 +203,81 @@ class FileProcessor:
     def extract_text(self, file_content: BytesIO, filename: str, content_type: str) -> str:
         file_content.seek(0)
 
-        ext = os.path.splitext(filename)[1].lower()
-
-        if ext == '.pdf' or content_type == 'application/pdf':
+        kind = extraction.file_kind(filename, content_type)
+        if kind == 'pdf':
             return self.extract_text_from_pdf(file_content)
-        elif ext in ['.docx', '.doc'] or 'word' in content_type:
+        elif kind == 'docx':
             return self.extract_text_from_docx(file_content)
-        elif ext in ['.xlsx', '.xls'] or 'excel' in content_type or 'spreadsheet' in content_type:
+        elif kind == 'xlsx':
             return self.extract_text_from_xlsx(file_content)
-        elif ext in ['.pptx', '.ppt'] or 'powerpoint' in content_type or 'presentation' in content_type:
+        elif kind == 'pptx':
             return self.extract_text_from_pptx(file_content)
-        elif ext == '.txt' or 'text/plain' in content_type:
+        elif kind == 'txt':
             return self.extract_text_from_txt(file_content)
         else:
             logging.warning(f"Unsupported file type: {filename}")
             return ""
 
-    def chunk_text(self, text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
-        if not text:
-            return []
-
-        chunks = []
-        start = 0
-        text_length = len(text)
-
-        while start < text_length:
-            end = start + chunk_size
-
-            if end < text_length:
-                for delimiter in ['\n\n', '\n', '. ', '! ', '? ']:
-                    delimiter_pos = text.rfind(delimiter, start + overlap, end)
-                    if delimiter_pos != -1:
-                        end = delimiter_pos + len(delimiter)
-                        break
-
-            chunk = text[start:end].strip()
-            if chunk:
-                chunks.append(chunk)
-
-            start = end - overlap if end < text_length else end
-
-        return chunks
+    def iter_text_segments(self, file_content: BytesIO, filename: str,
+                           content_type: str) -> Iterator[Tuple[Optional[int], str]]:
+        return extraction.iter_text_segments(file_content, filename, content_type)
+
+    def _iter_chunks_local(self, file_content: BytesIO, filename: str, content_type: str, stage: _StageTimer,
+                           extracted: Dict[str, Any]) -> Iterator[Tuple[str, List[Tuple[str, Optional[int], Optional[int]]]]]:
+        chunker = make_chunker()
+        text_hash = hashlib.sha256()
+        segments = extraction.iter_text_segments(file_content, filename, content_type)
+        while True:
+            segment = stage.run('extracting', next, segments, None)
+            if segment is None:
+                break
+            page, text = segment
+            extraction.update_text_hash(text_hash, text)
+            yield text, stage.run('chunking', chunker.feed, text, page)
+        yield "", stage.run('chunking', chunker.finish)
+        extracted['text_hash'] = text_hash.hexdigest()
+
+    def _iter_chunks_pooled(self, file_content: BytesIO, filename: str, content_type: str, stage: _StageTimer,
+                            extracted: Dict[str, Any]) -> Iterator[Tuple[str, List[Tuple[str, Optional[int], Optional[int]]]]]:
+        # Process con mở file theo đường dẫn; file upload chưa có trên đĩa thì ghi ra file tạm trước
+        path = getattr(file_content, 'name', None)
+        temp_path = None
+        if not isinstance(path, str) or not os.path.isfile(path):
+            file_content.seek(0)
+            with tempfile.NamedTemporaryFile(dir=UPLOAD_TMP_DIR, prefix="chatbot-extract-", delete=False) as temp:
+                shutil.copyfileobj(file_content, temp, 1024 * 1024)
+                temp_path = path = temp.name
+
+        stage.record('extracting', 0.0)
+        stage.record('chunking', 0.0)
+        try:
+            for message in self.extraction_pool.stream('extract_chunks', path, filename, content_type,
+                                                       SUMMARY_INPUT_CHARS):
+                if message[0] == 'timings':
+                    for name, seconds in message[1].items():
+                        stage.record(name, seconds)
+                    continue
+                if message[0] == 'text_hash':
+                    extracted['text_hash'] = message[1]
+                    continue
+                _, text, chunks = message
+                yield text, chunks
+        except Exception:
+            ERRORS.inc(component='extracting')
+            if stage.progress_callback:
+                stage.progress_callback('extracting', 'failed')
+            raise
+        finally:
+            if temp_path:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+
+    def chunk_text(self, text: str) -> List[str]:
+        chunker = make_chunker()
+        chunks = chunker.feed(text) + chunker.finish()
+        return [chunk for chunk, _, _ in chunks]
 
     def summarize_text(self, text: str, max_length: int = 500) -> str:
         try:
@@ -192,165 +296,678 @@ class FileProcessor:
             
             Tóm tắt:"""
 
-            response = self.client.models.generate_content(
-                model=self.model,
-                contents=prompt,
-                config=types.GenerateContentConfig(
-                    temperature=0.3,
-                    max_output_tokens=max_length // 4,
-                )
+            text = self.provider.generate(
+                self.model,
+                prompt,
+                temperature=0.3,
+                max_output_tokens=max_length // 4
             )
 
-            return response.text.strip()
+            return text.strip()
 
         except Exception as e:
             logging.error(f"Error summarizing text: {e}")
             return "Lỗi khi tóm tắt nội dung"
 
-    def create_embeddings(self, texts: List[str]) -> List[List[float]]:
-        embeddings = []
+    def create_embeddings(self, texts: List[str]) -> Tuple[List[Optional[List[float]]], Dict[int, str]]:
+        embeddings = [self.embedding_cache.get(self.embedding_cache_key, text) for text in texts]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        errors = {}
 
-        for text in texts:
-            try:
-                response = self.client.models.embed_content(
-                    model=self.embedding_model,
-                    contents=[text]
-                )
+        if missing:
+            vectors, batch_errors = self.batch_embedder.embed([texts[i] for i in missing])
+            for position, i in enumerate(missing):
+                if vectors[position] is None:
+                    errors[i] = batch_errors.get(position, 'Unknown embedding error')
+                    continue
+                self.embedding_cache.put(self.embedding_cache_key, texts[i], vectors[position])
+                embeddings[i] = vectors[position]
 
-                embedding = self._get_embedding_value(response)
-                embeddings.append(embedding)
+        if errors:
+            logging.error(f"Failed to embed {len(errors)}/{len(texts)} chunks")
 
-            except Exception as e:
-                logging.error(f"Error creating embedding: {e}")
-                embeddings.append([0.0] * 768)
+        return embeddings, errors
 
-        return embeddings
+    def _save_summary(self, file_id: str, entry: Dict[str, Any]):
+        if not self.state_store:
+            return
+        try:
+            self.state_store.put('summary', file_id, entry, SUMMARY_TTL)
+        except Exception as e:
+            logging.error(f"Failed to save summary state for {file_id}: {e}")
 
-    def process_file(self, file_content: BytesIO, filename: str, content_type: str, file_id: str) -> Dict[str, Any]:
+    def _summary_done(self, file_id: str, future: Future):
         try:
-            text = self.extract_text(file_content, filename, content_type)
+            self._save_summary(file_id, {'status': 'completed', 'summary': future.result()})
+        except Exception as e:
+            self._save_summary(file_id, {'status': 'failed', 'summary': None, 'error': str(e)})
+
+    def _remember_summary(self, file_id: str, future: Future):
+        # Future chỉ có trong worker đã nhận upload; worker khác đọc trạng thái từ state store
+        self._save_summary(file_id, {'status': 'pending', 'summary': None})
+        future.add_done_callback(lambda done: self._summary_done(file_id, done))
+        with self._summaries_lock:
+            self._summaries[file_id] = future
+            self._summaries.move_to_end(file_id)
+            while len(self._summaries) > MAX_PENDING_SUMMARIES:
+                self._summaries.popitem(last=False)
+
+    def _shared_summary(self, file_id: str, wait: float) -> Optional[Dict[str, Any]]:
+        deadline = time.monotonic() + wait
+        while True:
+            entry = self.state_store.get('summary', file_id)
+            if not entry or entry['status'] != 'pending' or time.monotonic() >= deadline:
+                return entry
+            time.sleep(min(SUMMARY_POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+
+    def get_file_summary(self, file_id: str, wait: float = 0) -> Dict[str, Any]:
+        with self._summaries_lock:
+            future = self._summaries.get(file_id)
+
+        if future is None:
+            if self.state_store:
+                entry = self._shared_summary(file_id, wait)
+                if entry:
+                    return entry
+            # File được ghép vào nội dung đã có: lấy từ chỉ mục nội dung
+            content = self._owned_content(file_id)
+            if content and content['summary']:
+                return {'status': 'completed', 'summary': content['summary']}
+            return {'status': 'not_found', 'summary': None}
 
-            if not text:
+        try:
+            summary = future.result(timeout=wait)
+        except FutureTimeoutError:
+            return {'status': 'pending', 'summary': None}
+        except Exception as e:
+            return {'status': 'failed', 'summary': None, 'error': str(e)}
+
+        return {'status': 'completed', 'summary': summary}
+
+    def _embed_and_store(self, stage: _StageTimer, chunk_prefix: str, file_id: str, filename: str,
+                         content_hash: Optional[str], scope: Dict[str, str], offset: int,
+                         batch: List[Tuple[str, Optional[int], Optional[int]]]) -> Dict[str, Any]:
+        texts = [chunk for chunk, _, _ in batch]
+        embeddings, errors = stage.run('embedding', self.create_embeddings, texts)
+
+        stored = [i for i in range(len(batch)) if embeddings[i] is not None]
+        ids = [f"{chunk_prefix}_{offset + i}" for i in stored]
+        if stored:
+            metadatas = []
+            for i in stored:
+                metadata = {
+                    'file_id': file_id,
+                    'filename': filename,
+                    'chunk_index': offset + i
+                }
+                if content_hash:
+                    metadata['content_hash'] = content_hash
+                metadata.update(scope)
+                _, page_start, page_end = batch[i]
+                if page_start is not None:
+                    metadata['page_start'] = page_start
+                    metadata['page_end'] = page_end
+                metadatas.append(metadata)
+
+            stage.run('storing', self.files_store.upsert, FILES_COLLECTION,
+                      embeddings=[embeddings[i] for i in stored],
+                      documents=[texts[i] for i in stored],
+                      metadatas=metadatas,
+                      ids=ids)
+
+        return {
+            'ids': ids,
+            'errors': {offset + i: error for i, error in errors.items()}
+        }
+
+    @staticmethod
+    def _hash_content(file_content: BytesIO) -> str:
+        file_content.seek(0)
+        digest = hashlib.sha256()
+        while True:
+            block = file_content.read(1024 * 1024)
+            if not block:
+                break
+            digest.update(block if isinstance(block, bytes) else block.encode("utf-8"))
+        file_content.seek(0)
+        return digest.hexdigest()
+
+    def _owned_content(self, file_id: str) -> Optional[Dict[str, Any]]:
+        if not self.content_index:
+            return None
+        owner = self.content_index.owner(file_id)
+        return self.content_index.get(owner['content_hash']) if owner else None
+
+    def _attach_owner(self, file_id: str, content_hash: str, filename: str, vector_id: str,
+                      scope: Dict[str, str]):
+        current = self.content_index.owner(file_id)
+        if current and current['content_hash'] == content_hash:
+            if all(current[name] == scope.get(name) for name in SCOPE_FIELDS):
+                return
+        # file_id được upload lại với nội dung khác: gỡ khỏi nội dung cũ trước
+        elif current:
+            self._release_owner(file_id)
+        self.content_index.attach(file_id, content_hash, filename, vector_id, scope)
+
+    def _store_summary_later(self, content_hash: str, future: Future):
+        def store(done: Future):
+            if not done.cancelled() and done.exception() is None:
+                self.content_index.set_summary(content_hash, done.result())
+        future.add_done_callback(store)
+
+    def _reuse_content(self, content: Dict[str, Any], file_id: str, filename: str, vector_id: str,
+                       summary_mode: str, timings: Dict[str, float], pipeline_started: float) -> Dict[str, Any]:
+        content_hash = content['content_hash']
+        summary = content['summary']
+        summary_status = 'completed' if summary else 'skipped'
+        preview = content['preview'] or ""
+        if summary is None and summary_mode in ('parallel', 'lazy') and preview:
+            future = self._pipeline_executor.submit(
+                _StageTimer(timings, None).run_once, 'summarizing', self.summarize_text, preview, 500
+            )
+            self._remember_summary(file_id, future)
+            self._store_summary_later(content_hash, future)
+            if summary_mode == 'parallel':
+                summary = future.result()
+                summary_status = 'completed'
+            else:
+                summary_status = 'pending'
+
+        timings['total'] = round((time.perf_counter() - pipeline_started) * 1000, 1)
+        logging.info(f"Reused indexed content {content_hash[:12]} for file {filename} ({file_id})")
+        return {
+            'success': True,
+            'content': preview[:5000].strip(),
+            'summary': summary,
+            'summary_status': summary_status,
+            'vector_id': vector_id,
+            'chunks_count': content['chunks_count'],
+            'failed_chunks': [],
+            'timings_ms': dict(timings),
+            'deduplicated': True
+        }
+
+    def _index_content(self, content_hash: str, text_hash: Optional[str], chunk_prefix: str, stored_ids: List[str],
+                       file_id: str, filename: str, vector_id: str, scope: Dict[str, str], preview: str,
+                       summary: Optional[str], summary_status: str,
+                       summary_future: Optional[Future]) -> Tuple[int, Optional[str], str]:
+        if summary is None and summary_future is not None and summary_future.done() \
+                and summary_future.exception() is None:
+            summary = summary_future.result()
+
+        # Bytes khác nhưng văn bản trích xuất giống hệt một nội dung đã có: bỏ các chunk vừa lưu, dùng lại bản cũ
+        twin = self.content_index.find_text(text_hash) if text_hash else None
+        if twin and twin['content_hash'] != content_hash:
+            self._queue_cleanup('delete', content_hash=content_hash)
+            self._attach_owner(file_id, twin['content_hash'], filename, vector_id, scope)
+            if twin['summary'] is None and summary is not None:
+                self.content_index.set_summary(twin['content_hash'], summary)
+            elif summary_future is not None and summary is None:
+                self._store_summary_later(twin['content_hash'], summary_future)
+            logging.info(f"File {filename} has the same text as content {twin['content_hash'][:12]}, reusing it")
+            return twin['chunks_count'], summary or twin['summary'], summary_status
+
+        self.content_index.register(content_hash, text_hash, chunk_prefix, len(stored_ids), summary,
+                                    preview[:SUMMARY_INPUT_CHARS])
+        if summary is None and summary_future is not None:
+            self._store_summary_later(content_hash, summary_future)
+        self._attach_owner(file_id, content_hash, filename, vector_id, scope)
+        return len(stored_ids), summary, summary_status
+
+    def _reassign_chunks(self, content_hash: str, old_file_id: str):
+        # Metadata của chunk dùng chung ghi owner đầu tiên; chuyển sang owner còn lại để tìm kiếm trả đúng file
+        owners = self.content_index.owners(content_hash)
+        if not owners:
+            return
+        results = self.files_store.get(
+            FILES_COLLECTION,
+            where={"$and": [{"content_hash": content_hash}, {"file_id": old_file_id}]}
+        )
+        if not results['ids']:
+            return
+        primary = owners[0]
+        metadatas = []
+        for metadata in results['metadatas']:
+            metadata = dict(metadata, file_id=primary['file_id'], filename=primary['filename'])
+            for name in SCOPE_FIELDS:
+                if primary[name] is None:
+                    metadata.pop(name, None)
+                else:
+                    metadata[name] = primary[name]
+            metadatas.append(metadata)
+        self.files_store.update(FILES_COLLECTION, ids=results['ids'], metadatas=metadatas)
+
+    def _release_owner(self, file_id: str) -> bool:
+        released = self.content_index.release(file_id) if self.content_index else None
+        if not released:
+            return False
+        if released['remaining']:
+            self._queue_cleanup('reassign', file_id=file_id, content_hash=released['content_hash'])
+            logging.info(f"Released {file_id}, content {released['content_hash'][:12]} still has "
+                         f"{released['remaining']} owner(s)")
+        else:
+            layout = self.file_manifest.content_layout(released['content_hash']) if self.file_manifest else None
+            if layout and layout[1] is not None:
+                self._queue_cleanup('delete', content_hash=released['content_hash'], chunk_prefix=layout[0],
+                                    chunk_span=layout[1])
+            else:
+                self._queue_cleanup('delete', content_hash=released['content_hash'])
+            logging.info(f"Deleting vectors of content {released['content_hash'][:12]} with its last owner {file_id}")
+        return True
+
+    @contextmanager
+    def _catalog_transaction(self):
+        # Content index và manifest nằm chung một file sqlite nên ghi trong một giao dịch. Việc trên Chroma được xếp
+        # vào chunk_cleanup trong giao dịch đó, bên gọi chạy _run_cleanup() sau khi commit.
+        store = self.file_manifest or self.content_index
+        with store.transaction() if store else nullcontext():
+            yield
+
+    def _queue_cleanup(self, action: str, file_id: Optional[str] = None, content_hash: Optional[str] = None,
+                       chunk_prefix: Optional[str] = None, chunk_span: Optional[int] = None):
+        task = dict(action=action, file_id=file_id, content_hash=content_hash, chunk_prefix=chunk_prefix,
+                    chunk_span=chunk_span)
+        if self.file_manifest:
+            self.file_manifest.queue_cleanup(**task)
+        else:
+            self._apply_cleanup([task])
+
+    def _apply_cleanup(self, tasks: List[Dict[str, Any]]):
+        ids = []
+        where_hashes = []
+        where_files = []
+        for task in tasks:
+            content_hash = task['content_hash']
+            if task['action'] == 'reassign':
+                self._reassign_chunks(content_hash, task['file_id'])
+                continue
+            # Id chunk suy ra từ nội dung (hoặc từ file_id khi không dedup): nếu đã được upload lại sau khi xếp lịch
+            # thì chunk hiện có thuộc về bản mới
+            if content_hash and self.content_index and (
+                    self.content_index.get(content_hash) or self.content_index.owners(content_hash)):
+                continue
+            if not content_hash and self.file_manifest and self.file_manifest.get(task['file_id']):
+                continue
+            if task['chunk_prefix'] and task['chunk_span'] is not None:
+                ids.extend(self._chunk_ids(task['chunk_prefix'], task['chunk_span']))
+            elif content_hash:
+                where_hashes.append(content_hash)
+            else:
+                where_files.append(task['file_id'])
+
+        self._delete_chunk_ids(ids)
+        if where_hashes:
+            self.files_store.delete(FILES_COLLECTION, where={"content_hash": {"$in": where_hashes}})
+        if where_files:
+            self.files_store.delete(FILES_COLLECTION, where={"file_id": {"$in": where_files}})
+
+    def _run_cleanup(self) -> int:
+        # Trả về số việc lỗi; chúng được nhả ra để lần chạy sau (hoặc lần khởi động sau) thử lại
+        if not self.file_manifest or not self.files_store:
+            return 0
+        failed = []
+        try:
+            while True:
+                tasks = self.file_manifest.claim_cleanup()
+                if not tasks:
+                    break
+                task_ids = [task['id'] for task in tasks]
+                try:
+                    self._apply_cleanup(tasks)
+                    self.file_manifest.finish_cleanup(task_ids)
+                except Exception as e:
+                    ERRORS.inc(component='chunk_cleanup')
+                    logging.error(f"Chunk cleanup of {len(tasks)} task(s) failed: {e}")
+                    failed.extend(task_ids)
+        finally:
+            self.file_manifest.unclaim_cleanup(failed)
+        return len(failed)
+
+    @staticmethod
+    def _chunk_ids(chunk_prefix: str, chunk_span: int) -> List[str]:
+        return [f"{chunk_prefix}_{i}" for i in range(chunk_span)]
+
+    def _delete_chunk_ids(self, ids: List[str]):
+        # Id được tính từ manifest nên xóa thẳng, không cần đọc trước; id không tồn tại được Chroma bỏ qua
+        for i in range(0, len(ids), DELETE_BATCH_IDS):
+            self.files_store.delete(FILES_COLLECTION, ids=ids[i:i + DELETE_BATCH_IDS])
+
+    def _discard_chunks(self, content_hash: Optional[str], ids: List[str]):
+        # Id chunk suy ra từ nội dung nên có thể đã thuộc về bản cùng nội dung do worker khác đăng ký: chỉ xóa khi
+        # nội dung chưa có trong content index
+        if not ids:
+            return
+        if content_hash and self.content_index and (
+                self.content_index.get(content_hash) or self.content_index.owners(content_hash)):
+            logging.info(f"Keeping chunks of content {content_hash[:12]}, it is owned by another file")
+            return
+        self._delete_chunk_ids(ids)
+
+    def _drop_previous_layout(self, file_id: str):
+        # Khi không dedup, id chunk gắn với file_id: bản upload trước có nhiều chunk hơn sẽ để lại chunk thừa
+        previous = self.file_manifest.get(file_id) if self.file_manifest else None
+        if not previous or previous['content_hash'] or not previous['chunk_prefix']:
+            return
+        if previous['chunk_span'] is not None:
+            self._delete_chunk_ids(self._chunk_ids(previous['chunk_prefix'], previous['chunk_span']))
+        else:
+            self.files_store.delete(FILES_COLLECTION, where={"file_id": file_id})
+        self.file_manifest.remove_many([file_id])
+
+    def _record_file(self, file_id: str, filename: str, vector_id: str, content_hash: Optional[str],
+                     chunk_prefix: Optional[str], chunks_count: int, chunk_span: Optional[int], byte_size: int,
+                     scope: Dict[str, str]):
+        if not self.file_manifest:
+            return
+        if content_hash and self.content_index:
+            # Nội dung đã có từ trước (trùng bytes hoặc trùng văn bản): dùng bố cục id chunk của bản đã lưu
+            layout = self.file_manifest.content_layout(content_hash)
+            if layout:
+                chunk_prefix, chunk_span = layout
+            elif chunk_prefix is None:
+                content = self.content_index.get(content_hash)
+                chunk_prefix = content['vector_id'] if content else None
+        self.file_manifest.record(dict(
+            scope,
+            file_id=file_id,
+            filename=filename,
+            vector_id=vector_id,
+            content_hash=content_hash,
+            chunk_prefix=chunk_prefix,
+            chunks_count=chunks_count,
+            chunk_span=chunk_span,
+            byte_size=byte_size,
+            embedding_model=self.embedding_cache_key
+        ))
+
+    def process_file(self, file_content: BytesIO, filename: str, content_type: str, file_id: str,
+                     progress_callback: Optional[Callable[[str, str], None]] = None,
+                     summary_mode: str = FILE_SUMMARY_MODE,
+                     scope: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        timings = {}
+        scope = scope or {}
+        pipeline_started = time.perf_counter()
+        stage = _StageTimer(timings, progress_callback)
+        vector_id = vector_id_for(file_id, filename)
+        byte_size = stream_size(file_content)
+
+        content_hash = None
+        if self.content_index:
+            started = time.perf_counter()
+            content_hash = self._hash_content(file_content)
+            timings['hashing'] = round((time.perf_counter() - started) * 1000, 1)
+            if self.content_index.get(content_hash):
+                with self._catalog_transaction():
+                    # Đọc lại trong giao dịch: owner cuối của nội dung có thể vừa bị xóa ở worker khác
+                    existing = self.content_index.get(content_hash)
+                    if existing:
+                        self._attach_owner(file_id, content_hash, filename, vector_id, scope)
+                        self._record_file(file_id, filename, vector_id, content_hash, existing['vector_id'],
+                                          existing['chunks_count'], None, byte_size, scope)
+                self._run_cleanup()
+                if existing:
+                    return self._reuse_content(existing, file_id, filename, vector_id, summary_mode, timings,
+                                               pipeline_started)
+        # Chunk của cùng một nội dung luôn có cùng id nên hai worker ghi trùng chỉ ghi đè lẫn nhau
+        chunk_prefix = f"content_{content_hash[:16]}" if content_hash else vector_id
+        extracted = {}
+
+        # Chỉ giữ phần đầu văn bản (đủ cho tóm tắt và xem trước) thay vì toàn bộ nội dung file
+        preview = []
+        preview_chars = 0
+        summary_future = None
+        in_flight = []
+        stored_ids = []
+        embedding_errors = {}
+        chunks_total = 0
+        batch = []
+
+        def start_summary():
+            nonlocal summary_future
+            if summary_future is None and summary_mode in ('parallel', 'lazy') and preview_chars:
+                # Tóm tắt và vector hóa không phụ thuộc nhau nên chạy song song
+                summary_future = self._pipeline_executor.submit(
+                    stage.run_once, 'summarizing', self.summarize_text, "\n".join(preview), 500
+                )
+                self._remember_summary(file_id, summary_future)
+
+        def collect(future):
+            result = future.result()
+            stored_ids.extend(result['ids'])
+            embedding_errors.update(result['errors'])
+
+        def flush_batch():
+            nonlocal batch, chunks_total
+            if not batch:
+                return
+            # Giới hạn số lô đang chờ để bộ nhớ không tăng theo kích thước file
+            while len(in_flight) >= max(1, INGEST_MAX_IN_FLIGHT):
+                collect(in_flight.pop(0))
+            in_flight.append(self._pipeline_executor.submit(
+                self._embed_and_store, stage, chunk_prefix, file_id, filename, content_hash, scope, chunks_total,
+                batch
+            ))
+            chunks_total += len(batch)
+            batch = []
+
+        def discard():
+            # Chờ các lô đang vector hóa xong rồi mới xóa, nếu không chunk ghi muộn sẽ còn sót lại trong kho
+            for future in in_flight:
+                try:
+                    collect(future)
+                except Exception:
+                    pass
+            in_flight.clear()
+            if stored_ids:
+                try:
+                    self._discard_chunks(content_hash, stored_ids)
+                except Exception as cleanup_error:
+                    logging.error(f"Error cleaning up partial vectors for {vector_id}: {cleanup_error}")
+
+        try:
+            if not content_hash:
+                self._drop_previous_layout(file_id)
+            if self.extraction_pool is not None:
+                chunk_stream = self._iter_chunks_pooled(file_content, filename, content_type, stage, extracted)
+            else:
+                chunk_stream = self._iter_chunks_local(file_content, filename, content_type, stage, extracted)
+
+            for text, chunks in chunk_stream:
+                if text and preview_chars <= SUMMARY_INPUT_CHARS:
+                    preview.append(text[:SUMMARY_INPUT_CHARS + 1 - preview_chars])
+                    preview_chars += len(preview[-1])
+                    if preview_chars > SUMMARY_INPUT_CHARS:
+                        start_summary()
+
+                batch.extend(chunks)
+                if len(batch) >= INGEST_BATCH_CHUNKS:
+                    flush_batch()
+
+            stage.done('extracting', 'chunking')
+
+            if not preview_chars or not "".join(preview).strip():
+                discard()
                 return {
                     'success': False,
-                    'error': 'Không thể trích xuất nội dung từ file'
+                    'error': 'Không thể trích xuất nội dung từ file',
+                    'timings_ms': timings
                 }
 
-            summary = self.summarize_text(text, max_length=500)
-
-            chunks = self.chunk_text(text)
-
-            if not chunks:
-                chunks = [text[:1000]]
+            start_summary()
+            flush_batch()
+            while in_flight:
+                collect(in_flight.pop(0))
+            stage.done('embedding', 'storing')
 
-            embeddings = self.create_embeddings(chunks)
-
-            vector_id = f"file_{file_id}_{hashlib.md5(filename.encode()).hexdigest()[:8]}"
+            failed_chunks = [
+                {'chunk_index': i, 'error': error}
+                for i, error in sorted(embedding_errors.items())
+            ]
 
-            ids = [f"{vector_id}_{i}" for i in range(len(chunks))]
-            metadatas = [
-                {
-                    'file_id': file_id,
-                    'filename': filename,
-                    'chunk_index': i,
-                    'total_chunks': len(chunks)
+            if not stored_ids:
+                return {
+                    'success': False,
+                    'error': 'Không thể tạo embedding cho nội dung file',
+                    'failed_chunks': failed_chunks,
+                    'timings_ms': timings
                 }
-                for i in range(len(chunks))
-            ]
 
-            self.file_collection.add(
-                embeddings=embeddings,
-                documents=chunks,
-                metadatas=metadatas,
-                ids=ids
+            summary = None
+            summary_status = 'skipped'
+            if summary_future is not None:
+                if summary_mode == 'parallel':
+                    summary = summary_future.result()
+                    summary_status = 'completed'
+                else:
+                    summary_status = 'pending'
+
+            chunks_count = len(stored_ids)
+            record_hash, record_prefix, chunk_span = content_hash, chunk_prefix, chunks_total
+            with self._catalog_transaction():
+                if content_hash:
+                    chunks_count, summary, summary_status = self._index_content(
+                        content_hash, extracted.get('text_hash'), chunk_prefix, stored_ids, file_id, filename,
+                        vector_id, scope, "\n".join(preview), summary, summary_status, summary_future
+                    )
+                    owner = self.content_index.owner(file_id)
+                    if owner and owner['content_hash'] != content_hash:
+                        record_hash, record_prefix, chunk_span = owner['content_hash'], None, None
+                self._record_file(file_id, filename, vector_id, record_hash, record_prefix, chunks_count,
+                                  chunk_span, byte_size, scope)
+            self._run_cleanup()
+
+            timings['total'] = round((time.perf_counter() - pipeline_started) * 1000, 1)
+
+            logging.info(
+                f"Successfully processed file: {filename} with {len(stored_ids)}/{chunks_total} chunks in {timings['total']}ms"
             )
 
-            logging.info(f"Successfully processed file: {filename} with {len(chunks)} chunks")
-
             return {
                 'success': True,
-                'content': text[:5000],
+                'content': "\n".join(preview)[:5000].strip(),
                 'summary': summary,
+                'summary_status': summary_status,
                 'vector_id': vector_id,
-                'chunks_count': len(chunks)
+                'chunks_count': chunks_count,
+                'failed_chunks': failed_chunks,
+                'timings_ms': dict(timings)
             }
 
         except Exception as e:
             logging.error(f"Error processing file: {e}")
+            # Không để lại một phần file trong kho khi pipeline lỗi giữa chừng
+            discard()
             return {
                 'success': False,
-                'error': str(e)
+                'error': str(e),
+                'timings_ms': timings
             }
 
+    @staticmethod
+    def file_id_from_vector_id(vector_id: str) -> str:
+        file_id = vector_id[len("file_"):] if vector_id.startswith("file_") else vector_id
+        prefix, _, suffix = file_id.rpartition("_")
+        if prefix and len(suffix) == 8 and all(c in "0123456789abcdef" for c in suffix):
+            return prefix
+        return file_id
+
     def delete_vector(self, vector_id: str) -> bool:
         try:
-            results = self.file_collection.get(
-                where={"file_id": vector_id.replace("file_", "")}
-            )
-
-            if results['ids']:
-                self.file_collection.delete(ids=results['ids'])
-                logging.info(f"Deleted {len(results['ids'])} vectors for {vector_id}")
-                return True
-
+            self.delete_vectors(vector_ids=[vector_id])
             return True
 
         except Exception as e:
             logging.error(f"Error deleting vector: {e}")
             return False
 
+    def delete_vectors(self, file_ids: Optional[List[str]] = None, vector_ids: Optional[List[str]] = None,
+                       filters: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        started = time.perf_counter()
+        # Gỡ khỏi content index, bỏ khỏi manifest và xếp lịch xóa chunk trong cùng một giao dịch; chunk được xóa
+        # khỏi Chroma sau khi commit, việc lỗi còn lại trong chunk_cleanup để chạy lại
+        with self._catalog_transaction():
+            rows = self.file_manifest.find(file_ids, vector_ids, filters) if self.file_manifest else []
+            found_files = {row['file_id'] for row in rows}
+            found_vectors = {row['vector_id'] for row in rows}
+            # File vector hóa trước khi có manifest: vẫn xóa theo metadata file_id như trước. Khi có bộ lọc thì chỉ
+            # xóa file có trong manifest vì không kiểm tra được bộ lọc nếu không đọc chunk.
+            unindexed = []
+            if not filters:
+                unindexed = [file_id for file_id in file_ids or [] if file_id not in found_files]
+                unindexed += [self.file_id_from_vector_id(vector_id) for vector_id in vector_ids or []
+                              if vector_id not in found_vectors]
+                unindexed = [file_id for file_id in dict.fromkeys(unindexed) if file_id not in found_files]
+            targets = [row['file_id'] for row in rows] + unindexed
+
+            released = self.content_index.release_many(targets) if self.content_index and targets else {}
+            owned = {file_id: content_hash for content_hash, info in released.items()
+                     for file_id in info['file_ids']}
+
+            handled = set()
+            chunks_deleted = 0
+            for entry in rows + [{'file_id': file_id} for file_id in unindexed]:
+                content_hash = owned.get(entry['file_id'])
+                if content_hash:
+                    # Nội dung còn owner khác thì giữ chunk; chỉ xóa một lần cho mỗi nội dung
+                    if released[content_hash]['remaining'] or content_hash in handled:
+                        continue
+                    handled.add(content_hash)
+                # content_hash của manifest (nếu có) để bước dọn không xóa chunk mà nội dung khác vẫn dùng
+                self._queue_cleanup('delete', file_id=entry['file_id'],
+                                    content_hash=content_hash or entry.get('content_hash'),
+                                    chunk_prefix=entry.get('chunk_prefix'), chunk_span=entry.get('chunk_span'))
+                chunks_deleted += entry.get('chunks_count') or 0
+
+            shared = [content_hash for content_hash, info in released.items() if info['remaining']]
+            for content_hash in shared:
+                for file_id in released[content_hash]['file_ids']:
+                    self._queue_cleanup('reassign', file_id=file_id, content_hash=content_hash)
+
+            removed = self.file_manifest.remove_many(targets) if self.file_manifest else 0
+        failed = self._run_cleanup()
+
+        report = {
+            'files_deleted': removed,
+            'unindexed_files': len(unindexed),
+            'chunks_deleted': chunks_deleted,
+            'contents_deleted': len(released) - len(shared),
+            'contents_shared': len(shared),
+            'cleanup_pending': failed,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 1)
+        }
+        logging.info(f"Bulk deleted vectors: {report}")
+        return report
+
     def search_in_files(self, query: str, n_results: int = 3) -> List[Dict[str, Any]]:
         try:
-            embedding_response = self.client.models.embed_content(
-                model=self.embedding_model,
-                contents=[query]
-            )
-            query_embedding = self._get_embedding_value(embedding_response)
+            query_embedding = self.embedding_cache.get_or_embed(
+                self.embedding_cache_key, [query], self._embed_texts
+            )[0]
 
+            hits = self.files_store.query(FILES_COLLECTION, [query_embedding], n_results=n_results)[0]
 
-            results = self.file_collection.query(
-                query_embeddings=[query_embedding],
-                n_results=n_results,
-                include=['documents', 'metadatas', 'distances']
-            )
-
-            search_results = []
-            if results['documents'] and len(results['documents'][0]) > 0:
-                for doc, metadata, distance in zip(
-                        results['documents'][0],
-                        results['metadatas'][0],
-                        results['distances'][0]
-                ):
-                    search_results.append({
-                        'content': doc,
-                        'filename': metadata.get('filename', 'Unknown'),
-                        'file_id': metadata.get('file_id', ''),
-                        'similarity': 1 - distance
-                    })
-
-            return search_results
+            return [
+                {
+                    'content': hit.document,
+                    'filename': hit.metadata.get('filename', 'Unknown'),
+                    'file_id': hit.metadata.get('file_id', ''),
+                    'similarity': hit.similarity
+                }
+                for hit in hits
+            ]
 
         except Exception as e:
             logging.error(f"Error searching in files: {e}")
             return []
 
-    def get_all_vectors_info(self) -> List[Dict[str, Any]]:
-        try:
-            all_data = self.file_collection.get()
-
-            files_info = {}
-            for metadata in all_data['metadatas']:
-                file_id = metadata.get('file_id', '')
-                if file_id not in files_info:
-                    files_info[file_id] = {
-                        'file_id': file_id,
-                        'filename': metadata.get('filename', 'Unknown'),
-                        'chunks_count': 0
-                    }
-                files_info[file_id]['chunks_count'] += 1
-
-            return list(files_info.values())
-
-        except Exception as e:
-            logging.error(f"Error getting vectors info: {e}")
-            return []
\ No newline at end of file
+    def list_file_vectors(self, filters: Optional[Dict[str, str]] = None, query: str = "", limit: int = 100,
+                          offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        if not self.file_manifest:
+            raise RuntimeError("File manifest chưa được khởi tạo")
+        rows, total = self.file_manifest.list(filters, query, limit, offset)
+        files = []
+        for row in rows:
+            info = {name: value for name, value in row.items() if name not in ('chunk_prefix', 'chunk_span')}
+            info['ingested_at'] = datetime.fromtimestamp(row['ingested_at']).isoformat() if row['ingested_at'] else None
+            files.append(info)
+        return files, total
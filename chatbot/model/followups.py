@@ -0,0 +1,78 @@
+import os
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from model.state_store import get_state_store
+
+# sync: sinh câu hỏi gợi ý trước khi trả lời; async: sinh nền, lấy qua message_id; none: bỏ qua
+FOLLOWUP_MODE = os.getenv("FOLLOWUP_MODE", "sync")
+FOLLOWUP_WORKERS = int(os.getenv("FOLLOWUP_WORKERS", "2"))
+FOLLOWUP_MAX_ENTRIES = int(os.getenv("FOLLOWUP_MAX_ENTRIES", "5000"))
+FOLLOWUP_TTL = int(os.getenv("FOLLOWUP_TTL", "3600"))
+
+FOLLOWUP_MODES = ('sync', 'async', 'none')
+
+
+def new_message_id() -> str:
+    return uuid.uuid4().hex
+
+
+class FollowupQueue:
+    def __init__(self, bot, workers: int = FOLLOWUP_WORKERS, max_entries: int = FOLLOWUP_MAX_ENTRIES,
+                 ttl: int = FOLLOWUP_TTL):
+        self.bot = bot
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Client lấy gợi ý qua message_id có thể rơi vào worker khác, nên kết quả được ghi vào state store
+        self.store = get_state_store()
+        self.workers = max(1, workers)
+        self._start()
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="followup")
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _store(self, message_id: str, entry: Dict[str, Any]):
+        if self.store:
+            try:
+                self.store.put('followup', message_id, entry, self.ttl)
+                return
+            except Exception as e:
+                logging.error(f"Failed to save follow-ups for {message_id}: {e}")
+        with self._lock:
+            self._entries[message_id] = entry
+            self._entries.move_to_end(message_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _run(self, message_id: str, reply: str):
+        try:
+            followups = self.bot.get_contextual_followup(reply)
+            self._store(message_id, {'status': 'completed', 'followup_questions': followups})
+        except Exception as e:
+            logging.error(f"Error generating follow-ups for {message_id}: {e}")
+            self._store(message_id, {'status': 'failed', 'followup_questions': []})
+
+    def submit(self, message_id: str, reply: str):
+        if self.store:
+            try:
+                self.store.purge('followup', self.max_entries)
+            except Exception as e:
+                logging.error(f"Failed to purge follow-ups: {e}")
+        self._store(message_id, {'status': 'pending', 'followup_questions': []})
+        self._executor.submit(self._run, message_id, reply)
+
+    def get(self, message_id: str) -> Optional[Dict[str, Any]]:
+        if self.store:
+            entry = self.store.get('followup', message_id)
+            if entry:
+                return entry
+        with self._lock:
+            entry = self._entries.get(message_id)
+            return dict(entry) if entry else None
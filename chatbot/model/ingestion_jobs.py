@@ -0,0 +1,189 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from io import BytesIO
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Dict, Optional, Union
+from model.file_processor import FILE_SUMMARY_MODE
+from model.uploads import close_quietly
+from model.state_store import get_state_store
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_JOB_TTL = int(os.getenv("INGEST_JOB_TTL", "3600"))
+
+STAGES = ['extracting', 'chunking', 'embedding', 'summarizing', 'storing']
+
+
+class IngestionJobQueue:
+    # Job chạy trong worker nhận upload; trạng thái được ghi vào state store để worker nào cũng trả lời được
+    # khi client thăm dò. Không mở được state store thì chỉ giữ trong bộ nhớ (một worker).
+    def __init__(self, file_processor, workers: int = INGEST_WORKERS, job_ttl: int = INGEST_JOB_TTL):
+        self.file_processor = file_processor
+        self.job_ttl = job_ttl
+        self.store = get_state_store()
+        self.workers = max(1, workers)
+        self._start()
+        os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _now(self) -> str:
+        return datetime.now().isoformat()
+
+    @staticmethod
+    def _snapshot(job: Dict[str, Any]) -> Dict[str, Any]:
+        snapshot = {k: v for k, v in job.items() if not k.startswith('_') and k != 'finished_at'}
+        snapshot['stages'] = {name: dict(info) for name, info in job['stages'].items()}
+        return snapshot
+
+    def _save(self, job: Dict[str, Any]):
+        # Gọi khi đang giữ self._lock; job kết thúc thì chỉ còn trong state store
+        if not self.store:
+            return
+        try:
+            self.store.put('ingest_job', job['job_id'], self._snapshot(job), self.job_ttl)
+        except Exception as e:
+            logging.error(f"Failed to save ingestion job {job['job_id']}: {e}")
+            return
+        if job['status'] in ('completed', 'failed'):
+            self._jobs.pop(job['job_id'], None)
+
+    def _update(self, job_id: str, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                job.update(fields)
+                job['updated_at'] = self._now()
+                self._save(job)
+
+    def _stage_event(self, job_id: str, stage: str, status: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job:
+                return
+            info = job['stages'].setdefault(stage, {'status': 'pending'})
+            info['status'] = status
+            if status == 'running':
+                job['stage'] = stage
+                job['_stage_started'][stage] = time.time()
+            elif stage in job['_stage_started']:
+                info['duration_ms'] = round((time.time() - job['_stage_started'][stage]) * 1000, 1)
+            job['updated_at'] = self._now()
+            self._save(job)
+
+    def _finish(self, job_id: str, status: str, result: Dict[str, Any]):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job:
+                return
+            for info in job['stages'].values():
+                if info['status'] == 'pending':
+                    info['status'] = 'skipped'
+                elif info['status'] == 'running' and status == 'failed':
+                    info['status'] = 'failed'
+            job['status'] = status
+            job['result'] = result
+            job['error'] = None if status == 'completed' else result.get('error', 'Lỗi xử lý file')
+            job['finished_at'] = time.time()
+            job['updated_at'] = self._now()
+            self._save(job)
+
+    def _run(self, job_id: str, content: Union[bytes, BinaryIO], filename: str, content_type: str,
+             file_id: str, summary_mode: str, scope: Optional[Dict[str, str]],
+             on_finish: Optional[Callable[[], None]]):
+        self._update(job_id, status='running')
+        stream = BytesIO(content) if isinstance(content, bytes) else content
+        try:
+            result = self.file_processor.process_file(
+                stream,
+                filename,
+                content_type,
+                file_id,
+                progress_callback=lambda stage, status: self._stage_event(job_id, stage, status),
+                summary_mode=summary_mode,
+                scope=scope
+            )
+        except Exception as e:
+            logging.error(f"Ingestion job {job_id} crashed: {e}")
+            result = {'success': False, 'error': str(e)}
+        finally:
+            close_quietly(stream)
+            if on_finish:
+                on_finish()
+
+        if result.get('success'):
+            self._finish(job_id, 'completed', result)
+            logging.info(f"Ingestion job {job_id} completed for {filename}")
+        else:
+            self._finish(job_id, 'failed', result)
+            logging.error(f"Ingestion job {job_id} failed for {filename}: {result.get('error')}")
+
+    def _purge_expired(self):
+        if self.store:
+            try:
+                self.store.purge('ingest_job')
+            except Exception as e:
+                logging.error(f"Failed to purge ingestion jobs: {e}")
+        cutoff = time.time() - self.job_ttl
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.get('finished_at') and job['finished_at'] < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def submit(self, content: Union[bytes, BinaryIO], filename: str, content_type: str, file_id: str,
+               summary_mode: str = FILE_SUMMARY_MODE, on_finish: Optional[Callable[[], None]] = None,
+               scope: Optional[Dict[str, str]] = None) -> str:
+        self._purge_expired()
+
+        job_id = uuid.uuid4().hex
+        now = self._now()
+        with self._lock:
+            self._jobs[job_id] = {
+                'job_id': job_id,
+                'file_id': file_id,
+                'filename': filename,
+                'status': 'queued',
+                'stage': None,
+                'stages': {stage: {'status': 'pending'} for stage in STAGES},
+                'created_at': now,
+                'updated_at': now,
+                'result': None,
+                'error': None,
+                'finished_at': None,
+                '_stage_started': {}
+            }
+            self._save(self._jobs[job_id])
+
+        self._executor.submit(self._run, job_id, content, filename, content_type, file_id, summary_mode,
+                              scope, on_finish)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            snapshot = self._snapshot(job) if job else None
+        if snapshot is None and self.store:
+            snapshot = self.store.get('ingest_job', job_id)
+        if snapshot is None:
+            return None
+        completed = sum(1 for info in snapshot['stages'].values() if info['status'] in ('done', 'skipped'))
+        snapshot['progress'] = round(completed / len(snapshot['stages']), 2)
+        return snapshot
+
+    def stats(self) -> Dict[str, int]:
+        if self.store:
+            return self.store.counts('ingest_job', 'status')
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            return counts
@@ -0,0 +1,301 @@
+import os
+import re
+import logging
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+from model.paths import data_path
+from model.sqlite_util import SqliteStore
+
+LEXICAL_SEARCH = os.getenv("LEXICAL_SEARCH", "1").lower() in ("1", "true", "yes", "on")
+LEXICAL_INDEX_PATH = data_path("LEXICAL_INDEX_PATH")
+# Câu hỏi chứa mã (tiêu chí, minh chứng, biểu mẫu...) chỉ khớp với ít chunk thì trả lời bằng chỉ mục từ khóa,
+# không cần gọi API embedding
+LEXICAL_SKIP_EMBEDDING = os.getenv("LEXICAL_SKIP_EMBEDDING", "1").lower() in ("1", "true", "yes", "on")
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+REBUILD_PAGE_SIZE = 500
+# Số tham số tối đa trong một mệnh đề IN (giới hạn biến của sqlite)
+QUERY_BATCH = 500
+# Metadata được chép sang chỉ mục để xóa theo cùng điều kiện where với Chroma mà không phải hỏi id trước
+METADATA_COLUMNS = ("file_id", "content_hash")
+
+# Một từ hoặc một mã nối bằng . - / (H1.01.02, TC-3, 12/QĐ-HVN)
+TERM_PATTERN = re.compile(r"\w+(?:[./\-]\w+)*")
+WORD_PATTERN = re.compile(r"\w+")
+DIGIT_PATTERN = re.compile(r"\d")
+
+
+def fold(text: str) -> str:
+    # Bỏ dấu tiếng Việt: "Minh chứng Đạt" -> "minh chung dat"
+    text = unicodedata.normalize("NFD", text.lower()).replace("đ", "d")
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def analyze(text: str) -> Tuple[List[str], List[str]]:
+    # Trả về (terms, codes). Mỗi âm tiết được đánh chỉ mục ở dạng bỏ dấu và dạng có dấu (nếu khác) để câu hỏi
+    # gõ không dấu vẫn khớp còn câu hỏi có dấu khớp chính xác hơn; thêm cặp âm tiết liền nhau vì từ tiếng
+    # Việt thường gồm nhiều âm tiết. Mã (có chữ số, không chỉ là số) được giữ nguyên thành một term.
+    terms = []
+    codes = []
+    previous = None
+    for match in TERM_PATTERN.finditer(unicodedata.normalize("NFC", text.lower())):
+        token = match.group()
+        if DIGIT_PATTERN.search(token) and not token.isdigit():
+            code = fold(token)
+            if code not in codes:
+                codes.append(code)
+            if not WORD_PATTERN.fullmatch(token):
+                terms.append(code)
+        for word in WORD_PATTERN.findall(token):
+            folded = fold(word)
+            terms.append(folded)
+            if folded != word:
+                terms.append(word)
+            if previous:
+                terms.append(f"{previous}_{folded}")
+            previous = folded
+    return terms, codes
+
+
+def _match_expression(terms: List[str], operator: str) -> str:
+    return f" {operator} ".join(f'"{term}"' for term in dict.fromkeys(terms))
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = HYBRID_RRF_K) -> List[Tuple[str, float]]:
+    # Điểm được chuẩn hóa về [0, 1]: 1 khi đứng đầu mọi danh sách
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    best = len(rankings) / (k + 1)
+    return sorted(((doc_id, score / best) for doc_id, score in scores.items()), key=lambda item: -item[1])
+
+
+def where_condition(where: Optional[Dict[str, Any]]) -> Optional[Tuple[str, List[Any]]]:
+    # Dịch where của Chroma sang SQL trên các cột metadata; chỉ hỗ trợ so sánh bằng, $in và $and.
+    # Trả None khi không dịch được, lúc đó phải xóa theo id.
+    if not isinstance(where, dict) or len(where) != 1:
+        return None
+    (key, value), = where.items()
+    if key == "$and":
+        if not isinstance(value, list) or not value:
+            return None
+        parts = [where_condition(clause) for clause in value]
+        if any(part is None for part in parts):
+            return None
+        return " AND ".join(f"({sql})" for sql, _ in parts), [param for _, params in parts for param in params]
+    if key not in METADATA_COLUMNS:
+        return None
+    if isinstance(value, dict):
+        if len(value) != 1:
+            return None
+        (operator, operand), = value.items()
+        if operator == "$eq":
+            value = operand
+        elif operator == "$in" and isinstance(operand, list):
+            if not operand:
+                return "0", []
+            return f"{key} IN ({','.join('?' * len(operand))})", list(operand)
+        else:
+            return None
+    if not isinstance(value, str):
+        return None
+    return f"{key} = ?", [value]
+
+
+class LexicalIndex(SqliteStore):
+    # Chỉ mục BM25 (SQLite FTS5) song song với các collection Chroma, ghi cùng lúc với VectorStore.
+    # Mỗi collection có bảng FTS riêng để IDF không bị trộn giữa kho kiến thức và file upload.
+    def __init__(self, db_path: str = LEXICAL_INDEX_PATH):
+        super().__init__(db_path)
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "id INTEGER PRIMARY KEY, collection TEXT, doc_id TEXT, UNIQUE(collection, doc_id))"
+            )
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(entries)")}
+            missing = [column for column in METADATA_COLUMNS if column not in existing]
+            for column in missing:
+                conn.execute(f"ALTER TABLE entries ADD COLUMN {column} TEXT")
+            if missing:
+                # Chỉ mục cũ chưa có metadata: bỏ hết để sync() dựng lại từ Chroma ở lần warm_up tới
+                conn.execute("DELETE FROM entries")
+            for column in METADATA_COLUMNS:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_entries_{column} ON entries(collection, {column})")
+
+    def _open(self):
+        super()._open()
+        self._tables = set()
+
+    def _table(self, collection: str) -> str:
+        table = "terms_" + re.sub(r"\W", "_", collection)
+        if table not in self._tables:
+            # Terms đã được chuẩn hóa sẵn, tokenizer chỉ cần tách theo khoảng trắng
+            self._conn.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+                f"terms, tokenize=\"unicode61 remove_diacritics 0 tokenchars '._-/'\")"
+            )
+            self._tables.add(table)
+        return table
+
+    def _delete_matching(self, table: str, condition: str, params: List[Any]):
+        self._conn.execute(
+            f"DELETE FROM {table} WHERE rowid IN (SELECT id FROM entries WHERE {condition})", params
+        )
+        self._conn.execute(f"DELETE FROM entries WHERE {condition}", params)
+
+    def _delete_ids(self, table: str, collection: str, doc_ids: List[str]):
+        for i in range(0, len(doc_ids), QUERY_BATCH):
+            batch = doc_ids[i:i + QUERY_BATCH]
+            self._delete_matching(
+                table, f"collection = ? AND doc_id IN ({','.join('?' * len(batch))})", [collection] + batch
+            )
+
+    def _insert(self, table: str, collection: str, doc_ids: List[str], documents: List[str],
+                metadatas: Optional[List[Optional[Dict[str, Any]]]] = None):
+        metadatas = metadatas or [None] * len(doc_ids)
+        for doc_id, document, metadata in zip(doc_ids, documents, metadatas):
+            metadata = metadata or {}
+            cursor = self._conn.execute(
+                f"INSERT INTO entries (collection, doc_id, {', '.join(METADATA_COLUMNS)}) "
+                f"VALUES (?, ?{', ?' * len(METADATA_COLUMNS)})",
+                [collection, doc_id] + [metadata.get(column) for column in METADATA_COLUMNS]
+            )
+            self._conn.execute(
+                f"INSERT INTO {table} (rowid, terms) VALUES (?, ?)",
+                (cursor.lastrowid, " ".join(analyze(document or "")[0]))
+            )
+
+    def upsert(self, collection: str, doc_ids: List[str], documents: List[str],
+               metadatas: Optional[List[Optional[Dict[str, Any]]]] = None):
+        with self._transaction():
+            table = self._table(collection)
+            self._delete_ids(table, collection, doc_ids)
+            self._insert(table, collection, doc_ids, documents, metadatas)
+
+    def update(self, collection: str, doc_ids: List[str], metadatas: List[Optional[Dict[str, Any]]]):
+        # Chroma thay toàn bộ metadata khi update nên cột thiếu cũng được ghi thành NULL
+        with self._transaction() as conn:
+            conn.executemany(
+                f"UPDATE entries SET {', '.join(f'{column} = ?' for column in METADATA_COLUMNS)} "
+                f"WHERE collection = ? AND doc_id = ?",
+                [
+                    [(metadata or {}).get(column) for column in METADATA_COLUMNS] + [collection, doc_id]
+                    for doc_id, metadata in zip(doc_ids, metadatas)
+                ]
+            )
+
+    def delete(self, collection: str, doc_ids: List[str]):
+        with self._transaction():
+            self._delete_ids(self._table(collection), collection, doc_ids)
+
+    def delete_where(self, collection: str, where: Dict[str, Any]):
+        clauses = [where]
+        (key, value), = where.items()
+        if isinstance(value, dict) and isinstance(value.get("$in"), list) and len(value["$in"]) > QUERY_BATCH:
+            clauses = [{key: {"$in": value["$in"][i:i + QUERY_BATCH]}} for i in range(0, len(value["$in"]), QUERY_BATCH)]
+        conditions = [where_condition(clause) for clause in clauses]
+        if any(condition is None for condition in conditions):
+            raise ValueError(f"Unsupported where clause for lexical index: {where}")
+        with self._transaction():
+            table = self._table(collection)
+            for sql, params in conditions:
+                self._delete_matching(table, f"collection = ? AND {sql}", [collection] + params)
+
+    def count(self, collection: str) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM entries WHERE collection = ?", (collection,)
+            ).fetchone()[0]
+
+    def search(self, collection: str, query: str, limit: int = HYBRID_CANDIDATES,
+               prefixes: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        terms, _ = analyze(query)
+        if not terms:
+            return []
+        return self._match(collection, _match_expression(terms, "OR"), limit, prefixes)
+
+    def exact_matches(self, collection: str, query: str, limit: int,
+                      prefixes: Optional[List[str]] = None) -> Optional[List[Tuple[str, float]]]:
+        # Các chunk chứa mọi mã trong câu hỏi, chỉ khi mã đủ chọn lọc (không quá limit chunk); ngược lại None
+        terms, codes = analyze(query)
+        if not codes:
+            return None
+        hits = self._match(
+            collection, f"({_match_expression(codes, 'AND')}) AND ({_match_expression(terms, 'OR')})", limit + 1,
+            prefixes
+        )
+        if not hits or len(hits) > limit:
+            return None
+        return hits
+
+    def _match(self, collection: str, expression: str, limit: int,
+               prefixes: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        # prefixes giới hạn kết quả vào các chunk có id bắt đầu bằng một trong các tiền tố (phạm vi truy xuất)
+        if prefixes is not None and not prefixes:
+            return []
+        params = [expression]
+        scoped = ""
+        if prefixes:
+            scoped = " AND (" + " OR ".join(["(entries.doc_id >= ? AND entries.doc_id < ?)"] * len(prefixes)) + ")"
+            for prefix in prefixes:
+                params.extend((prefix, prefix + "\U0010ffff"))
+        with self._lock:
+            table = self._table(collection)
+            rows = self._conn.execute(
+                f"SELECT entries.doc_id, -bm25({table}) FROM {table} JOIN entries ON entries.id = {table}.rowid "
+                f"WHERE {table} MATCH ?{scoped} ORDER BY bm25({table}) LIMIT ?",
+                params + [limit]
+            ).fetchall()
+        return [(doc_id, score) for doc_id, score in rows]
+
+    def sync(self, store, collection: str) -> bool:
+        # Dựng lại từ Chroma khi số chunk lệch (chỉ mục mới bật, hoặc kho được ghi khi chỉ mục bị tắt)
+        expected = store.count(collection)
+        if self.count(collection) == expected:
+            return False
+
+        with self._transaction() as conn:
+            table = self._table(collection)
+            if conn.execute(
+                    "SELECT COUNT(*) FROM entries WHERE collection = ?", (collection,)
+            ).fetchone()[0] == expected:
+                return False
+            conn.execute(f"DELETE FROM {table}")
+            conn.execute("DELETE FROM entries WHERE collection = ?", (collection,))
+            offset = 0
+            while True:
+                page = store.get(
+                    collection, include=['documents', 'metadatas'], limit=REBUILD_PAGE_SIZE, offset=offset
+                )
+                if not page['ids']:
+                    break
+                self._insert(table, collection, page['ids'], page['documents'], page['metadatas'])
+                offset += len(page['ids'])
+        logging.info(f"Rebuilt lexical index for {collection} with {offset} documents")
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT collection, COUNT(*) FROM entries GROUP BY collection").fetchall()
+        return dict(rows)
+
+
+_lexical_index = None
+_lexical_index_lock = threading.Lock()
+
+
+def get_lexical_index() -> Optional[LexicalIndex]:
+    global _lexical_index
+    if not LEXICAL_SEARCH:
+        return None
+    with _lexical_index_lock:
+        if _lexical_index is None:
+            try:
+                _lexical_index = LexicalIndex()
+            except Exception as e:
+                logging.error(f"Failed to open lexical index at {LEXICAL_INDEX_PATH}: {e}")
+                return None
+        return _lexical_index
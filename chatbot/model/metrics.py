@@ -0,0 +1,300 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from model.paths import data_path
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Thư mục chung cho các worker gunicorn (Registry.share ở post_fork): mỗi worker ghi định kỳ một file snapshot,
+# /api/metrics cộng dồn mọi file như chế độ multiprocess của prometheus_client. Chạy một process thì không dùng.
+METRICS_DIR = data_path("CHATBOT_METRICS_DIR")
+METRICS_FLUSH_INTERVAL = float(os.getenv("CHATBOT_METRICS_FLUSH_INTERVAL", "5"))
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = "untyped"
+    # Counter/Histogram được cộng dồn giữa các worker; Gauge lấy từ kho dùng chung nên chỉ đọc tại chỗ
+    shared = False
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Any]:
+        return {}
+
+    def merge(self, total: Any, value: Any) -> Any:
+        return value
+
+
+class Counter(_Metric):
+    kind = "counter"
+    shared = True
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def snapshot(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, total: float, value: float) -> float:
+        return total + value
+
+    def render(self, values: Optional[Dict[Tuple[str, ...], float]] = None) -> List[str]:
+        items = (self.snapshot() if values is None else values).items()
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._callbacks = []
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, fn: Callable[[], Dict[Tuple[str, ...], float]]):
+        self._callbacks.append(fn)
+
+    def render(self, values=None) -> List[str]:
+        for fn in self._callbacks:
+            try:
+                for key, value in fn().items():
+                    with self._lock:
+                        self._values[tuple(key)] = value
+            except Exception as e:
+                logging.error(f"Error collecting gauge {self.name}: {e}")
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+    shared = True
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Any]:
+        with self._lock:
+            return {key: [list(entry[0]), entry[1], entry[2]] for key, entry in self._values.items()}
+
+    def merge(self, total: Any, value: Any) -> Any:
+        return [[a + b for a, b in zip(total[0], value[0])], total[1] + value[1], total[2] + value[2]]
+
+    def render(self, values: Optional[Dict[Tuple[str, ...], Any]] = None) -> List[str]:
+        items = (self.snapshot() if values is None else values).items()
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+        self._directory = None
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def share(self, directory: str, interval: float = METRICS_FLUSH_INTERVAL):
+        # Gọi trong từng worker (post_fork); số liệu process cha có trước khi fork không được tính
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        for metric in self._metrics:
+            if metric.shared:
+                with metric._lock:
+                    metric._values.clear()
+        threading.Thread(target=self._flush_loop, args=(interval,), name="metrics-flush", daemon=True).start()
+
+    def _flush_loop(self, interval: float):
+        while True:
+            time.sleep(interval)
+            try:
+                self.write_snapshot()
+            except Exception as e:
+                logging.error(f"Metrics snapshot error: {e}")
+
+    def write_snapshot(self):
+        if not self._directory:
+            return
+        with self._lock:
+            metrics = [metric for metric in self._metrics if metric.shared]
+        data = {metric.name: [[list(key), value] for key, value in metric.snapshot().items()] for metric in metrics}
+        # File của worker đã thoát được giữ lại để counter không bị giảm khi worker được tái tạo
+        path = os.path.join(self._directory, f"{os.getpid()}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(path + ".tmp", path)
+
+    def _collect(self, metrics: List[_Metric]) -> Dict[str, Dict[Tuple[str, ...], Any]]:
+        self.write_snapshot()
+        totals = {}
+        for filename in sorted(os.listdir(self._directory)):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self._directory, filename)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.error(f"Skipping metrics snapshot {filename}: {e}")
+                continue
+            for metric in metrics:
+                values = totals.setdefault(metric.name, {})
+                for key, value in data.get(metric.name, []):
+                    key = tuple(key)
+                    values[key] = metric.merge(values[key], value) if key in values else value
+        return totals
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        totals = self._collect(metrics) if self._directory else None
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render(totals.get(metric.name, {}) if totals is not None and metric.shared else None))
+        return "\n".join(lines) + "\n"
+
+
+def clear_snapshots(directory: str = METRICS_DIR):
+    # Gọi một lần khi master khởi động để số liệu của lần chạy trước không bị cộng vào
+    if not os.path.isdir(directory):
+        return
+    for filename in os.listdir(directory):
+        if filename.endswith((".json", ".tmp")):
+            os.remove(os.path.join(directory, filename))
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "chatbot_stage_duration_seconds",
+    "Thời gian xử lý theo từng giai đoạn",
+    ["stage"]
+))
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "chatbot_http_request_duration_seconds",
+    "Thời gian xử lý HTTP request theo endpoint",
+    ["endpoint", "method", "status"]
+))
+ERRORS = REGISTRY.register(Counter(
+    "chatbot_errors_total",
+    "Số lỗi theo thành phần",
+    ["component"]
+))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "chatbot_cache_requests_total",
+    "Số lần tra cache theo loại cache và kết quả",
+    ["cache", "result"]
+))
+TOKENS = REGISTRY.register(Counter(
+    "chatbot_tokens_total",
+    "Số token đã dùng cho sinh văn bản",
+    ["direction"]
+))
+COLLECTION_DOCUMENTS = REGISTRY.register(Gauge(
+    "chatbot_collection_documents",
+    "Số document trong từng collection",
+    ["collection"]
+))
+ACTIVE_SESSIONS = REGISTRY.register(Gauge(
+    "chatbot_active_sessions",
+    "Số phiên chat đang lưu"
+))
+RETRIEVALS = REGISTRY.register(Counter(
+    "chatbot_retrievals_total",
+    "Số lần truy xuất ngữ cảnh theo collection và cách truy xuất (hybrid, lexical, vector)",
+    ["collection", "mode"]
+))
+CONTEXT_TOKENS = REGISTRY.register(Histogram(
+    "chatbot_context_tokens",
+    "Số token (ước lượng) của ngữ cảnh đưa vào prompt theo collection",
+    ["collection"],
+    buckets=(250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000)
+))
+UPLOAD_INFLIGHT_BYTES = REGISTRY.register(Gauge(
+    "chatbot_upload_inflight_bytes",
+    "Tổng dung lượng file upload đang được xử lý"
+))
+UPLOAD_REJECTIONS = REGISTRY.register(Counter(
+    "chatbot_upload_rejections_total",
+    "Số upload bị từ chối theo lý do",
+    ["reason"]
+))
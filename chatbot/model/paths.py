@@ -0,0 +1,24 @@
+import os
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Thư mục gốc cho mọi dữ liệu cục bộ (Chroma, các file sqlite); mỗi kho vẫn có thể đặt riêng bằng biến môi trường
+DATA_DIR = os.getenv("CHATBOT_DATA_DIR") or BASE_DIR
+
+# Mọi kho dữ liệu mới phải được khai báo ở đây để benchmark/test chuyển được toàn bộ sang thư mục tạm
+DATA_PATHS = {
+    "KNOWLEDGE_CHROMA_PATH": ("chroma_db",),
+    "FILES_CHROMA_PATH": ("chroma_db_files",),
+    "EMBEDDING_CACHE_PATH": ("cache", "embeddings.sqlite3"),
+    "SESSION_DB_PATH": ("cache", "sessions.sqlite3"),
+    "CONTENT_INDEX_PATH": ("cache", "content_index.sqlite3"),
+    "LEXICAL_INDEX_PATH": ("cache", "lexical_index.sqlite3"),
+    # Chung file với content index để ghi của hai kho nằm trong một giao dịch
+    "FILE_MANIFEST_PATH": ("cache", "content_index.sqlite3"),
+    "STATE_DB_PATH": ("cache", "state.sqlite3"),
+    "CHATBOT_METRICS_DIR": ("cache", "metrics"),
+}
+
+
+def data_path(name: str) -> str:
+    return os.getenv(name) or os.path.join(DATA_DIR, *DATA_PATHS[name])
@@ -0,0 +1,210 @@
+import os
+import re
+import time
+import math
+import hashlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Iterator, List, Optional
+
+from google import genai
+from google.genai import types
+
+from model.metrics import TOKENS
+
+# gemini: gọi Gemini API; local: embedding băm và câu trả lời mẫu, không cần mạng
+AI_PROVIDER = os.getenv("AI_PROVIDER", "gemini")
+LOCAL_EMBEDDING_DIM = int(os.getenv("LOCAL_EMBEDDING_DIM", "768"))
+LOCAL_EMBEDDING_LATENCY_MS = float(os.getenv("LOCAL_EMBEDDING_LATENCY_MS", "0"))
+LOCAL_GENERATION_LATENCY_MS = float(os.getenv("LOCAL_GENERATION_LATENCY_MS", "0"))
+
+
+def record_usage(response):
+    usage = getattr(response, 'usage_metadata', None)
+    if not usage:
+        return
+    TOKENS.inc(usage.prompt_token_count or 0, direction='input')
+    TOKENS.inc(usage.candidates_token_count or 0, direction='output')
+
+
+def embedding_values(response) -> List[List[float]]:
+    embeddings = getattr(response, 'embeddings', None)
+    if embeddings:
+        return [list(e.values) for e in embeddings]
+    embedding = getattr(response, 'embedding', None)
+    if embedding:
+        return [list(embedding)]
+    return []
+
+
+class AIProvider(ABC):
+    name = "base"
+
+    def embedding_key(self, model: str) -> str:
+        return f"{self.name}/{model}"
+
+    @abstractmethod
+    def embed(self, model: str, texts: List[str]) -> List[List[float]]:
+        pass
+
+    @abstractmethod
+    def generate(self, model: str, prompt: str, system_instruction: Optional[str] = None,
+                 temperature: float = 0.3, max_output_tokens: Optional[int] = None) -> str:
+        pass
+
+    @abstractmethod
+    def generate_stream(self, model: str, prompt: str, system_instruction: Optional[str] = None,
+                        temperature: float = 0.3, max_output_tokens: Optional[int] = None) -> Iterator[str]:
+        pass
+
+
+class GeminiProvider(AIProvider):
+    name = "gemini"
+
+    def __init__(self, api_key: Optional[str] = None):
+        api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY environment variable not set.")
+
+        self.api_key = api_key
+        self.client = genai.Client(api_key=api_key)
+        # Pool kết nối HTTP của process cha không được dùng lại trong worker sau fork
+        os.register_at_fork(after_in_child=self._reconnect)
+        self.safety_settings = [
+            types.SafetySetting(
+                category=types.HarmCategory.HARM_CATEGORY_HARASSMENT,
+                threshold=types.HarmBlockThreshold.BLOCK_NONE,
+            ),
+            types.SafetySetting(
+                category=types.HarmCategory.HARM_CATEGORY_HATE_SPEECH,
+                threshold=types.HarmBlockThreshold.BLOCK_NONE,
+            ),
+        ]
+
+    def _reconnect(self):
+        self.client = genai.Client(api_key=self.api_key)
+
+    def embedding_key(self, model: str) -> str:
+        return model
+
+    def _config(self, system_instruction: Optional[str], temperature: float,
+                max_output_tokens: Optional[int]) -> types.GenerateContentConfig:
+        return types.GenerateContentConfig(
+            system_instruction=system_instruction,
+            temperature=temperature,
+            max_output_tokens=max_output_tokens,
+            safety_settings=self.safety_settings
+        )
+
+    def embed(self, model: str, texts: List[str]) -> List[List[float]]:
+        response = self.client.models.embed_content(
+            model=model,
+            contents=texts
+        )
+        return embedding_values(response)
+
+    def generate(self, model: str, prompt: str, system_instruction: Optional[str] = None,
+                 temperature: float = 0.3, max_output_tokens: Optional[int] = None) -> str:
+        response = self.client.models.generate_content(
+            model=model,
+            contents=prompt,
+            config=self._config(system_instruction, temperature, max_output_tokens)
+        )
+        record_usage(response)
+        return response.text or ""
+
+    def generate_stream(self, model: str, prompt: str, system_instruction: Optional[str] = None,
+                        temperature: float = 0.3, max_output_tokens: Optional[int] = None) -> Iterator[str]:
+        last = None
+        for chunk in self.client.models.generate_content_stream(
+            model=model,
+            contents=prompt,
+            config=self._config(system_instruction, temperature, max_output_tokens)
+        ):
+            # usage_metadata của chunk cuối là tổng cho cả lượt sinh
+            last = chunk
+            if chunk.text:
+                yield chunk.text
+        record_usage(last)
+
+
+class LocalProvider(AIProvider):
+    name = "local"
+
+    def __init__(self, dim: int = LOCAL_EMBEDDING_DIM,
+                 embedding_latency_ms: float = LOCAL_EMBEDDING_LATENCY_MS,
+                 generation_latency_ms: float = LOCAL_GENERATION_LATENCY_MS):
+        self.dim = dim
+        self.embedding_latency_ms = embedding_latency_ms
+        self.generation_latency_ms = generation_latency_ms
+
+    def _embed_one(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        tokens = re.findall(r"\w+", text.lower()) or [text]
+        for token in tokens:
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed(self, model: str, texts: List[str]) -> List[List[float]]:
+        if self.embedding_latency_ms:
+            time.sleep(self.embedding_latency_ms / 1000)
+        return [self._embed_one(text) for text in texts]
+
+    def _reply_words(self, prompt: str, max_output_tokens: Optional[int]) -> List[str]:
+        digest = hashlib.md5(prompt.encode("utf-8")).hexdigest()[:8]
+        question = prompt.strip().splitlines()[-2] if prompt.count("\n") >= 1 else prompt
+        words = f"Câu trả lời mô phỏng [{digest}] cho: {question[:200]}".split()
+        return words[:max_output_tokens] if max_output_tokens else words
+
+    def _record_usage(self, prompt: str, words: List[str]):
+        # Ước lượng theo số từ vì provider local không có tokenizer
+        TOKENS.inc(len(prompt.split()), direction='input')
+        TOKENS.inc(len(words), direction='output')
+
+    def generate(self, model: str, prompt: str, system_instruction: Optional[str] = None,
+                 temperature: float = 0.3, max_output_tokens: Optional[int] = None) -> str:
+        if self.generation_latency_ms:
+            time.sleep(self.generation_latency_ms / 1000)
+        words = self._reply_words(prompt, max_output_tokens)
+        self._record_usage(prompt, words)
+        return " ".join(words)
+
+    def generate_stream(self, model: str, prompt: str, system_instruction: Optional[str] = None,
+                        temperature: float = 0.3, max_output_tokens: Optional[int] = None) -> Iterator[str]:
+        words = self._reply_words(prompt, max_output_tokens)
+        self._record_usage(prompt, words)
+        delay = self.generation_latency_ms / 1000 / max(1, len(words))
+        for i, word in enumerate(words):
+            if delay:
+                time.sleep(delay)
+            yield word if i == 0 else " " + word
+
+
+PROVIDERS = {
+    "gemini": GeminiProvider,
+    "local": LocalProvider,
+}
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_provider() -> AIProvider:
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            if AI_PROVIDER not in PROVIDERS:
+                raise ValueError(f"Unknown AI_PROVIDER: {AI_PROVIDER}")
+            _provider = PROVIDERS[AI_PROVIDER]()
+            logging.info(f"Using AI provider: {AI_PROVIDER}")
+        return _provider
+
+
+def set_provider(provider: AIProvider):
+    global _provider
+    with _provider_lock:
+        _provider = provider
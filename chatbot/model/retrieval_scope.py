@@ -0,0 +1,90 @@
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
+
+# Thuộc tính phân quyền của file, do backend gửi kèm khi upload và khi hỏi đáp
+SCOPE_FIELDS = ('program_id', 'organization_id', 'academic_year_id')
+MAX_SCOPE_FILE_IDS = int(os.getenv("MAX_SCOPE_FILE_IDS", "10000"))
+# Phạm vi gồm quá nhiều nội dung thì chỉ mục từ khóa tìm toàn bộ rồi lọc lại bằng Chroma
+MAX_SCOPE_PREFIXES = int(os.getenv("MAX_SCOPE_PREFIXES", "2000"))
+
+
+def scope_fields(source) -> Dict[str, str]:
+    return {name: str(source.get(name)) for name in SCOPE_FIELDS if source.get(name) not in (None, "")}
+
+
+@dataclass
+class ResolvedScope:
+    where: Dict[str, Any]
+    # Tiền tố id chunk trong phạm vi (None: không giới hạn được trước, chỉ lọc bằng where)
+    prefixes: Optional[List[str]]
+    allowed_file_ids: Set[str] = field(default_factory=set)
+    # content_hash -> owner đầu tiên trong phạm vi, dùng để hiển thị chunk dùng chung đúng file của người hỏi
+    owners: Dict[str, Dict[str, str]] = field(default_factory=dict)
+
+    def present(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        owner = self.owners.get(metadata.get('content_hash'))
+        if owner and metadata.get('file_id') not in self.allowed_file_ids:
+            return dict(metadata, file_id=owner['file_id'], filename=owner['filename'])
+        return metadata
+
+
+@dataclass
+class RetrievalScope:
+    file_ids: Optional[List[str]] = None
+    fields: Dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def from_request(cls, data: Dict[str, Any]) -> Optional['RetrievalScope']:
+        scope = data.get('scope')
+        if scope is None:
+            return None
+        if not isinstance(scope, dict):
+            raise ValueError("scope phải là object")
+
+        file_ids = scope.get('file_ids')
+        if file_ids is not None:
+            if not isinstance(file_ids, list):
+                raise ValueError("scope.file_ids phải là danh sách")
+            if len(file_ids) > MAX_SCOPE_FILE_IDS:
+                raise ValueError(f"scope.file_ids tối đa {MAX_SCOPE_FILE_IDS} phần tử")
+            file_ids = list(dict.fromkeys(str(file_id) for file_id in file_ids))
+
+        fields = scope_fields(scope)
+        if file_ids is None and not fields:
+            raise ValueError(f"scope cần file_ids hoặc một trong {', '.join(SCOPE_FIELDS)}")
+        return cls(file_ids=file_ids, fields=fields)
+
+    def resolve(self, content_index=None) -> ResolvedScope:
+        # Điều kiện trên metadata của chunk: đúng với chunk riêng của từng file và chunk dùng chung mà owner
+        # đầu tiên nằm trong phạm vi
+        conditions = [{name: value} for name, value in self.fields.items()]
+        if self.file_ids is not None:
+            conditions.append({"file_id": {"$in": self.file_ids or [""]}})
+        clauses = [conditions[0] if len(conditions) == 1 else {"$and": conditions}]
+
+        allowed = set(self.file_ids or [])
+        owners = {}
+        prefixes = None
+        if self.file_ids is not None:
+            prefixes = [f"file_{file_id}_" for file_id in self.file_ids]
+
+        if content_index:
+            # Chunk dùng chung mang metadata của owner đầu tiên, nên phạm vi được tra qua bảng owners
+            rows = content_index.find_owners(self.file_ids, self.fields)
+            for row in rows:
+                allowed.add(row['file_id'])
+                owners.setdefault(row['content_hash'], row)
+            if owners:
+                clauses.append({"content_hash": {"$in": list(owners)}})
+            prefixes = (prefixes or []) + [f"{row['chunk_prefix']}_" for row in owners.values()]
+
+        if prefixes is not None and len(prefixes) > MAX_SCOPE_PREFIXES:
+            prefixes = None
+
+        return ResolvedScope(
+            where=clauses[0] if len(clauses) == 1 else {"$or": clauses},
+            prefixes=prefixes,
+            allowed_file_ids=allowed,
+            owners=owners
+        )
@@ -0,0 +1,267 @@
+import os
+import json
+import time
+import atexit
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List
+
+from model.paths import data_path
+from model.sqlite_util import SqliteStore, immediate
+
+# sqlite: lưu bền vững, dùng chung giữa các worker; memory: chỉ trong một process
+SESSION_STORE = os.getenv("SESSION_STORE", "sqlite")
+SESSION_DB_PATH = data_path("SESSION_DB_PATH")
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(7 * 24 * 3600)))
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "50"))
+SESSION_MEMORY_MAX = int(os.getenv("SESSION_MEMORY_MAX", "1000"))
+SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "1.0"))
+SESSION_FLUSH_BATCH = int(os.getenv("SESSION_FLUSH_BATCH", "100"))
+
+
+class SessionStore(ABC):
+    @abstractmethod
+    def append(self, session_id: str, entry: Dict[str, Any]):
+        pass
+
+    @abstractmethod
+    def get(self, session_id: str) -> List[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def delete(self, session_id: str) -> bool:
+        pass
+
+    @abstractmethod
+    def count(self) -> int:
+        pass
+
+    def flush(self):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    def __init__(self, ttl: int = SESSION_TTL, max_messages: int = SESSION_MAX_MESSAGES,
+                 max_sessions: int = SESSION_MEMORY_MAX):
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _drop_expired(self):
+        cutoff = time.time() - self.ttl
+        # OrderedDict giữ thứ tự theo lần truy cập gần nhất nên chỉ cần quét từ đầu
+        while self._sessions:
+            session_id, (last_active, _) = next(iter(self._sessions.items()))
+            if last_active >= cutoff:
+                break
+            del self._sessions[session_id]
+
+    def append(self, session_id: str, entry: Dict[str, Any]):
+        with self._lock:
+            _, messages = self._sessions.pop(session_id, (0, []))
+            messages.append(entry)
+            if len(messages) > self.max_messages:
+                messages = messages[-self.max_messages:]
+            self._sessions[session_id] = (time.time(), messages)
+            self._drop_expired()
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def get(self, session_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._drop_expired()
+            item = self._sessions.get(session_id)
+            if not item:
+                return []
+            # Session vừa được đọc là session đang dùng: đưa về cuối để không bị loại trước
+            self._sessions[session_id] = (time.time(), item[1])
+            self._sessions.move_to_end(session_id)
+            return list(item[1])
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def count(self) -> int:
+        with self._lock:
+            self._drop_expired()
+            return len(self._sessions)
+
+
+class SqliteSessionStore(SqliteStore, SessionStore):
+    def __init__(self, db_path: str = SESSION_DB_PATH, ttl: int = SESSION_TTL,
+                 max_messages: int = SESSION_MAX_MESSAGES, memory_sessions: int = SESSION_MEMORY_MAX,
+                 flush_interval: float = SESSION_FLUSH_INTERVAL, flush_batch: int = SESSION_FLUSH_BATCH):
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self.memory_sessions = memory_sessions
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+
+        # Cache đọc: session_id -> (updated_at, messages); updated_at dùng để phát hiện worker khác đã ghi
+        self._cache = OrderedDict()
+        self._pending = []
+
+        super().__init__(db_path)
+        conn = self._conn
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, updated_at REAL, last_active REAL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, payload TEXT)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_session ON messages(session_id, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_last_active ON sessions(last_active)")
+        atexit.register(self.flush)
+
+    def _open(self):
+        super()._open()
+        # Mọi thao tác trên kết nối đi qua khóa này để giao dịch flush không trộn với lệnh khác
+        self._db_lock = threading.RLock()
+        self._wakeup = threading.Event()
+        # Luồng flush và kết nối sqlite không sống qua fork; các bản ghi chờ thuộc về process cha
+        self._pending = []
+        self._cache.clear()
+        threading.Thread(target=self._flush_loop, name="session-flush", daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Session store flush error: {e}")
+
+    def _cache_put(self, session_id: str, updated_at: float, messages: List[Dict[str, Any]]):
+        self._cache[session_id] = (updated_at, messages)
+        self._cache.move_to_end(session_id)
+        while len(self._cache) > self.memory_sessions:
+            self._cache.popitem(last=False)
+
+    def append(self, session_id: str, entry: Dict[str, Any]):
+        with self._lock:
+            self._pending.append((session_id, json.dumps(entry, ensure_ascii=False), time.time()))
+            full = len(self._pending) >= self.flush_batch
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        with self._db_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+
+            conn = self._conn
+            touched = {}
+            for session_id, _, created in pending:
+                touched[session_id] = max(created, touched.get(session_id, 0))
+
+            try:
+                with immediate(conn):
+                    # Dọn session hết hạn trước khi ghi, để tin nhắn cũ không sống lại theo tin nhắn mới
+                    self._purge_expired(conn)
+                    conn.executemany(
+                        "INSERT INTO messages (session_id, payload) VALUES (?, ?)",
+                        [(session_id, payload) for session_id, payload, _ in pending]
+                    )
+                    conn.executemany(
+                        "INSERT INTO sessions (session_id, updated_at, last_active) VALUES (?, ?, ?) "
+                        "ON CONFLICT(session_id) DO UPDATE SET updated_at = excluded.updated_at, "
+                        "last_active = excluded.last_active",
+                        [(session_id, time.time(), created) for session_id, created in touched.items()]
+                    )
+                    conn.executemany(
+                        "DELETE FROM messages WHERE session_id = ? AND id NOT IN ("
+                        "SELECT id FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?)",
+                        [(session_id, session_id, self.max_messages) for session_id in touched]
+                    )
+            except Exception:
+                with self._lock:
+                    self._pending = pending + self._pending
+                raise
+
+    def _purge_expired(self, conn: sqlite3.Connection):
+        cutoff = time.time() - self.ttl
+        conn.execute(
+            "DELETE FROM messages WHERE session_id IN (SELECT session_id FROM sessions WHERE last_active < ?)",
+            (cutoff,)
+        )
+        conn.execute("DELETE FROM sessions WHERE last_active < ?", (cutoff,))
+
+    def _pending_messages(self, session_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [json.loads(payload) for pending_id, payload, _ in self._pending if pending_id == session_id]
+
+    def get(self, session_id: str) -> List[Dict[str, Any]]:
+        # Không flush khi đọc: ghép phần đã lưu với các tin nhắn còn chờ ghi của process này. _db_lock chờ lượt
+        # flush đang chạy (nếu có) để không bỏ sót tin nhắn đã rời bộ đệm nhưng chưa commit.
+        with self._db_lock:
+            pending = self._pending_messages(session_id)
+            conn = self._conn
+            row = conn.execute(
+                "SELECT updated_at, last_active FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if not row or row[1] < time.time() - self.ttl:
+                with self._lock:
+                    self._cache.pop(session_id, None)
+                return pending[-self.max_messages:]
+
+            with self._lock:
+                cached = self._cache.get(session_id)
+                if cached and cached[0] == row[0]:
+                    self._cache.move_to_end(session_id)
+                    return (cached[1] + pending)[-self.max_messages:]
+
+            messages = [
+                json.loads(payload) for (payload,) in conn.execute(
+                    "SELECT payload FROM messages WHERE session_id = ? ORDER BY id", (session_id,)
+                )
+            ]
+            with self._lock:
+                self._cache_put(session_id, row[0], messages)
+            return (messages + pending)[-self.max_messages:]
+
+    def delete(self, session_id: str) -> bool:
+        with self._db_lock:
+            with self._lock:
+                kept = [item for item in self._pending if item[0] != session_id]
+                dropped = len(kept) != len(self._pending)
+                self._pending = kept
+                self._cache.pop(session_id, None)
+            conn = self._conn
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            return conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,)).rowcount > 0 or dropped
+
+    def count(self) -> int:
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM sessions WHERE last_active >= ?", (time.time() - self.ttl,)
+            ).fetchone()
+        return row[0]
+
+
+SESSION_STORES = {
+    "sqlite": SqliteSessionStore,
+    "memory": MemorySessionStore,
+}
+
+
+def create_session_store() -> SessionStore:
+    if SESSION_STORE not in SESSION_STORES:
+        raise ValueError(f"Unknown SESSION_STORE: {SESSION_STORE}")
+    try:
+        store = SESSION_STORES[SESSION_STORE]()
+    except Exception as e:
+        logging.error(f"Failed to open {SESSION_STORE} session store, falling back to memory: {e}")
+        return MemorySessionStore()
+    logging.info(f"Using session store: {SESSION_STORE}")
+    return store
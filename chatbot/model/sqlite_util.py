@@ -0,0 +1,78 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import ContextManager, Dict, Iterator, Tuple
+
+
+def connect(db_path: str, timeout: float = 30) -> sqlite3.Connection:
+    # autocommit (isolation_level=None): giao dịch nhiều lệnh được mở tường minh bằng BEGIN IMMEDIATE
+    conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=timeout)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+@contextmanager
+def immediate(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    # Giữ khóa ghi từ đầu giao dịch để hai worker không cùng đọc rồi ghi đè lẫn nhau
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+_connections: Dict[str, Tuple[sqlite3.Connection, threading.RLock]] = {}
+_connections_lock = threading.Lock()
+
+
+def _reset_connections():
+    # Đăng ký khi import module, nên chạy trước hook mở lại của từng kho trong process con
+    global _connections_lock
+    _connections_lock = threading.Lock()
+    _connections.clear()
+
+
+os.register_at_fork(after_in_child=_reset_connections)
+
+
+def shared_connection(db_path: str) -> Tuple[sqlite3.Connection, threading.RLock]:
+    # Các kho cùng một file trong một process dùng chung kết nối và khóa, để ghi của nhiều kho nằm trong một giao dịch
+    key = os.path.abspath(db_path)
+    with _connections_lock:
+        if key not in _connections:
+            os.makedirs(os.path.dirname(key), exist_ok=True)
+            _connections[key] = (connect(key), threading.RLock())
+        return _connections[key]
+
+
+class SqliteStore:
+    # Kho sqlite dùng chung giữa các worker gunicorn: mỗi process một kết nối và một khóa cho mỗi file, mở lại sau
+    # fork vì kết nối sqlite không được dùng chung giữa process cha và con
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._open()
+        os.register_at_fork(after_in_child=self._open)
+
+    def _open(self):
+        self._conn, self._lock = shared_connection(self.db_path)
+
+    def shares_file(self, other: "SqliteStore") -> bool:
+        return os.path.abspath(self.db_path) == os.path.abspath(other.db_path)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            if self._conn.in_transaction:
+                # Đang trong giao dịch do kho khác cùng file mở (cùng thread vì khóa là RLock): ghi chung vào đó
+                yield self._conn
+            else:
+                with immediate(self._conn) as conn:
+                    yield conn
+
+    def transaction(self) -> ContextManager[sqlite3.Connection]:
+        # Gộp thao tác của các kho cùng file vào một giao dịch
+        return self._transaction()
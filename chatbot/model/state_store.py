@@ -0,0 +1,73 @@
+import json
+import time
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from model.paths import data_path
+from model.sqlite_util import SqliteStore
+
+STATE_DB_PATH = data_path("STATE_DB_PATH")
+
+
+class StateStore(SqliteStore):
+    # Trạng thái ngắn hạn (job vector hóa, gợi ý câu hỏi, tóm tắt file) dùng chung giữa các worker gunicorn:
+    # request thăm dò có thể rơi vào worker khác với worker đang xử lý
+    def __init__(self, db_path: str = STATE_DB_PATH):
+        super().__init__(db_path)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS states ("
+                "kind TEXT, key TEXT, value TEXT, updated_at REAL, expires_at REAL, PRIMARY KEY (kind, key))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_states_expires ON states(expires_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_states_updated ON states(kind, updated_at)")
+
+    def put(self, kind: str, key: str, value: Dict[str, Any], ttl: float):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO states (kind, key, value, updated_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (kind, key, json.dumps(value, ensure_ascii=False, default=str), now, now + ttl)
+            )
+
+    def get(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM states WHERE kind = ? AND key = ? AND expires_at > ?", (kind, key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def purge(self, kind: str, max_entries: Optional[int] = None):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM states WHERE kind = ? AND expires_at <= ?", (kind, time.time()))
+            if max_entries is not None:
+                conn.execute(
+                    "DELETE FROM states WHERE kind = ? AND key NOT IN ("
+                    "SELECT key FROM states WHERE kind = ? ORDER BY updated_at DESC LIMIT ?)",
+                    (kind, kind, max_entries)
+                )
+
+    def counts(self, kind: str, field: str) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT json_extract(value, ?), COUNT(*) FROM states WHERE kind = ? AND expires_at > ? GROUP BY 1",
+                (f"$.{field}", kind, time.time())
+            ).fetchall()
+        return {str(value): count for value, count in rows}
+
+
+_state_store = None
+_state_store_lock = threading.Lock()
+
+
+def get_state_store() -> Optional[StateStore]:
+    global _state_store
+    with _state_store_lock:
+        if _state_store is None:
+            try:
+                _state_store = StateStore()
+            except Exception as e:
+                logging.error(f"Failed to open state store at {STATE_DB_PATH}: {e}")
+                return None
+        return _state_store
@@ -0,0 +1,124 @@
+import os
+import time
+import uuid
+import sqlite3
+import tempfile
+from typing import BinaryIO, Optional
+
+from model.paths import data_path
+from model.sqlite_util import SqliteStore
+
+MB = 1024 * 1024
+
+UPLOAD_MAX_BYTES = int(float(os.getenv("UPLOAD_MAX_MB", "50")) * MB)
+# Phần body multipart ngoài nội dung file (boundary, header, file_id, scope...)
+UPLOAD_FORM_OVERHEAD_BYTES = 1 * MB
+# Tổng dung lượng upload đang xử lý cùng lúc trên toàn bộ các worker; vượt ngưỡng thì trả 429
+UPLOAD_MAX_INFLIGHT_BYTES = int(float(os.getenv("UPLOAD_MAX_INFLIGHT_MB", "200")) * MB)
+UPLOAD_LIMITER_DB_PATH = data_path("STATE_DB_PATH")
+# Chỗ giữ quá thời gian này coi như bị bỏ quên (job treo, worker chết không dọn được)
+UPLOAD_RESERVATION_TTL = float(os.getenv("UPLOAD_RESERVATION_TTL", "3600"))
+# File nhỏ hơn ngưỡng này giữ trong RAM, lớn hơn thì ghi ra file tạm
+UPLOAD_SPOOL_BYTES = int(float(os.getenv("UPLOAD_SPOOL_MB", "1")) * MB)
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or None
+COPY_BUFFER_BYTES = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class InFlightLimiter(SqliteStore):
+    # Mỗi upload đang xử lý là một dòng trong sqlite dùng chung nên giới hạn áp dụng cho tổng mọi worker gunicorn,
+    # không nhân lên theo số worker
+    def __init__(self, max_bytes: int = UPLOAD_MAX_INFLIGHT_BYTES, db_path: str = UPLOAD_LIMITER_DB_PATH):
+        self.max_bytes = max_bytes
+        super().__init__(db_path)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS upload_reservations ("
+                "id TEXT PRIMARY KEY, pid INTEGER, size INTEGER, created_at REAL)"
+            )
+
+    def _purge_stale(self, conn: sqlite3.Connection):
+        # Worker bị kill giữa chừng không kịp trả chỗ: bỏ dòng của process đã chết hoặc giữ quá lâu
+        conn.execute("DELETE FROM upload_reservations WHERE created_at < ?", (time.time() - UPLOAD_RESERVATION_TTL,))
+        pids = [row[0] for row in conn.execute("SELECT DISTINCT pid FROM upload_reservations")]
+        dead = [pid for pid in pids if not pid_alive(pid)]
+        if dead:
+            conn.execute(
+                f"DELETE FROM upload_reservations WHERE pid IN ({','.join('?' * len(dead))})", dead
+            )
+
+    def try_acquire(self, size: int) -> Optional[str]:
+        reservation = uuid.uuid4().hex
+        with self._transaction() as conn:
+            self._purge_stale(conn)
+            in_flight = conn.execute("SELECT COALESCE(SUM(size), 0) FROM upload_reservations").fetchone()[0]
+            # Luôn cho qua khi đang rảnh để một file lớn hợp lệ không bị từ chối mãi
+            if in_flight and in_flight + size > self.max_bytes:
+                return None
+            conn.execute(
+                "INSERT INTO upload_reservations (id, pid, size, created_at) VALUES (?, ?, ?, ?)",
+                (reservation, os.getpid(), size, time.time())
+            )
+        return reservation
+
+    def release(self, reservation: Optional[str]):
+        if not reservation:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM upload_reservations WHERE id = ?", (reservation,))
+
+    @property
+    def in_flight(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM upload_reservations").fetchone()[0]
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def stream_size(stream: BinaryIO) -> int:
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+
+def spool_upload(stream: BinaryIO, max_bytes: int = UPLOAD_MAX_BYTES,
+                 spool_bytes: int = UPLOAD_SPOOL_BYTES, tmp_dir: Optional[str] = UPLOAD_TMP_DIR) -> BinaryIO:
+    # Sao chép từng khối vào SpooledTemporaryFile để không bao giờ giữ nguyên file lớn trong RAM
+    spooled = tempfile.SpooledTemporaryFile(max_size=spool_bytes, dir=tmp_dir, prefix="chatbot-upload-")
+    copied = 0
+    try:
+        while True:
+            block = stream.read(COPY_BUFFER_BYTES)
+            if not block:
+                break
+            copied += len(block)
+            if copied > max_bytes:
+                raise UploadTooLarge(f"File vượt quá giới hạn {max_bytes // MB}MB")
+            spooled.write(block)
+    except Exception:
+        spooled.close()
+        raise
+    spooled.seek(0)
+    return spooled
+
+
+def close_quietly(stream: Optional[BinaryIO]):
+    if stream is None:
+        return
+    try:
+        stream.close()
+    except Exception:
+        pass
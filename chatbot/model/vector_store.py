@@ -0,0 +1,195 @@
+import os
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import chromadb
+
+from model.chroma_server import LOCAL_HOST, local_server_port
+from model.metrics import STAGE_SECONDS, ERRORS
+from model.lexical_index import get_lexical_index, where_condition
+from model.paths import data_path
+
+KNOWLEDGE_CHROMA_PATH = data_path("KNOWLEDGE_CHROMA_PATH")
+FILES_CHROMA_PATH = data_path("FILES_CHROMA_PATH")
+# Khi chạy nhiều worker, mọi worker phải dùng Chroma server (chroma run --path ...) để thấy cùng một index;
+# không đặt CHROMA_HOST thì gunicorn.conf.py tự chạy server cục bộ (model/chroma_server.py)
+CHROMA_HOST = os.getenv("CHROMA_HOST", "")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8001"))
+
+# Đặt bởi gunicorn.conf.py: việc mở collection để dành cho từng worker (warm_up ở post_fork)
+CHATBOT_PREFORK = os.getenv("CHATBOT_PREFORK", "0") == "1"
+
+KNOWLEDGE_COLLECTION = "chatbot_knowledge"
+FILES_COLLECTION = "uploaded_files"
+
+
+@dataclass
+class SearchHit:
+    id: str
+    document: str
+    distance: float
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def similarity(self) -> float:
+        return 1 - self.distance
+
+
+class VectorStore:
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self.lexical = get_lexical_index()
+        self._open()
+
+    def _open(self):
+        # Client chỉ được tạo ở lần dùng đầu tiên, nên process cha ở chế độ prefork không giữ client Chroma
+        # nào qua fork
+        self._client = None
+        self._collections = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def reopen(self):
+        self._open()
+
+    def _connect(self):
+        if CHROMA_HOST:
+            # Hai kho dùng tên collection khác nhau nên có thể chung một Chroma server
+            return chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
+        port = local_server_port(self.path)
+        if port:
+            return chromadb.HttpClient(host=LOCAL_HOST, port=port)
+        return chromadb.PersistentClient(path=self.path)
+
+    def collection(self, name: str, create: bool = True):
+        with self._lock:
+            handle = self._collections.get(name)
+            if handle is None:
+                if self._client is None:
+                    self._client = self._connect()
+                if create:
+                    handle = self._client.get_or_create_collection(
+                        name=name,
+                        metadata={"hnsw:space": "cosine"}
+                    )
+                else:
+                    handle = self._client.get_collection(name=name)
+                self._collections[name] = handle
+            return handle
+
+    def has_collection(self, name: str) -> bool:
+        try:
+            self.collection(name, create=False)
+            return True
+        except Exception:
+            return False
+
+    def count(self, name: str) -> int:
+        if not self.has_collection(name):
+            return 0
+        return self.collection(name).count()
+
+    def query(self, name: str, query_embeddings: List[List[float]], n_results: int,
+              where: Optional[Dict[str, Any]] = None) -> List[List[SearchHit]]:
+        with STAGE_SECONDS.time(stage='chroma_query'):
+            results = self._query(name, query_embeddings, n_results, where)
+
+        hits = []
+        for ids, documents, distances, metadatas in zip(
+                results['ids'], results['documents'], results['distances'], results['metadatas']
+        ):
+            hits.append([
+                SearchHit(id=hit_id, document=document, distance=distance, metadata=metadata or {})
+                for hit_id, document, distance, metadata in zip(ids, documents, distances, metadatas)
+            ])
+        return hits
+
+    def _query(self, name: str, query_embeddings: List[List[float]], n_results: int,
+               where: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        return self.collection(name, create=False).query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where,
+            include=['documents', 'distances', 'metadatas']
+        )
+
+    def get(self, name: str, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            include: Optional[List[str]] = None, limit: Optional[int] = None,
+            offset: Optional[int] = None) -> Dict[str, Any]:
+        return self.collection(name).get(
+            ids=ids,
+            where=where,
+            include=include or ['metadatas'],
+            limit=limit,
+            offset=offset
+        )
+
+    def upsert(self, name: str, ids: List[str], embeddings: List[List[float]], documents: List[str],
+               metadatas: List[Dict[str, Any]]):
+        with self._write_lock:
+            self.collection(name).upsert(
+                ids=ids,
+                embeddings=embeddings,
+                documents=documents,
+                metadatas=metadatas
+            )
+            self._mirror(self.lexical.upsert if self.lexical else None, name, ids, documents, metadatas)
+
+    def update(self, name: str, ids: List[str], metadatas: List[Dict[str, Any]]):
+        with self._write_lock:
+            self.collection(name).update(ids=ids, metadatas=metadatas)
+            self._mirror(self.lexical.update if self.lexical else None, name, ids, metadatas)
+
+    def delete(self, name: str, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None):
+        with self._write_lock:
+            if self.lexical and ids is None and where_condition(where) is None:
+                # Điều kiện chỉ mục từ khóa không dịch được: lấy id các chunk khớp rồi xóa theo id
+                ids = self.collection(name).get(where=where, include=[])['ids']
+                where = None
+                if not ids:
+                    return
+            self.collection(name).delete(ids=ids, where=where)
+            if ids is None:
+                self._mirror(self.lexical.delete_where if self.lexical else None, name, where)
+            else:
+                self._mirror(self.lexical.delete if self.lexical else None, name, ids)
+
+    def _mirror(self, write, *args):
+        if write is None:
+            return
+        try:
+            write(*args)
+        except Exception as e:
+            # Chroma vẫn là nguồn chính; chỉ mục lệch số lượng sẽ được dựng lại ở lần warm_up sau
+            ERRORS.inc(component='lexical_index')
+            logging.error(f"Failed to update lexical index for {self.path}: {e}")
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def _reopen_stores_after_fork():
+    # Client Chroma (bindings Rust và sqlite) không an toàn qua fork: worker bỏ client kế thừa và tự kết nối lại
+    # ở lần dùng đầu tiên. PersistentClient dùng chung hệ thống theo đường dẫn trong một process, nên process
+    # cha không được mở kho trước khi fork (chế độ prefork chỉ warm_up trong worker).
+    global _stores_lock
+    _stores_lock = threading.Lock()
+    for store in _stores.values():
+        store.reopen()
+
+
+os.register_at_fork(after_in_child=_reopen_stores_after_fork)
+
+
+def get_vector_store(path: str) -> VectorStore:
+    path = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = VectorStore(path)
+            _stores[path] = store
+            logging.info(f"Opened vector store at {path}")
+        return store
@@ -0,0 +1,200 @@
+import os
+import sys
+import time
+import atexit
+import logging
+import importlib
+import threading
+import subprocess
+from types import GeneratorType
+from multiprocessing.connection import Connection
+from typing import Any, Iterator, List
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class WorkerPoolError(Exception):
+    pass
+
+
+class WorkerPoolTimeout(WorkerPoolError):
+    pass
+
+
+class _Worker:
+    # Mỗi worker là một process Python riêng chạy `python -m model.worker_pool <module>`, không fork từ
+    # process web nên không mang theo kết nối Chroma/sqlite hay thread của Flask
+    def __init__(self, module: str):
+        task_read, task_write = os.pipe()
+        result_read, result_write = os.pipe()
+        try:
+            self.process = subprocess.Popen(
+                [sys.executable, '-m', 'model.worker_pool', module, str(task_read), str(result_write)],
+                pass_fds=(task_read, result_write),
+                cwd=BASE_DIR
+            )
+        except Exception:
+            for fd in (task_read, task_write, result_read, result_write):
+                os.close(fd)
+            raise
+        os.close(task_read)
+        os.close(result_write)
+        self.tasks = Connection(task_write, readable=False)
+        self.results = Connection(result_read, writable=False)
+        self.tasks_done = 0
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def _close(self):
+        for conn in (self.tasks, self.results):
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def stop(self):
+        # Đóng pipe nhận việc, process con đọc được EOF và tự thoát
+        self._close()
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.kill()
+
+    def kill(self):
+        self._close()
+        self.process.kill()
+        self.process.wait()
+
+
+class WorkerPool:
+    def __init__(self, module: str, workers: int, max_tasks: int, timeout: float):
+        self.module = module
+        self.workers = max(1, workers)
+        self.max_tasks = max_tasks
+        self.timeout = timeout
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+        atexit.register(self.shutdown)
+
+    def _reset(self):
+        # Các process con thuộc về process đã tạo ra chúng; sau fork chỉ bỏ tham chiếu và tự tạo lại khi cần
+        self._idle: List[_Worker] = []
+        self._slots = threading.Semaphore(self.workers)
+        self._lock = threading.Lock()
+        self.started = 0
+        self.recycled = 0
+        self.killed = 0
+
+    def _acquire(self) -> _Worker:
+        if not self._slots.acquire(timeout=self.timeout):
+            raise WorkerPoolTimeout(f"No {self.module} worker available after {self.timeout}s")
+        try:
+            with self._lock:
+                while self._idle:
+                    worker = self._idle.pop()
+                    if worker.alive():
+                        return worker
+                self.started += 1
+            return _Worker(self.module)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, worker: _Worker, healthy: bool):
+        try:
+            if not healthy:
+                worker.kill()
+                with self._lock:
+                    self.killed += 1
+            elif self.max_tasks and worker.tasks_done >= self.max_tasks:
+                # Thay worker định kỳ để rò rỉ bộ nhớ của thư viện đọc file không tích lũy mãi
+                worker.stop()
+                with self._lock:
+                    self.recycled += 1
+            else:
+                with self._lock:
+                    self._idle.append(worker)
+        finally:
+            self._slots.release()
+
+    def stream(self, task: str, *args) -> Iterator[Any]:
+        worker = self._acquire()
+        healthy = False
+        try:
+            worker.tasks.send((task, args))
+            worker.tasks_done += 1
+            # Chỉ tính thời gian chờ process con, không tính thời gian bên gọi xử lý từng phần kết quả
+            waited = 0.0
+            while True:
+                started = time.monotonic()
+                ready = worker.results.poll(max(0.0, self.timeout - waited))
+                waited += time.monotonic() - started
+                if not ready:
+                    raise WorkerPoolTimeout(f"Task {task} exceeded {self.timeout}s")
+                try:
+                    kind, value = worker.results.recv()
+                except EOFError:
+                    raise WorkerPoolError(f"Worker for {task} exited with code {worker.process.poll()}")
+
+                if kind == 'item':
+                    yield value
+                elif kind == 'done':
+                    healthy = True
+                    return
+                else:
+                    healthy = True
+                    raise WorkerPoolError(value)
+        finally:
+            # Bên gọi dừng giữa chừng hoặc task quá hạn: process con vẫn đang chạy nên phải hủy
+            self._release(worker, healthy)
+
+    def run(self, task: str, *args) -> Any:
+        result = None
+        for result in self.stream(task, *args):
+            pass
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'idle': len(self._idle),
+                'started': self.started,
+                'recycled': self.recycled,
+                'killed': self.killed
+            }
+
+    def shutdown(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
+
+
+def serve(module: str, task_fd: int, result_fd: int):
+    tasks = Connection(task_fd, writable=False)
+    results = Connection(result_fd, readable=False)
+    handlers = importlib.import_module(module).TASKS
+
+    while True:
+        try:
+            task, args = tasks.recv()
+        except EOFError:
+            break
+
+        try:
+            result = handlers[task](*args)
+            if isinstance(result, GeneratorType):
+                for item in result:
+                    results.send(('item', item))
+            else:
+                results.send(('item', result))
+            results.send(('done', None))
+        except Exception as e:
+            logging.error(f"Worker task {task} failed: {e}")
+            results.send(('error', f"{type(e).__name__}: {e}"))
+
+
+if __name__ == "__main__":
+    serve(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]))
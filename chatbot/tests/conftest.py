@@ -0,0 +1,35 @@
+import os
+import sys
+import tempfile
+import importlib
+
+import pytest
+
+# Cấu hình đọc biến môi trường lúc import module, nên phải đặt trước khi test import model.*
+os.environ.setdefault("AI_PROVIDER", "local")
+os.environ.setdefault("EXTRACT_WORKERS", "0")
+os.environ["CHATBOT_DATA_DIR"] = tempfile.mkdtemp(prefix="chatbot-tests-")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    # main.py ghi chatbot.log vào thư mục hiện tại lúc import
+    cwd = os.getcwd()
+    os.chdir(os.environ["CHATBOT_DATA_DIR"])
+    try:
+        return importlib.import_module("main")
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture(scope="session")
+def processor():
+    from model.file_processor import FileProcessor
+    return FileProcessor()
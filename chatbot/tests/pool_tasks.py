@@ -0,0 +1,30 @@
+import os
+import time
+
+# Task cho process con của WorkerPool trong test_worker_pool.py
+
+
+def pid():
+    return os.getpid()
+
+
+def pages(count):
+    for i in range(count):
+        yield i
+
+
+def sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def fail():
+    raise ValueError("bad file")
+
+
+TASKS = {
+    'pid': pid,
+    'pages': pages,
+    'sleep': sleep,
+    'fail': fail,
+}
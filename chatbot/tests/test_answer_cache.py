@@ -0,0 +1,74 @@
+import pytest
+
+from model.answer_cache import SemanticAnswerCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("model.answer_cache.time.time", clock)
+    return clock
+
+
+def test_lookup_returns_similar_question(clock):
+    cache = SemanticAnswerCache(threshold=0.9, ttl=60, version="v1")
+    cache.store([1.0, 0.0], "Tạo minh chứng thế nào?", "Vào menu Quản lý minh chứng.", ["kb"])
+
+    found = cache.lookup([0.99, 0.05])
+    assert found["reply"] == "Vào menu Quản lý minh chứng."
+    assert found["sources"] == ["kb"]
+    assert cache.lookup([0.0, 1.0]) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = SemanticAnswerCache(threshold=0.9, ttl=60, version="v1")
+    cache.store([1.0, 0.0], "q", "a")
+
+    clock.now += 59
+    assert cache.lookup([1.0, 0.0]) is not None
+    clock.now += 2
+    assert cache.lookup([1.0, 0.0]) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_version_change_invalidates_entries(clock):
+    cache = SemanticAnswerCache(threshold=0.9, ttl=60, version="v1")
+    cache.store([1.0, 0.0], "q", "a")
+
+    cache.set_version("v1")
+    assert cache.lookup([1.0, 0.0]) is not None
+
+    cache.set_version("v2")
+    assert cache.stats()["entries"] == 0
+    assert cache.lookup([1.0, 0.0]) is None
+
+    cache.store([1.0, 0.0], "q", "b")
+    assert cache.lookup([1.0, 0.0])["reply"] == "b"
+
+
+def test_entries_from_old_version_are_dropped_on_lookup(clock):
+    cache = SemanticAnswerCache(threshold=0.9, ttl=60, version="v1")
+    cache.store([1.0, 0.0], "q", "a")
+    # Đổi version trực tiếp (không qua set_version) thì lookup vẫn phải bỏ entry cũ
+    cache.version = "v2"
+
+    assert cache.lookup([1.0, 0.0]) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_max_entries_evicts_oldest(clock):
+    cache = SemanticAnswerCache(threshold=0.99, ttl=60, max_entries=2)
+    for i, vector in enumerate(([1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0])):
+        cache.store(vector, f"q{i}", f"a{i}")
+
+    assert cache.lookup([1.0, 0.0, 0.0]) is None
+    assert cache.lookup([0.0, 0.0, 1.0])["reply"] == "a2"
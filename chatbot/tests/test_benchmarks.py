@@ -0,0 +1,41 @@
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks.corpus import build_corpus
+from benchmarks.run_benchmarks import summarize
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_summarize_percentiles():
+    result = summarize([float(i) for i in range(1, 101)], wall_seconds=2.0)
+
+    assert (result['count'], result['min_ms'], result['max_ms']) == (100, 1.0, 100.0)
+    assert (result['p50_ms'], result['p95_ms'], result['p99_ms']) == (50.0, 95.0, 99.0)
+    assert result['throughput_rps'] == 50.0
+    assert summarize([], 0)['p95_ms'] == 0.0
+
+
+def test_corpus_is_reproducible():
+    first = build_corpus(["small"])
+    second = build_corpus(["small"])
+
+    assert [doc['name'] for doc in first] == ["small.pdf", "small.docx", "small.xlsx", "small.pptx"]
+    assert [doc['paragraphs'] for doc in first] == [doc['paragraphs'] for doc in second]
+
+
+def test_benchmark_run_writes_results(tmp_path):
+    output = tmp_path / "bench.json"
+    subprocess.run(
+        [sys.executable, "-m", "benchmarks.run_benchmarks", "--iterations", "1", "--warmup", "0",
+         "--concurrency", "1", "--sizes", "small", "--only", "chunking,extraction", "--output", str(output)],
+        cwd=BASE_DIR, check=True, capture_output=True, timeout=300
+    )
+
+    report = json.loads(output.read_text(encoding="utf-8"))
+
+    assert report['meta']['provider'] == "local"
+    assert set(report['results']) == {"chunking", "extraction"}
+    assert all('p95_ms' in result for result in report['results']['extraction'].values())
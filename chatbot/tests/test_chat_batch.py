@@ -0,0 +1,67 @@
+import io
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def uploaded(app_module):
+    result = app_module.file_processor.process_file(
+        io.BytesIO("Lịch thi học kỳ hai bắt đầu từ ngày 10 tháng 6. ".encode() * 20), "lichthi.txt",
+        "text/plain", "batch1", summary_mode='none'
+    )
+    assert result['success'], result
+    return "batch1"
+
+
+def _batch(client, uploaded, questions):
+    return client.post("/api/ai-chat/batch", json={
+        "questions": questions,
+        "search_type": "files",
+        "scope": {"file_ids": [uploaded]},
+    })
+
+
+def test_batch_embeds_once_and_keeps_order(client, app_module, uploaded, monkeypatch):
+    provider = app_module.bot.provider
+    calls = []
+    embed = provider.embed
+
+    def spy(model, texts):
+        calls.append(list(texts))
+        return embed(model, texts)
+
+    monkeypatch.setattr(provider, "embed", spy)
+    questions = ["Lịch thi bắt đầu ngày nào?", "  ", "Thi học kỳ hai vào tháng mấy?"]
+
+    body = _batch(client, uploaded, questions).get_json()
+
+    assert calls == [[questions[0], questions[2]]]
+    assert body["count"] == 3 and body["failed"] == 1
+    assert [result["index"] for result in body["results"]] == [0, 1, 2]
+    assert body["results"][1] == {"index": 1, "error": "Message is required"}
+    for i in (0, 2):
+        assert body["results"][i]["question"] == questions[i]
+        assert body["results"][i]["reply"] and body["results"][i]["sources"]
+
+
+def test_generation_error_is_reported_per_question(client, app_module, uploaded, monkeypatch):
+    provider = app_module.bot.provider
+    generate = provider.generate
+
+    def flaky(model, prompt, **kwargs):
+        if "lỗi" in prompt:
+            raise ConnectionError("quota")
+        return generate(model, prompt, **kwargs)
+
+    monkeypatch.setattr(provider, "generate", flaky)
+
+    results = _batch(client, uploaded, ["Lịch thi khi nào?", "Câu hỏi gây lỗi lịch thi?"]).get_json()["results"]
+
+    assert "reply" in results[0]
+    assert results[1]["error"].startswith("Xin lỗi")
+
+
+def test_batch_validation(client, app_module):
+    assert client.post("/api/ai-chat/batch", json={"questions": "Lịch thi?"}).status_code == 400
+    too_many = ["Lịch thi?"] * (app_module.BATCH_CHAT_MAX_QUESTIONS + 1)
+    assert client.post("/api/ai-chat/batch", json={"questions": too_many}).status_code == 400
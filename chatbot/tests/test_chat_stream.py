@@ -0,0 +1,68 @@
+import io
+import json
+
+import pytest
+
+
+def _events(response):
+    events = []
+    for block in response.get_data(as_text=True).strip().split("\n\n"):
+        name, data = block.split("\n", 1)
+        assert name == f"event: {json.loads(data[len('data: '):])['type']}"
+        events.append(json.loads(data[len("data: "):]))
+    return events
+
+
+@pytest.fixture(scope="module")
+def uploaded(app_module):
+    result = app_module.file_processor.process_file(
+        io.BytesIO("Học phí năm học 2025 là 12 triệu đồng mỗi học kỳ. ".encode() * 20), "hocphi.txt",
+        "text/plain", "stream1", summary_mode='none'
+    )
+    assert result['success'], result
+    return "stream1"
+
+
+def _ask(client, uploaded, path="/api/ai-chat/stream", **extra):
+    return client.post(path, json={
+        "message": "Học phí mỗi học kỳ là bao nhiêu?",
+        "search_type": "files",
+        "session_id": "sse",
+        "scope": {"file_ids": [uploaded]},
+        **extra,
+    })
+
+
+def test_stream_sends_meta_tokens_done_then_followups(client, uploaded):
+    response = _ask(client, uploaded)
+
+    assert response.mimetype == "text/event-stream"
+    assert response.headers["Cache-Control"] == "no-cache"
+    events = _events(response)
+    types = [event["type"] for event in events]
+    assert types[0] == "meta" and types[-2:] == ["done", "followups"]
+    assert set(types[1:-2]) == {"token"}
+    assert events[0]["sources"]
+
+    done = events[-2]
+    assert done["reply"] and done["message_id"]
+    history = client.get("/api/ai-chat/history/sse").get_json()
+    assert done["message_id"] in [entry["message_id"] for entry in history["history"]]
+
+
+def test_chat_endpoint_streams_when_requested(client, uploaded):
+    events = _events(_ask(client, uploaded, path="/api/ai-chat", stream=True, followups="none"))
+
+    assert [event["type"] for event in events][-1] == "done"
+
+
+def test_generation_failure_ends_stream_with_error(client, uploaded, app_module, monkeypatch):
+    def broken(*args, **kwargs):
+        yield "Học"
+        raise ConnectionError("stream reset")
+
+    monkeypatch.setattr(app_module.bot.provider, "generate_stream", broken)
+
+    types = [event["type"] for event in _events(_ask(client, uploaded))]
+
+    assert types == ["meta", "token", "error"]
@@ -0,0 +1,59 @@
+from model.chunking import TokenChunker, estimate_tokens
+
+
+def chunk_texts(chunker, segments):
+    chunks = []
+    for page, text in segments:
+        chunks.extend(chunker.feed(text, page))
+    chunks.extend(chunker.finish())
+    return chunks
+
+
+def test_chunks_stay_within_budget_and_end_on_sentences():
+    text = "".join(f"Câu số {i} mô tả minh chứng thứ {i} của chương trình đào tạo. " for i in range(60))
+    chunks = chunk_texts(TokenChunker(max_tokens=40, overlap_tokens=0), [(None, text)])
+
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 40 for chunk, _, _ in chunks)
+    assert all(chunk.endswith("chương trình đào tạo.") for chunk, _, _ in chunks)
+    assert " ".join(chunk for chunk, _, _ in chunks) == text.strip()
+
+
+def test_abbreviations_and_numbered_items_are_not_boundaries():
+    text = "".join(
+        f"Báo cáo số {i} của TS. Trần Văn B theo Điều {i}. Quy định chung được hội đồng thông qua. "
+        for i in range(20)
+    )
+    chunks = chunk_texts(TokenChunker(max_tokens=35, overlap_tokens=0), [(None, text)])
+
+    assert len(chunks) == 20
+    assert all(chunk.endswith("thông qua.") for chunk, _, _ in chunks)
+
+
+def test_overlap_repeats_last_sentence_of_previous_chunk():
+    sentences = [f"Câu số {i} mô tả minh chứng thứ {i} của chương trình. " for i in range(10)]
+    chunks = chunk_texts(TokenChunker(max_tokens=40, overlap_tokens=20), [(None, "".join(sentences))])
+
+    for previous, current in zip(chunks, chunks[1:]):
+        last_sentence = previous[0].rsplit("Câu số", 1)[1]
+        assert current[0].startswith("Câu số" + last_sentence)
+
+
+def test_long_sentence_without_punctuation_is_split_within_budget():
+    text = " ".join(f"từ{i}" for i in range(500))
+    chunks = chunk_texts(TokenChunker(max_tokens=50, overlap_tokens=0), [(None, text)])
+
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 50 for chunk, _, _ in chunks)
+    assert " ".join(chunk for chunk, _, _ in chunks).split() == text.split()
+
+
+def test_streaming_matches_single_feed_and_tracks_pages():
+    pages = [(page, f"Trang {page} nói về tiêu chí {page}. " * 15) for page in range(1, 6)]
+    streamed = chunk_texts(TokenChunker(max_tokens=60, overlap_tokens=10), pages)
+    whole = chunk_texts(TokenChunker(max_tokens=60, overlap_tokens=10), [(1, "\n".join(text for _, text in pages))])
+
+    assert [chunk for chunk, _, _ in streamed] == [chunk for chunk, _, _ in whole]
+    assert streamed[0][1] == 1
+    assert streamed[-1][2] == 5
+    assert all(start <= end for _, start, end in streamed)
@@ -0,0 +1,52 @@
+import pytest
+
+from model.content_index import ContentIndex
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = ContentIndex(str(tmp_path / "content_index.sqlite3"))
+    index.register("hash_a", "text_a", "content_hash_a", 3, None, "preview a")
+    index.register("hash_b", "text_b", "content_hash_b", 2, None, "preview b")
+    for file_id, content_hash in (("f1", "hash_a"), ("f2", "hash_a"), ("f3", "hash_a"), ("f4", "hash_b")):
+        index.attach(file_id, content_hash, f"{file_id}.pdf", f"file_{file_id}", {"program_id": "P1"})
+    return index
+
+
+def test_release_many_keeps_content_while_owners_remain(index):
+    released = index.release_many(["f1", "f2"])
+
+    assert released == {"hash_a": {"remaining": 1, "file_ids": ["f1", "f2"]}}
+    assert index.get("hash_a") is not None
+    assert [owner["file_id"] for owner in index.owners("hash_a")] == ["f3"]
+
+
+def test_release_many_deletes_content_with_last_owner(index):
+    released = index.release_many(["f3", "f4", "f2", "f1"])
+
+    assert released["hash_a"]["remaining"] == 0
+    assert sorted(released["hash_a"]["file_ids"]) == ["f1", "f2", "f3"]
+    assert released["hash_b"] == {"remaining": 0, "file_ids": ["f4"]}
+    assert index.get("hash_a") is None
+    assert index.get("hash_b") is None
+    assert index.stats() == {"contents": 0, "owners": 0}
+
+
+def test_release_many_ignores_unknown_file_ids(index):
+    assert index.release_many(["missing"]) == {}
+    assert index.release("missing") is None
+    assert index.stats() == {"contents": 2, "owners": 4}
+
+
+def test_release_many_batches_large_lists(index, monkeypatch):
+    monkeypatch.setattr("model.content_index.QUERY_BATCH", 2)
+    released = index.release_many(["f1", "x1", "f2", "x2", "f3"])
+
+    assert released["hash_a"]["remaining"] == 0
+    assert index.get("hash_a") is None
+    assert index.get("hash_b") is not None
+
+
+def test_reupload_with_other_content_reports_previous_hash(index):
+    assert index.attach("f4", "hash_a", "f4.pdf", "file_f4") == "hash_b"
+    assert index.release("f4") == {"content_hash": "hash_a", "remaining": 3}
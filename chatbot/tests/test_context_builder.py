@@ -0,0 +1,66 @@
+from model.context_builder import build_context, merge_adjacent, overlap_length
+from model.vector_store import SearchHit
+
+OVERLAP = "Sinh viên phải nộp minh chứng trước hạn chót. "
+
+
+def hit(chunk_id, document, similarity, chunk_index=None):
+    metadata = {"filename": "a.pdf"}
+    if chunk_index is not None:
+        metadata["chunk_index"] = chunk_index
+    return SearchHit(chunk_id, document, 1 - similarity, metadata)
+
+
+def test_overlap_length_finds_repeated_tail():
+    left = "Quy định về minh chứng. " + OVERLAP
+    assert overlap_length(left, OVERLAP + "Khoa tổng hợp báo cáo.") == len(OVERLAP)
+    assert overlap_length(left, "Khoa tổng hợp báo cáo cuối năm học.") == 0
+    assert overlap_length(left, "ngắn") == 0
+
+
+def test_merge_adjacent_removes_overlap_between_consecutive_chunks():
+    hits = [
+        hit("content_abc_1", OVERLAP + "Khoa tổng hợp báo cáo.", 0.9, 1),
+        hit("content_abc_0", "Quy định về minh chứng. " + OVERLAP, 0.7, 0),
+    ]
+    blocks = merge_adjacent(hits)
+
+    assert len(blocks) == 1
+    assert blocks[0].text == "Quy định về minh chứng. " + OVERLAP + "Khoa tổng hợp báo cáo."
+    assert blocks[0].score == 0.9
+    assert blocks[0].chunk_ids == ["content_abc_0", "content_abc_1"]
+
+
+def test_merge_adjacent_keeps_gaps_and_other_files_apart():
+    hits = [
+        hit("content_abc_0", "Đoạn đầu của file thứ nhất về minh chứng.", 0.8, 0),
+        hit("content_abc_2", "Đoạn thứ ba của file thứ nhất về minh chứng.", 0.6, 2),
+        hit("file_f2_1a2b3c4d_1", "Đoạn của file thứ hai về minh chứng.", 0.5, 1),
+        hit("knowledge_1", "Mục kiến thức không có chunk_index.", 0.4),
+    ]
+    blocks = merge_adjacent(hits)
+
+    assert sorted(block.chunk_ids[0] for block in blocks) == sorted(h.id for h in hits)
+    assert all(len(block.chunk_ids) == 1 for block in blocks)
+
+
+def test_merge_adjacent_joins_chunks_without_overlap_on_new_line():
+    blocks = merge_adjacent([
+        hit("content_abc_0", "Phần một của tài liệu.", 0.5, 0),
+        hit("content_abc_1", "Phần hai của tài liệu.", 0.5, 1),
+    ])
+
+    assert [block.text for block in blocks] == ["Phần một của tài liệu.\nPhần hai của tài liệu."]
+
+
+def test_build_context_packs_by_score_within_budget():
+    hits = [
+        hit("a_0", "minh chứng " * 30, 0.5, 0),
+        hit("b_0", "tiêu chí đánh giá", 0.9, 0),
+        hit("c_0", "tiêu chí   đánh giá", 0.8, 0),
+    ]
+    built = build_context(hits, 20, lambda block: block.text)
+
+    assert built.parts == ["tiêu chí đánh giá"]
+    assert built.dropped == 1
+    assert built.tokens <= 20
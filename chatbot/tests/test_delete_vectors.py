@@ -0,0 +1,78 @@
+from io import BytesIO
+
+import pytest
+
+from model.vector_store import FILES_COLLECTION
+
+TEXT_A = "Minh chứng H1.01.01 là quyết định ban hành chuẩn đầu ra của chương trình đào tạo. " * 60
+TEXT_B = "Biên bản họp hội đồng khoa học khoa Kinh tế về việc rà soát chương trình. " * 40
+
+
+@pytest.fixture
+def delete_calls(processor, monkeypatch):
+    calls = []
+    delete = processor.files_store.delete
+
+    def spy(name, ids=None, where=None):
+        calls.append({'ids': ids, 'where': where})
+        return delete(name, ids=ids, where=where)
+
+    monkeypatch.setattr(processor.files_store, "delete", spy)
+    return calls
+
+
+def upload(processor, file_id, text, **scope):
+    result = processor.process_file(BytesIO(text.encode()), f"{file_id}.txt", "text/plain", file_id,
+                                    summary_mode='none', scope=scope)
+    assert result['success'], result
+    return result
+
+
+def chunk_ids(processor, **where):
+    return processor.files_store.get(FILES_COLLECTION, where=where)['ids']
+
+
+def test_delete_vectors_uses_manifest_chunk_ids(processor, delete_calls):
+    upload(processor, "d1", TEXT_B)
+    row = processor.file_manifest.get("d1")
+    expected = [f"{row['chunk_prefix']}_{i}" for i in range(row['chunk_span'])]
+    assert sorted(chunk_ids(processor, content_hash=row['content_hash'])) == sorted(expected)
+
+    report = processor.delete_vectors(file_ids=["d1"])
+
+    assert report['files_deleted'] == 1
+    assert report['unindexed_files'] == 0
+    assert report['chunks_deleted'] == row['chunks_count']
+    assert report['cleanup_pending'] == 0
+    assert delete_calls == [{'ids': expected, 'where': None}]
+    assert chunk_ids(processor, content_hash=row['content_hash']) == []
+    assert processor.file_manifest.get("d1") is None
+
+
+def test_delete_vectors_keeps_shared_content_until_last_owner(processor, delete_calls):
+    upload(processor, "s1", TEXT_A, program_id="P1")
+    upload(processor, "s2", TEXT_A, program_id="P2")
+    content_hash = processor.file_manifest.get("s1")['content_hash']
+    count = len(chunk_ids(processor, content_hash=content_hash))
+
+    report = processor.delete_vectors(file_ids=["s1"])
+    assert (report['contents_shared'], report['contents_deleted']) == (1, 0)
+    assert delete_calls == []
+    # Chunk dùng chung được chuyển sang owner còn lại
+    assert len(chunk_ids(processor, file_id="s2")) == count
+
+    report = processor.delete_vectors(filters={"program_id": "P2"})
+    assert (report['files_deleted'], report['contents_deleted']) == (1, 1)
+    assert [call['where'] for call in delete_calls] == [None]
+    assert chunk_ids(processor, content_hash=content_hash) == []
+
+
+def test_delete_vectors_falls_back_to_metadata_for_unindexed_files(processor, delete_calls):
+    upload(processor, "u1", TEXT_B + " Phụ lục.")
+    processor.file_manifest.remove_many(["u1"])
+
+    report = processor.delete_vectors(vector_ids=["file_u1_0123abcd"])
+
+    assert report['unindexed_files'] == 1
+    assert delete_calls[-1]['ids'] is None
+    assert chunk_ids(processor, file_id="u1") == []
@@ -0,0 +1,64 @@
+import threading
+
+from model import embedding_batcher
+from model.embedding_batcher import BatchEmbedder
+
+
+def test_batches_keep_input_order():
+    batches = []
+    lock = threading.Lock()
+
+    def embed(texts):
+        with lock:
+            batches.append(list(texts))
+        return [[float(text)] for text in texts]
+
+    texts = [str(i) for i in range(7)]
+    vectors, errors = BatchEmbedder(embed, batch_size=3, max_in_flight=2, backoff=0).embed(texts)
+
+    assert vectors == [[float(i)] for i in range(7)]
+    assert errors == {}
+    assert sorted(len(batch) for batch in batches) == [1, 3, 3]
+
+
+def test_transient_failure_is_retried(monkeypatch):
+    monkeypatch.setattr(embedding_batcher.time, "sleep", lambda delay: None)
+    attempts = []
+
+    def embed(texts):
+        attempts.append(texts)
+        if len(attempts) < 3:
+            raise ConnectionError("429")
+        return [[1.0] for _ in texts]
+
+    vectors, errors = BatchEmbedder(embed, batch_size=10, max_retries=3).embed(["a", "b"])
+
+    assert vectors == [[1.0], [1.0]]
+    assert errors == {}
+    assert len(attempts) == 3
+
+
+def test_failed_batch_falls_back_to_single_chunks(monkeypatch):
+    monkeypatch.setattr(embedding_batcher.time, "sleep", lambda delay: None)
+
+    def embed(texts):
+        if "bad" in texts:
+            raise ValueError("invalid input")
+        return [[1.0] for _ in texts]
+
+    vectors, errors = BatchEmbedder(embed, batch_size=3, max_retries=1).embed(["a", "bad", "c", "d"])
+
+    assert vectors == [[1.0], None, [1.0], [1.0]]
+    assert errors == {1: "invalid input"}
+
+
+def test_wrong_vector_count_is_an_error(monkeypatch):
+    monkeypatch.setattr(embedding_batcher.time, "sleep", lambda delay: None)
+
+    vectors, errors = BatchEmbedder(lambda texts: [[1.0]], batch_size=5, max_retries=0).embed(["a", "b"])
+
+    assert vectors == [[1.0], [1.0]]
+    assert errors == {}
+    vectors, errors = BatchEmbedder(lambda texts: [], max_retries=0).embed(["a"])
+    assert vectors == [None]
+    assert "Expected 1 embeddings" in errors[0]
@@ -0,0 +1,49 @@
+from model.embedding_cache import EmbeddingCache
+
+MODEL = "text-embedding-004"
+
+
+def test_get_or_embed_calls_provider_once_per_normalized_text(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"))
+    calls = []
+
+    def embed(texts):
+        calls.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+    first = cache.get_or_embed(MODEL, ["học phí", "  học   phí ", "lịch thi"], embed)
+    second = cache.get_or_embed(MODEL, ["lịch thi"], embed)
+
+    assert calls == [["học phí", "lịch thi"]]
+    assert first[0] == first[1]
+    assert second == [first[2]]
+
+
+def test_disk_tier_survives_restart_and_is_keyed_by_model(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    EmbeddingCache(path).put(MODEL, "chuẩn đầu ra", [0.5, 0.25])
+
+    reopened = EmbeddingCache(path)
+
+    assert reopened.get(MODEL, "chuẩn đầu ra") == [0.5, 0.25]
+    assert reopened.get("other-model", "chuẩn đầu ra") is None
+
+
+def test_memory_and_disk_tiers_are_bounded(tmp_path):
+    # Mỗi vector 2 float32 = 8 byte
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"), memory_items=2, disk_max_bytes=24)
+    for i in range(4):
+        cache.put(MODEL, f"text {i}", [float(i), 0.0])
+
+    assert len(cache._memory) == 2
+    assert cache._disk_bytes <= 24
+    cache._memory.clear()
+    assert cache.get(MODEL, "text 0") is None
+    assert cache.get(MODEL, "text 3") == [3.0, 0.0]
+
+
+def test_memory_only_cache_without_path():
+    cache = EmbeddingCache(None)
+    cache.put(MODEL, "a", [1.0])
+
+    assert cache.get(MODEL, "a") == [1.0]
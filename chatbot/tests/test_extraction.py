@@ -0,0 +1,73 @@
+import io
+
+import pptx
+
+from model import extraction
+from model.extraction import extract_chunks, iter_text_segments, iter_txt_blocks
+
+
+def test_txt_blocks_keep_characters_split_across_reads(monkeypatch):
+    monkeypatch.setattr(extraction, "TXT_READ_BYTES", 5)
+    text = "Học phí được điều chỉnh hằng năm."
+
+    blocks = list(iter_txt_blocks(io.BytesIO(text.encode())))
+
+    assert len(blocks) > 3
+    assert "".join(blocks) == text
+
+
+def test_txt_is_read_as_line_aligned_segments(monkeypatch):
+    monkeypatch.setattr(extraction, "TXT_READ_BYTES", 16)
+    lines = [f"Dòng {i}: minh chứng số {i}" for i in range(10)]
+
+    segments = list(iter_text_segments(io.BytesIO("\n".join(lines).encode()), "a.txt", "text/plain"))
+
+    assert len(segments) > 1
+    assert [page for page, _ in segments] == [None] * len(segments)
+    assert "\n".join(text for _, text in segments) == "\n".join(lines)
+
+
+def _presentation(slides):
+    presentation = pptx.Presentation()
+    for text in slides:
+        slide = presentation.slides.add_slide(presentation.slide_layouts[1])
+        slide.shapes.title.text = text
+    stream = io.BytesIO()
+    presentation.save(stream)
+    stream.seek(0)
+    return stream
+
+
+def test_slides_are_yielded_one_at_a_time():
+    segments = iter_text_segments(_presentation(["Mục tiêu", "Chuẩn đầu ra"]), "a.pptx", "")
+
+    assert next(segments) == (1, "Slide 1:\nMục tiêu")
+    assert next(segments) == (2, "Slide 2:\nChuẩn đầu ra")
+    assert next(segments, None) is None
+
+
+def _run(path, preview_chars):
+    chunks, previews, results = [], [], {}
+    for event in extract_chunks(str(path), path.name, "text/plain", preview_chars):
+        if event[0] == 'segment':
+            previews.append(event[1])
+            chunks.extend(event[2])
+        else:
+            results[event[0]] = event[1]
+    return chunks, "".join(previews), results
+
+
+def test_extract_chunks_streams_bounded_preview_and_stable_hash(tmp_path):
+    text = "Báo cáo tự đánh giá chương trình đào tạo ngành Kinh tế.\n" * 400
+    first = tmp_path / "a.txt"
+    first.write_text(text, encoding="utf-8")
+    second = tmp_path / "b.txt"
+    second.write_text(text.replace(" ", "  "), encoding="utf-8")
+
+    chunks, preview, results = _run(first, 100)
+    _, _, other = _run(second, 100)
+
+    assert len(chunks) > 1
+    assert len(preview) == 101
+    assert set(results['timings']) == {'extracting', 'chunking'}
+    assert results['text_hash'] == other['text_hash']
@@ -0,0 +1,161 @@
+import io
+import sqlite3
+
+import pytest
+
+from model import file_manifest
+from model.content_index import ContentIndex
+from model.file_manifest import FileManifest, vector_id_for
+from model.vector_store import FILES_COLLECTION
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    path = str(tmp_path / "content_index.sqlite3")
+    return ContentIndex(path), FileManifest(path)
+
+
+def _entry(file_id, content_hash, **kwargs):
+    return dict(file_id=file_id, filename=f"{file_id}.pdf", vector_id=vector_id_for(file_id, f"{file_id}.pdf"),
+                content_hash=content_hash, chunk_prefix=f"content_{content_hash}", chunks_count=2, chunk_span=2,
+                **kwargs)
+
+
+def test_content_index_and_manifest_commit_together(catalog):
+    index, manifest = catalog
+
+    with pytest.raises(RuntimeError):
+        with manifest.transaction():
+            index.register("h1", None, "content_h1", 2, None, "")
+            index.attach("f1", "h1", "f1.pdf", "file_f1")
+            manifest.record(_entry("f1", "h1"))
+            raise RuntimeError("crash before commit")
+
+    assert index.get("h1") is None
+    assert index.owner("f1") is None
+    assert manifest.get("f1") is None
+
+    with manifest.transaction():
+        index.register("h1", None, "content_h1", 2, None, "")
+        index.attach("f1", "h1", "f1.pdf", "file_f1")
+        manifest.record(_entry("f1", "h1"))
+
+    assert index.owner("f1")["content_hash"] == "h1"
+    assert manifest.get("f1")["content_hash"] == "h1"
+
+
+def test_reconcile_repairs_both_directions(catalog):
+    index, manifest = catalog
+    # Owner đã gắn nhưng chưa kịp ghi manifest
+    index.register("h1", None, "content_h1", 3, None, "")
+    index.attach("f1", "h1", "f1.pdf", "file_f1_x", {"program_id": "P1"})
+    # Manifest còn dòng của nội dung đã bị gỡ hết owner
+    manifest.record(_entry("f2", "h2"))
+    # Nội dung không còn owner
+    index.register("h3", None, "content_h3", 1, None, "")
+    # File bị gỡ khỏi nội dung vẫn còn owner khác
+    manifest.record(_entry("f4", "h1"))
+
+    report = manifest.reconcile(index)
+
+    assert report == {'dangling_owners': 0, 'orphan_contents': 2, 'stale_files': 2, 'missing_files': 1}
+    restored = manifest.get("f1")
+    assert restored["vector_id"] == "file_f1_x"
+    assert restored["chunk_prefix"] == "content_h1"
+    assert restored["chunks_count"] == 3
+    assert restored["program_id"] == "P1"
+    assert manifest.get("f2") is None and manifest.get("f4") is None
+    assert index.get("h3") is None
+
+    tasks = manifest.claim_cleanup()
+    assert {(task['action'], task['content_hash'], task['file_id']) for task in tasks} == {
+        ('delete', 'h2', None), ('delete', 'h3', None), ('reassign', 'h1', 'f4')
+    }
+    delete_h2 = next(task for task in tasks if task['content_hash'] == 'h2')
+    assert (delete_h2['chunk_prefix'], delete_h2['chunk_span']) == ("content_h2", 2)
+
+    assert manifest.reconcile(index) == {'dangling_owners': 0, 'orphan_contents': 0, 'stale_files': 0,
+                                         'missing_files': 0}
+
+
+def test_cleanup_claims_expire(catalog, monkeypatch):
+    _, manifest = catalog
+    manifest.queue_cleanup('delete', content_hash='h1')
+
+    [task] = manifest.claim_cleanup()
+    assert manifest.claim_cleanup() == []
+
+    manifest.unclaim_cleanup([task['id']])
+    assert [t['id'] for t in manifest.claim_cleanup()] == [task['id']]
+
+    monkeypatch.setattr(file_manifest, "CLEANUP_CLAIM_TTL", -1)
+    assert [t['id'] for t in manifest.claim_cleanup()] == [task['id']]
+
+    manifest.finish_cleanup([task['id']])
+    assert manifest.pending_cleanup() == 0
+
+
+class _Chunks:
+    def __init__(self, ids, metadatas):
+        self.ids = ids
+        self.metadatas = metadatas
+
+    def get(self, collection, include, limit, offset):
+        return {'ids': self.ids[offset:offset + limit], 'metadatas': self.metadatas[offset:offset + limit]}
+
+
+def test_backfill_fills_vector_id_for_every_owner(catalog):
+    index, manifest = catalog
+    index.register("h1", None, "content_h1", 2, None, "")
+    index.attach("f1", "h1", "a.pdf", "file_f1_owner")
+    index.attach("f2", "h1", "b.pdf", "file_f2_owner")
+    store = _Chunks(
+        ["content_h1_0", "content_h1_1", "file_f3_abcd1234_0"],
+        [{'file_id': 'f1', 'filename': 'a.pdf', 'content_hash': 'h1'}] * 2 + [{'file_id': 'f3', 'filename': 'c.pdf'}]
+    )
+
+    assert manifest.backfill(store, FILES_COLLECTION, index) == 3
+
+    assert manifest.get("f1")["vector_id"] == "file_f1_owner"
+    assert manifest.get("f2")["vector_id"] == "file_f2_owner"
+    assert manifest.get("f3")["vector_id"] == vector_id_for("f3", "c.pdf")
+    assert manifest.get("f3")["chunk_span"] == 1
+
+
+def test_legacy_manifest_is_migrated(tmp_path, monkeypatch):
+    legacy = tmp_path / "file_manifest.sqlite3"
+    conn = sqlite3.connect(str(legacy))
+    conn.execute("CREATE TABLE files (file_id TEXT PRIMARY KEY, filename TEXT, vector_id TEXT, chunks_count INTEGER)")
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("INSERT INTO files VALUES ('old', 'old.pdf', 'file_old_1', 4)")
+    conn.execute("INSERT INTO meta VALUES ('backfilled', '1')")
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(file_manifest, "LEGACY_FILE_MANIFEST_PATH", str(legacy))
+
+    manifest = FileManifest(str(tmp_path / "content_index.sqlite3"))
+
+    assert manifest.get("old")["chunks_count"] == 4
+    assert manifest.backfill(None, FILES_COLLECTION) == 0
+
+
+def test_failed_chunk_delete_is_retried(processor, monkeypatch):
+    result = processor.process_file(io.BytesIO("Biên bản tự đánh giá cần xóa. ".encode() * 30), "retry.txt",
+                                    "text/plain", "retry1")
+    assert result['success']
+    store = processor.files_store
+
+    def unavailable(*args, **kwargs):
+        raise ConnectionError("chroma down")
+
+    monkeypatch.setattr(store, "delete", unavailable)
+    report = processor.delete_vectors(file_ids=["retry1"])
+
+    assert report['files_deleted'] == 1
+    assert report['cleanup_pending'] == 1
+    assert processor.file_manifest.get("retry1") is None
+    assert store.get(FILES_COLLECTION, where={"file_id": "retry1"})['ids']
+
+    monkeypatch.undo()
+    assert processor._run_cleanup() == 0
+    assert store.get(FILES_COLLECTION, where={"file_id": "retry1"})['ids'] == []
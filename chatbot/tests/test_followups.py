@@ -0,0 +1,63 @@
+import time
+
+from model.followups import FollowupQueue
+
+
+class _Bot:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    def get_contextual_followup(self, reply):
+        self.calls.append(reply)
+        if self.fail:
+            raise RuntimeError("quota")
+        return [f"Hỏi thêm về {reply}?"]
+
+
+def _wait(queue, message_id):
+    deadline = time.monotonic() + 10
+    while queue.get(message_id)['status'] == 'pending':
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+    return queue.get(message_id)
+
+
+def test_async_followups_are_generated_in_background():
+    bot = _Bot()
+    queue = FollowupQueue(bot, workers=1)
+
+    queue.submit("m1", "học phí")
+
+    assert _wait(queue, "m1") == {'status': 'completed', 'followup_questions': ["Hỏi thêm về học phí?"]}
+    # Worker khác đọc kết quả qua state store
+    assert FollowupQueue(bot, workers=1).get("m1")['status'] == 'completed'
+
+
+def test_failed_generation_is_reported():
+    queue = FollowupQueue(_Bot(fail=True), workers=1)
+
+    queue.submit("m2", "lịch thi")
+
+    assert _wait(queue, "m2") == {'status': 'failed', 'followup_questions': []}
+
+
+def test_chat_modes(client, app_module, monkeypatch):
+    bot = _Bot()
+    monkeypatch.setattr(app_module.bot, "get_contextual_followup", bot.get_contextual_followup)
+
+    skipped = client.post("/api/ai-chat", json={"message": "Học phí?", "followups": False}).get_json()
+    assert (skipped["followups_status"], skipped["followup_questions"], bot.calls) == ("skipped", [], [])
+
+    sync = client.post("/api/ai-chat", json={"message": "Học phí?", "followups": "sync"}).get_json()
+    assert sync["followups_status"] == "completed"
+    assert sync["followup_questions"] == [f"Hỏi thêm về {sync['reply']}?"]
+
+    pending = client.post("/api/ai-chat", json={"message": "Học phí?", "followups": "async"}).get_json()
+    assert pending["followups_status"] == "pending"
+    url = f"/api/ai-chat/followups/{pending['message_id']}"
+    deadline = time.monotonic() + 10
+    while client.get(url).get_json()["status"] == "pending" and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert client.get(url).get_json()["followup_questions"] == [f"Hỏi thêm về {pending['reply']}?"]
+    assert client.get("/api/ai-chat/followups/unknown").status_code == 404
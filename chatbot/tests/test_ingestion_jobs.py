@@ -0,0 +1,80 @@
+import io
+import time
+
+from model.ingestion_jobs import STAGES, IngestionJobQueue
+
+
+class _Processor:
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    def process_file(self, stream, filename, content_type, file_id, progress_callback=None, **kwargs):
+        progress_callback('extracting', 'running')
+        progress_callback('extracting', 'done')
+        if self.fail:
+            raise RuntimeError("extract crashed")
+        return {'success': True, 'file_id': file_id, 'text': stream.read().decode()}
+
+
+def _wait(queue, job_id):
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job['status'] not in ('queued', 'running'):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_completed_job_reports_stages_and_result():
+    released = []
+    queue = IngestionJobQueue(_Processor(), workers=1)
+
+    job_id = queue.submit(b"noi dung", "a.txt", "text/plain", "f1", on_finish=lambda: released.append(True))
+    job = _wait(queue, job_id)
+
+    assert job['status'] == 'completed'
+    assert job['result']['text'] == "noi dung"
+    assert job['stages']['extracting']['status'] == 'done'
+    assert 'duration_ms' in job['stages']['extracting']
+    assert all(job['stages'][stage]['status'] == 'skipped' for stage in STAGES[1:])
+    assert job['progress'] == 1.0
+    assert released == [True]
+    # Job kết thúc chỉ còn trong state store, worker khác đọc được
+    assert job_id not in queue._jobs
+    assert IngestionJobQueue(_Processor(), workers=1).get(job_id)['status'] == 'completed'
+
+
+def test_crashed_job_is_failed_and_releases_reservation():
+    released = []
+    queue = IngestionJobQueue(_Processor(fail=True), workers=1)
+
+    job = _wait(queue, queue.submit(b"x", "a.txt", "text/plain", "f1", on_finish=lambda: released.append(True)))
+
+    assert job['status'] == 'failed'
+    assert job['error'] == "extract crashed"
+    assert job['stages']['extracting']['status'] == 'done'
+    assert released == [True]
+
+
+def test_async_upload_endpoint_returns_pollable_job(client):
+    response = client.post("/api/process-file", data={
+        "file": (io.BytesIO("Quy định học phí năm học mới. ".encode() * 20), "hocphi.txt", "text/plain"),
+        "file_id": "async1",
+        "async": "1",
+        "summary_mode": "none",
+    }, content_type="multipart/form-data")
+
+    assert response.status_code == 202
+    body = response.get_json()
+    deadline = time.monotonic() + 30
+    while True:
+        job = client.get(body["status_url"]).get_json()["job"]
+        if job["status"] not in ("queued", "running") or time.monotonic() > deadline:
+            break
+        time.sleep(0.05)
+
+    assert job["status"] == "completed"
+    result = client.get(f"{body['status_url']}/result").get_json()
+    assert result["success"] and result["status"] == "completed"
+    assert client.get("/api/process-file/jobs/unknown").status_code == 404
@@ -0,0 +1,117 @@
+import sqlite3
+
+import pytest
+
+from model import lexical_index
+from model.lexical_index import LexicalIndex, reciprocal_rank_fusion, where_condition
+
+COLLECTION = "uploaded_files"
+
+
+@pytest.fixture
+def index(tmp_path):
+    return LexicalIndex(str(tmp_path / "lexical.db"))
+
+
+def _ids(results):
+    return [doc_id for doc_id, _ in results]
+
+
+def test_bm25_ranks_matching_document_first(index):
+    index.upsert(COLLECTION, ["a", "b", "c"], [
+        "Quy định về học phí năm học mới",
+        "Minh chứng H1.01.02 cho tiêu chí 1",
+        "Lịch thi học kỳ hai",
+    ])
+
+    assert _ids(index.search(COLLECTION, "minh chứng H1.01.02"))[0] == "b"
+    # Câu hỏi gõ không dấu vẫn khớp
+    assert _ids(index.search(COLLECTION, "hoc phi"))[0] == "a"
+
+
+def test_reciprocal_rank_fusion_prefers_documents_in_both_rankings():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]])
+
+    assert fused[0][0] == "b"
+    assert fused[0][1] <= 1.0
+    assert {doc_id for doc_id, _ in fused} == {"a", "b", "c", "d"}
+
+
+def test_delete_ids_in_batches(index, monkeypatch):
+    monkeypatch.setattr(lexical_index, "QUERY_BATCH", 2)
+    ids = [f"doc{i}" for i in range(5)]
+    index.upsert(COLLECTION, ids, [f"tài liệu số {i}" for i in range(5)])
+
+    index.delete(COLLECTION, ids[:4] + ["missing"])
+
+    assert index.count(COLLECTION) == 1
+    assert _ids(index.search(COLLECTION, "tài liệu")) == ["doc4"]
+
+
+def test_delete_where_uses_metadata_columns(index):
+    index.upsert(COLLECTION, ["f1_0", "f1_1", "f2_0", "f3_0"], ["báo cáo tự đánh giá"] * 4, [
+        {"file_id": "f1", "content_hash": "h1"},
+        {"file_id": "f1", "content_hash": "h1"},
+        {"file_id": "f2", "content_hash": "h2"},
+        {"file_id": "f3", "content_hash": "h3"},
+    ])
+
+    index.delete_where(COLLECTION, {"content_hash": "h1"})
+    assert sorted(_ids(index.search(COLLECTION, "báo cáo"))) == ["f2_0", "f3_0"]
+
+    index.delete_where(COLLECTION, {"file_id": {"$in": ["f2", "unknown"]}})
+    assert _ids(index.search(COLLECTION, "báo cáo")) == ["f3_0"]
+
+
+def test_update_moves_chunks_to_new_owner(index):
+    index.upsert(COLLECTION, ["c0"], ["nội dung dùng chung"], [{"file_id": "old", "content_hash": "h"}])
+    index.update(COLLECTION, ["c0"], [{"file_id": "new", "content_hash": "h"}])
+
+    index.delete_where(COLLECTION, {"$and": [{"content_hash": "h"}, {"file_id": "old"}]})
+    assert index.count(COLLECTION) == 1
+
+    index.delete_where(COLLECTION, {"$and": [{"content_hash": "h"}, {"file_id": "new"}]})
+    assert index.count(COLLECTION) == 0
+
+
+def test_where_condition_rejects_unsupported_clauses():
+    assert where_condition({"filename": "a.pdf"}) is None
+    assert where_condition({"$or": [{"file_id": "a"}, {"file_id": "b"}]}) is None
+    assert where_condition({"file_id": {"$ne": "a"}}) is None
+    assert where_condition({"file_id": {"$in": ["a", "b"]}}) == ("file_id IN (?,?)", ["a", "b"])
+    with pytest.raises(ValueError):
+        LexicalIndex.delete_where(None, COLLECTION, {"filename": "a.pdf"})
+
+
+def test_index_without_metadata_columns_is_cleared_for_rebuild(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE entries (id INTEGER PRIMARY KEY, collection TEXT, doc_id TEXT, UNIQUE(collection, doc_id))"
+    )
+    conn.execute("INSERT INTO entries (collection, doc_id) VALUES (?, ?)", (COLLECTION, "old"))
+    conn.commit()
+    conn.close()
+
+    index = LexicalIndex(path)
+
+    # count lệch với Chroma nên sync() sẽ dựng lại kèm metadata
+    assert index.count(COLLECTION) == 0
+
+
+def test_vector_store_where_delete_skips_id_lookup(index, tmp_path, monkeypatch):
+    from model.vector_store import VectorStore
+
+    store = VectorStore(str(tmp_path / "chroma"))
+    store.lexical = index
+    store.upsert(COLLECTION, ["a_0", "b_0"], [[1.0, 0.0], [0.0, 1.0]], ["học phí", "học phí"], [
+        {"file_id": "a", "content_hash": "ha"},
+        {"file_id": "b", "content_hash": "hb"},
+    ])
+    handle = store.collection(COLLECTION)
+    monkeypatch.setattr(type(handle), "get", lambda *args, **kwargs: pytest.fail("unexpected get"))
+
+    store.delete(COLLECTION, where={"file_id": "a"})
+
+    assert store.count(COLLECTION) == 1
+    assert _ids(index.search(COLLECTION, "học phí")) == ["b_0"]
@@ -0,0 +1,123 @@
+import os
+
+from model import metrics
+from model.metrics import Counter, Gauge, Histogram, Registry, clear_snapshots
+from model.chroma_server import CHROMA_LOCAL_SERVERS_ENV, local_server_port
+
+
+def _registry():
+    registry = Registry()
+    counter = registry.register(Counter("test_errors_total", "Lỗi", ["component"]))
+    histogram = registry.register(Histogram("test_seconds", "Thời gian", ["stage"], buckets=(0.1, 1.0)))
+    gauge = registry.register(Gauge("test_sessions", "Phiên"))
+    return registry, counter, histogram, gauge
+
+
+def test_render_text_format():
+    registry, counter, histogram, gauge = _registry()
+    counter.inc(component="http")
+    counter.inc(2, component="http")
+    histogram.observe(0.05, stage="embedding")
+    histogram.observe(0.5, stage="embedding")
+    histogram.observe(5, stage="embedding")
+    gauge.set_function(lambda: {(): 7})
+
+    lines = registry.render().splitlines()
+
+    assert "# TYPE test_errors_total counter" in lines
+    assert 'test_errors_total{component="http"} 3' in lines
+    assert 'test_seconds_bucket{stage="embedding",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="embedding",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{stage="embedding",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{stage="embedding"} 3' in lines
+    assert "test_sessions 7" in lines
+
+
+def test_label_values_are_escaped():
+    registry, counter, _, _ = _registry()
+    counter.inc(component='a"b\nc')
+
+    assert 'test_errors_total{component="a\\"b\\nc"} 1' in registry.render()
+
+
+def test_shared_registry_sums_worker_snapshots(tmp_path, monkeypatch):
+    directory = str(tmp_path / "metrics")
+    # Hai worker: cùng định nghĩa metric, khác pid
+    first, first_counter, first_histogram, first_gauge = _registry()
+    second, second_counter, second_histogram, second_gauge = _registry()
+    for registry in (first, second):
+        registry._directory = directory
+    os.makedirs(directory)
+    first_gauge.set_function(lambda: {(): 4})
+    second_gauge.set_function(lambda: {(): 4})
+
+    monkeypatch.setattr(metrics.os, "getpid", lambda: 101)
+    first_counter.inc(component="http")
+    first_histogram.observe(0.05, stage="embedding")
+    first.write_snapshot()
+
+    monkeypatch.setattr(metrics.os, "getpid", lambda: 102)
+    second_counter.inc(2, component="http")
+    second_counter.inc(component="gemini")
+    second_histogram.observe(0.5, stage="embedding")
+    lines = second.render().splitlines()
+
+    assert sorted(os.listdir(directory)) == ["101.json", "102.json"]
+    assert 'test_errors_total{component="http"} 3' in lines
+    assert 'test_errors_total{component="gemini"} 1' in lines
+    assert 'test_seconds_bucket{stage="embedding",le="0.1"} 1' in lines
+    assert 'test_seconds_count{stage="embedding"} 2' in lines
+    # Gauge đọc từ kho dùng chung nên không cộng theo số worker
+    assert "test_sessions 4" in lines
+
+
+def test_share_drops_values_recorded_before_fork(tmp_path):
+    registry, counter, _, _ = _registry()
+    counter.inc(component="http")
+
+    registry.share(str(tmp_path), interval=3600)
+
+    assert "test_errors_total{" not in registry.render()
+
+
+def test_clear_snapshots_keeps_other_files(tmp_path):
+    for name in ("1.json", "2.json.tmp", "notes.txt"):
+        (tmp_path / name).write_text("{}")
+
+    clear_snapshots(str(tmp_path))
+
+    assert os.listdir(tmp_path) == ["notes.txt"]
+
+
+def test_local_chroma_server_lookup(monkeypatch, tmp_path):
+    path = str(tmp_path / "chroma_db")
+    monkeypatch.setenv(CHROMA_LOCAL_SERVERS_ENV, '{"%s": 8101}' % path)
+
+    assert local_server_port(path + "/") == 8101
+    assert local_server_port(str(tmp_path / "other")) == 0
+
+    monkeypatch.setenv(CHROMA_LOCAL_SERVERS_ENV, "not json")
+    assert local_server_port(path) == 0
+
+
+def _sample(text, prefix):
+    return sum(float(line.rsplit(" ", 1)[1]) for line in text.splitlines() if line.startswith(prefix))
+
+
+def test_metrics_endpoint_reports_requests_and_stages(client):
+    before = client.get("/api/metrics").get_data(as_text=True)
+    client.get("/api/ai-chat/history/metrics-session")
+    client.post("/api/summarize-text", json={"text": "Quy định về học phí và lịch thi. " * 20})
+
+    response = client.get("/api/metrics")
+    text = response.get_data(as_text=True)
+
+    assert response.mimetype == "text/plain"
+    # Nhãn endpoint là rule, không chứa session_id
+    route = ('chatbot_http_request_duration_seconds_count{endpoint="/api/ai-chat/history/<session_id>",'
+             'method="GET",status="200"}')
+    assert _sample(text, route) == _sample(before, route) + 1
+    assert "metrics-session" not in text
+    assert _sample(text, 'chatbot_stage_duration_seconds_count{stage="summarization"}') > \
+        _sample(before, 'chatbot_stage_duration_seconds_count{stage="summarization"}')
+    assert "# TYPE chatbot_active_sessions gauge" in text
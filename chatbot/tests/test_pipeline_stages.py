@@ -0,0 +1,54 @@
+import threading
+from io import BytesIO
+
+import pytest
+
+from model.file_processor import FileProcessor
+
+TEXT = "Minh chứng về hoạt động đảm bảo chất lượng của khoa được cập nhật hằng năm. " * 80
+
+
+@pytest.fixture(scope="module")
+def processor():
+    return FileProcessor()
+
+
+def test_summary_runs_alongside_embedding(processor, monkeypatch):
+    embedding_started = threading.Event()
+    create_embeddings = processor.create_embeddings
+
+    def embed(texts):
+        embedding_started.set()
+        return create_embeddings(texts)
+
+    # Tóm tắt chỉ xong được khi lô embedding đầu tiên đã bắt đầu, tức là hai việc chạy song song
+    monkeypatch.setattr(processor, "create_embeddings", embed)
+    monkeypatch.setattr(processor, "summarize_text",
+                        lambda text, max_length=500: "song song" if embedding_started.wait(5) else "tuần tự")
+    events = []
+
+    result = processor.process_file(BytesIO(TEXT.encode()), "a.txt", "text/plain", "stage-1",
+                                    progress_callback=lambda stage, status: events.append((stage, status)),
+                                    summary_mode='parallel')
+
+    assert result['success'], result
+    assert result['summary'] == "song song"
+    assert {'extracting', 'chunking', 'embedding', 'storing', 'summarizing'} <= set(result['timings_ms'])
+    for stage in ('extracting', 'chunking', 'embedding', 'storing', 'summarizing'):
+        assert events.index((stage, 'running')) < events.index((stage, 'done'))
+
+
+def test_failed_stage_is_reported(processor, monkeypatch):
+    def broken(texts):
+        raise RuntimeError("embedding down")
+
+    monkeypatch.setattr(processor.batch_embedder, "embed", broken)
+    events = []
+
+    result = processor.process_file(BytesIO(b"Noi dung khac hoan toan de tranh cache. " * 20), "b.txt",
+                                    "text/plain", "stage-2", summary_mode='none',
+                                    progress_callback=lambda stage, status: events.append((stage, status)))
+
+    assert not result['success']
+    assert ('embedding', 'failed') in events
+    assert not any(stage == 'summarizing' for stage, _ in events)
@@ -0,0 +1,42 @@
+import math
+
+import pytest
+
+from model.providers import AIProvider, LocalProvider
+
+
+def test_incomplete_provider_fails_at_construction():
+    class EmbedOnly(AIProvider):
+        def embed(self, model, texts):
+            return []
+
+    with pytest.raises(TypeError):
+        EmbedOnly()
+
+
+def test_local_embeddings_are_deterministic_and_normalized():
+    provider = LocalProvider(dim=64)
+    first, second, other = provider.embed("m", ["Minh chứng H1.01", "Minh chứng H1.01", "Biên bản họp"])
+
+    assert len(first) == 64
+    assert first == second
+    assert first != other
+    assert math.isclose(sum(v * v for v in first), 1.0, rel_tol=1e-6)
+    assert provider.embedding_key("m") == "local/m"
+
+
+def test_local_generation_is_deterministic_and_respects_token_limit():
+    provider = LocalProvider()
+    prompt = "Ngữ cảnh\nLàm sao tạo minh chứng?\n"
+
+    reply = provider.generate("m", prompt)
+    assert reply == provider.generate("m", prompt)
+    assert reply != provider.generate("m", prompt + "Thêm\n")
+    assert len(provider.generate("m", prompt, max_output_tokens=3).split()) == 3
+
+
+def test_local_stream_matches_generate():
+    provider = LocalProvider()
+    prompt = "Ngữ cảnh\nCâu hỏi về tiêu chí?\n"
+
+    assert "".join(provider.generate_stream("m", prompt)) == provider.generate("m", prompt)
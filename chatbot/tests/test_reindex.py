@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+import index_data
+from model.vector_store import KNOWLEDGE_COLLECTION, get_vector_store
+
+CHUNKS = [
+    {"id": "c1", "text": "Quy trình upload minh chứng gồm bốn bước.", "source": "Hướng dẫn upload"},
+    {"id": "c2", "text": "Minh chứng được mã hóa theo dạng H1.01.01.", "source": "Mã minh chứng"},
+    {"id": "c3", "text": "Hệ thống hỗ trợ tệp PDF, DOCX và XLSX.", "source": "Định dạng tệp"},
+]
+
+
+@pytest.fixture
+def knowledge(tmp_path, monkeypatch):
+    data_file = tmp_path / "data_chunks.json"
+    chroma_path = str(tmp_path / "chroma_db")
+    monkeypatch.setattr(index_data, "DATA_FILE", str(data_file))
+    monkeypatch.setattr(index_data, "CHROMA_PATH", chroma_path)
+    monkeypatch.setattr(index_data, "KB_VERSION_FILE", str(tmp_path / "chroma_db" / "kb_version"))
+    embedded = []
+    embed = index_data._embed_uncached
+
+    def spy(provider, texts):
+        embedded.extend(texts)
+        return embed(provider, texts)
+
+    monkeypatch.setattr(index_data, "_embed_uncached", spy)
+
+    def write(chunks):
+        data_file.write_text(json.dumps(chunks, ensure_ascii=False), encoding="utf-8")
+
+    write(CHUNKS)
+    return write, get_vector_store(chroma_path), embedded
+
+
+def test_dry_run_reports_plan_without_writing(knowledge):
+    write, store, embedded = knowledge
+    first = index_data.create_vector_store()
+    assert sorted(first["added"]) == ["c1", "c2", "c3"]
+    version = index_data.read_knowledge_version()
+    embedded.clear()
+
+    write([CHUNKS[0], {**CHUNKS[1], "text": "Minh chứng dùng mã H1.01.02."},
+           {"id": "c4", "text": "Câu hỏi thường gặp.", "source": "FAQ"}])
+    report = index_data.create_vector_store(dry_run=True)
+
+    assert report == {'dry_run': True, 'added': ["c4"], 'changed': ["c2"], 'removed': ["c3"],
+                      'unchanged': 1, 'version': None}
+    assert embedded == []
+    assert store.count(KNOWLEDGE_COLLECTION) == 3
+    assert index_data.read_knowledge_version() == version
+
+
+def test_incremental_run_embeds_only_changed_chunks(knowledge):
+    write, store, embedded = knowledge
+    index_data.create_vector_store()
+    embedded.clear()
+
+    changed = {**CHUNKS[1], "text": "Minh chứng dùng mã H1.01.02."}
+    write([CHUNKS[0], changed])
+    report = index_data.create_vector_store()
+
+    assert (report["changed"], report["removed"], report["unchanged"]) == (["c2"], ["c3"], 1)
+    assert embedded == [changed["text"]]
+    assert sorted(store.get(KNOWLEDGE_COLLECTION)["ids"]) == ["c1", "c2"]
+    assert index_data.read_knowledge_version() == report["version"]
+
+    embedded.clear()
+    assert index_data.create_vector_store()["unchanged"] == 2
+    assert embedded == []
@@ -0,0 +1,67 @@
+import pytest
+
+from model.content_index import ContentIndex
+from model.retrieval_scope import RetrievalScope
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = ContentIndex(str(tmp_path / "content_index.sqlite3"))
+    index.register("hash_shared", None, "content_shared", 4, None, "")
+    # f1 (P1) upload trước nên chunk dùng chung mang metadata của f1; f2 thuộc P2
+    index.attach("f1", "hash_shared", "a.pdf", "file_f1", {"program_id": "P1"})
+    index.attach("f2", "hash_shared", "b.pdf", "file_f2", {"program_id": "P2"})
+    return index
+
+
+def test_from_request_validates_scope():
+    assert RetrievalScope.from_request({}) is None
+    scope = RetrievalScope.from_request({"scope": {"file_ids": [1, "1", "f2"], "program_id": "P1", "x": "y"}})
+    assert scope.file_ids == ["1", "f2"]
+    assert scope.fields == {"program_id": "P1"}
+
+    for bad in ("P1", {"file_ids": "f1"}, {}):
+        with pytest.raises(ValueError):
+            RetrievalScope.from_request({"scope": bad})
+
+
+def test_resolve_without_content_index_filters_metadata_only():
+    resolved = RetrievalScope(file_ids=["f1", "f2"], fields={"program_id": "P1"}).resolve()
+
+    assert resolved.where == {"$and": [{"program_id": "P1"}, {"file_id": {"$in": ["f1", "f2"]}}]}
+    assert resolved.prefixes == ["file_f1_", "file_f2_"]
+    assert resolved.allowed_file_ids == {"f1", "f2"}
+
+
+def test_resolve_empty_file_ids_matches_nothing():
+    resolved = RetrievalScope(file_ids=[]).resolve()
+
+    assert resolved.where == {"file_id": {"$in": [""]}}
+    assert resolved.prefixes == []
+
+
+def test_resolve_includes_shared_content_owned_in_scope(index):
+    resolved = RetrievalScope(fields={"program_id": "P2"}).resolve(index)
+
+    assert resolved.where == {"$or": [{"program_id": "P2"}, {"content_hash": {"$in": ["hash_shared"]}}]}
+    assert resolved.prefixes == ["content_shared_"]
+    assert resolved.allowed_file_ids == {"f2"}
+    # Chunk dùng chung mang metadata của f1 nhưng người hỏi chỉ thấy f2
+    presented = resolved.present({"file_id": "f1", "filename": "a.pdf", "content_hash": "hash_shared"})
+    assert (presented["file_id"], presented["filename"]) == ("f2", "b.pdf")
+
+
+def test_resolve_keeps_metadata_of_allowed_owner(index):
+    resolved = RetrievalScope(file_ids=["f1"]).resolve(index)
+
+    assert resolved.prefixes == ["file_f1_", "content_shared_"]
+    metadata = {"file_id": "f1", "filename": "a.pdf", "content_hash": "hash_shared"}
+    assert resolved.present(metadata) == metadata
+
+
+def test_resolve_drops_prefixes_over_limit(index, monkeypatch):
+    monkeypatch.setattr("model.retrieval_scope.MAX_SCOPE_PREFIXES", 1)
+    resolved = RetrievalScope(file_ids=["f1", "f2"]).resolve(index)
+
+    assert resolved.prefixes is None
+    assert resolved.where["$or"][1] == {"content_hash": {"$in": ["hash_shared"]}}
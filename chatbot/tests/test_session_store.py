@@ -0,0 +1,87 @@
+import pytest
+
+from model.session_store import MemorySessionStore, SessionStore, SqliteSessionStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    # flush_interval lớn: chỉ flush khi test gọi, để kiểm tra được bộ đệm ghi
+    return SqliteSessionStore(str(tmp_path / "sessions.sqlite3"), ttl=3600, max_messages=3,
+                              flush_interval=3600, flush_batch=1000)
+
+
+def test_session_store_is_abstract():
+    class Incomplete(SessionStore):
+        def append(self, session_id, entry):
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_get_reads_pending_writes_without_flushing(store):
+    store.append("s1", {"user": "a"})
+    store.append("s1", {"user": "b"})
+
+    assert store.get("s1") == [{"user": "a"}, {"user": "b"}]
+    assert len(store._pending) == 2
+    assert store.count() == 0
+
+
+def test_get_merges_stored_and_pending_messages(store):
+    for i in range(3):
+        store.append("s1", {"i": i})
+    store.flush()
+    store.append("s1", {"i": 3})
+
+    assert store.get("s1") == [{"i": 1}, {"i": 2}, {"i": 3}]
+    store.flush()
+    assert store.get("s1") == [{"i": 1}, {"i": 2}, {"i": 3}]
+    assert store.count() == 1
+
+
+def test_flush_is_visible_to_another_worker(store, tmp_path):
+    store.append("s1", {"i": 1})
+    other = SqliteSessionStore(str(tmp_path / "sessions.sqlite3"), flush_interval=3600)
+    assert other.get("s1") == []
+
+    store.flush()
+    assert other.get("s1") == [{"i": 1}]
+
+
+def test_delete_drops_pending_and_stored_messages(store):
+    store.append("s1", {"i": 1})
+    store.flush()
+    store.append("s1", {"i": 2})
+    store.append("s2", {"i": 3})
+
+    assert store.delete("s1")
+    assert store.get("s1") == []
+    store.flush()
+    assert store.get("s1") == []
+    assert store.get("s2") == [{"i": 3}]
+    assert not store.delete("missing")
+
+
+def test_expired_session_does_not_revive_old_messages(store, monkeypatch):
+    store.append("s1", {"i": 1})
+    store.flush()
+    now = store._conn.execute("SELECT last_active FROM sessions").fetchone()[0]
+    monkeypatch.setattr("model.session_store.time.time", lambda: now + 7200)
+
+    store.append("s1", {"i": 2})
+    assert store.get("s1") == [{"i": 2}]
+    store.flush()
+    assert store.get("s1") == [{"i": 2}]
+
+
+def test_memory_store_keeps_recently_read_sessions():
+    store = MemorySessionStore(ttl=3600, max_messages=10, max_sessions=2)
+    store.append("s1", {"i": 1})
+    store.append("s2", {"i": 2})
+    store.get("s1")
+    store.append("s3", {"i": 3})
+
+    assert store.get("s1") == [{"i": 1}]
+    assert store.get("s2") == []
+    assert store.count() == 2
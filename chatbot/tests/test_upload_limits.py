@@ -0,0 +1,113 @@
+import io
+import os
+
+import pytest
+from werkzeug.datastructures import FileStorage
+from werkzeug.test import encode_multipart
+
+from model import uploads
+from model.uploads import InFlightLimiter, UploadTooLarge, spool_upload
+
+
+@pytest.fixture
+def limiter_path(tmp_path):
+    return str(tmp_path / "state.db")
+
+
+def test_limit_is_shared_between_workers(limiter_path):
+    # Hai instance trên cùng một file sqlite tương ứng hai worker gunicorn
+    first = InFlightLimiter(max_bytes=100, db_path=limiter_path)
+    second = InFlightLimiter(max_bytes=100, db_path=limiter_path)
+
+    token = first.try_acquire(80)
+    assert token
+    assert second.try_acquire(30) is None
+    assert second.in_flight == 80
+
+    first.release(token)
+    assert second.try_acquire(30)
+
+
+def test_idle_limiter_admits_oversized_upload(limiter_path):
+    limiter = InFlightLimiter(max_bytes=100, db_path=limiter_path)
+
+    assert limiter.try_acquire(500)
+    assert limiter.try_acquire(1) is None
+
+
+def test_reservations_of_dead_workers_are_purged(limiter_path, monkeypatch):
+    limiter = InFlightLimiter(max_bytes=100, db_path=limiter_path)
+    assert limiter.try_acquire(90)
+
+    monkeypatch.setattr(uploads, "pid_alive", lambda pid: pid != os.getpid())
+
+    assert limiter.try_acquire(90)
+
+
+def test_spool_upload_stops_at_limit():
+    spooled = spool_upload(io.BytesIO(b"x" * 100), max_bytes=100, spool_bytes=10)
+    assert spooled.read() == b"x" * 100
+
+    with pytest.raises(UploadTooLarge):
+        spool_upload(io.BytesIO(b"x" * 101), max_bytes=100, spool_bytes=10)
+
+
+@pytest.fixture
+def small_uploads(app_module, monkeypatch, tmp_path):
+    monkeypatch.setattr(app_module, "UPLOAD_MAX_BYTES", 1000)
+    monkeypatch.setattr(app_module, "UPLOAD_FORM_OVERHEAD_BYTES", 1000)
+    monkeypatch.setattr(app_module, "upload_limiter", InFlightLimiter(db_path=str(tmp_path / "state.db")))
+
+
+def _upload(client, size, **kwargs):
+    return client.post("/api/process-file", data={
+        "file": (io.BytesIO(b"a" * size), "big.txt", "text/plain"),
+        "file_id": "f1",
+    }, content_type="multipart/form-data", **kwargs)
+
+
+def test_declared_oversized_upload_is_rejected(client, small_uploads):
+    response = _upload(client, 5000)
+
+    assert response.status_code == 413
+    assert response.get_json()["error"].startswith("File vượt quá giới hạn")
+
+
+def test_chunked_oversized_upload_is_rejected(client, small_uploads):
+    boundary, body = encode_multipart({"file": FileStorage(io.BytesIO(b"a" * 5000), "big.txt"), "file_id": "f1"})
+    # Không có Content-Length: chỉ giới hạn của werkzeug chặn được khi đọc body
+    response = client.post(
+        "/api/process-file",
+        input_stream=io.BytesIO(body),
+        content_type=f"multipart/form-data; boundary={boundary}",
+        headers={"Transfer-Encoding": "chunked"},
+        environ_overrides={"wsgi.input_terminated": True},
+    )
+
+    assert response.status_code == 413
+    assert response.get_json()["error"].startswith("File vượt quá giới hạn")
+
+
+def test_upload_limit_does_not_apply_to_other_routes(client, small_uploads):
+    response = client.post("/api/summarize-text", json={"text": "Nội dung dài. " * 500})
+
+    assert response.status_code != 413
+
+
+def test_busy_limiter_returns_retry_after(client, small_uploads, app_module):
+    assert app_module.upload_limiter.try_acquire(app_module.upload_limiter.max_bytes)
+
+    response = _upload(client, 10)
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "5"
+
+
+def test_413_from_other_routes_is_not_reported_as_upload(app_module):
+    with app_module.app.test_request_context("/api/summarize-text", method="POST"):
+        app_module.app.preprocess_request()
+        response, status = app_module.request_too_large(None)
+
+    assert status == 413
+    assert response.get_json() == {"error": "Request entity too large"}
+    assert app_module.app.config["MAX_CONTENT_LENGTH"] is None
@@ -0,0 +1,47 @@
+import os
+
+from model import vector_store
+from model.vector_store import get_vector_store
+
+COLLECTION = "scores"
+
+
+def test_one_store_per_path(tmp_path):
+    path = str(tmp_path / "chroma")
+
+    store = get_vector_store(path)
+
+    assert get_vector_store(path + os.sep) is store
+    assert get_vector_store(os.path.join(path, "..", "chroma")) is store
+    assert get_vector_store(str(tmp_path / "other")) is not store
+
+
+def test_client_is_opened_lazily_and_dropped_after_fork(tmp_path):
+    store = get_vector_store(str(tmp_path / "chroma"))
+    assert store._client is None
+
+    # Không tạo collection khi chỉ kiểm tra
+    assert not store.has_collection(COLLECTION)
+    assert store.count(COLLECTION) == 0
+    assert store._client is not None
+    assert not store.has_collection(COLLECTION)
+
+    vector_store._reopen_stores_after_fork()
+
+    assert store._client is None and store._collections == {}
+
+
+def test_query_returns_search_hits(tmp_path):
+    store = get_vector_store(str(tmp_path / "chroma"))
+    store.upsert(COLLECTION, ["a", "b"], [[1.0, 0.0], [0.0, 1.0]], ["học phí", "lịch thi"],
+                 [{"file_id": "f1"}, {"file_id": "f2"}])
+
+    [hits] = store.query(COLLECTION, [[1.0, 0.1]], n_results=2)
+
+    assert [hit.id for hit in hits] == ["a", "b"]
+    assert hits[0].document == "học phí"
+    assert hits[0].metadata == {"file_id": "f1"}
+    assert hits[0].similarity > hits[1].similarity
+
+    [hits] = store.query(COLLECTION, [[1.0, 0.1]], n_results=2, where={"file_id": "f2"})
+    assert [hit.id for hit in hits] == ["b"]
@@ -0,0 +1,55 @@
+import pytest
+
+from model.worker_pool import WorkerPool, WorkerPoolError, WorkerPoolTimeout
+
+
+@pytest.fixture
+def pool():
+    pool = WorkerPool("tests.pool_tasks", workers=1, max_tasks=2, timeout=5)
+    yield pool
+    pool.shutdown()
+
+
+def test_generator_results_are_streamed(pool):
+    assert list(pool.stream('pages', 3)) == [0, 1, 2]
+
+
+def test_worker_is_reused_then_recycled(pool):
+    first = pool.run('pid')
+    assert pool.run('pid') == first
+
+    third = pool.run('pid')
+
+    assert third != first
+    assert pool.stats()['recycled'] == 1
+
+
+def test_task_error_keeps_worker(pool):
+    pool.max_tasks = 0
+    first = pool.run('pid')
+
+    with pytest.raises(WorkerPoolError, match="ValueError: bad file"):
+        pool.run('fail')
+
+    assert pool.run('pid') == first
+    assert pool.stats()['killed'] == 0
+
+
+def test_timed_out_task_kills_worker(pool):
+    pool.timeout = 0.2
+    first = pool.run('pid')
+
+    with pytest.raises(WorkerPoolTimeout):
+        pool.run('sleep', 5)
+
+    assert pool.stats()['killed'] == 1
+    assert pool.run('pid') != first
+
+
+def test_abandoned_stream_kills_worker(pool):
+    stream = pool.stream('pages', 100)
+    assert next(stream) == 0
+    stream.close()
+
+    assert pool.stats()['killed'] == 1
+    assert pool.stats()['idle'] == 0
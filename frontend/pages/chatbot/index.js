@@ -32,7 +32,6 @@ import {
     Archive,
     Info
 } from 'lucide-react'
-import axios from 'axios'
 import toast from 'react-hot-toast'
 import { apiMethods } from '../../services/api'
 import { v4 as uuidv4 } from 'uuid';
@@ -306,7 +305,7 @@ export default function ChatbotPage() {
         setShowTypingIndicator(true)
 
         try {
-            const response = await axios.post('/api/ai-chat', {
+            const response = await apiMethods.aiChat.sendMessage({
                 message: userMessage,
                 session_id: sessionId,
                 search_type: searchType